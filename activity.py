@@ -0,0 +1,163 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+DAY = 86400
+PERIOD_DAY = "day"
+PERIOD_WEEK = "week"
+PERIOD_ALL = "all"
+
+
+class TopK:
+    """Топ-K по счетчикам, которые только растут: обновление без сортировки"""
+
+    __slots__ = ("k", "items", "_floor")
+
+    def __init__(self, k: int, counts: dict = None):
+        self.k = k
+        self.items = dict(heapq.nlargest(k, counts.items(), key=lambda item: item[1])) if counts else {}
+        self._floor = None
+
+    def update(self, user_id: int, count: int):
+        items = self.items
+        if user_id in items:
+            items[user_id] = count
+            self._floor = None
+            return
+        if len(items) < self.k:
+            items[user_id] = count
+            self._floor = None
+            return
+        if self._floor is None:
+            self._floor = min(items, key=items.get)
+        if count > items[self._floor]:
+            del items[self._floor]
+            items[user_id] = count
+            self._floor = None
+
+    def ranking(self):
+        return sorted(self.items.items(), key=lambda item: -item[1])
+
+
+class ChatActivity:
+    __slots__ = ("total", "top", "days", "day_tops")
+
+    def __init__(self, k: int, counts: dict):
+        self.total = counts                # user_id -> сообщений за все время
+        self.top = TopK(k, counts)
+        self.days = OrderedDict()          # номер дня -> {user_id: сообщений}
+        self.day_tops = {}                 # номер дня -> TopK
+
+
+class ActivityTracker:
+    """Счетчики активности по чатам в памяти с топами за день/неделю/все время.
+
+    Счетчики за все время при первом обращении к чату поднимаются из БД
+    (loader), дальше обновляются только в памяти. Дни хранятся отдельными
+    корзинами, неделя собирается из последних семи.
+    """
+
+    def __init__(self, loader, k: int = 10, max_chats: int = 5000, keep_days: int = 7):
+        self.loader = loader
+        self.k = k
+        self.max_chats = max_chats
+        self.keep_days = keep_days
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _chat(self, chat_id: int) -> ChatActivity:
+        """Вызывается без замка: loader ходит в БД и не должен держать остальные чаты"""
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                self._chats.move_to_end(chat_id)
+                return chat
+        loaded = ChatActivity(self.k, dict(self.loader(chat_id)))
+        with self._lock:
+            # Пока шла загрузка, чат мог поднять другой поток
+            chat = self._chats.setdefault(chat_id, loaded)
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+            return chat
+
+    def record(self, chat_id: int, user_id: int, now: float = None):
+        day = int((now or time.time()) // DAY)
+        chat = self._chat(chat_id)
+        with self._lock:
+            count = chat.total.get(user_id, 0) + 1
+            chat.total[user_id] = count
+            chat.top.update(user_id, count)
+
+            bucket = chat.days.get(day)
+            if bucket is None:
+                bucket = chat.days[day] = {}
+                chat.day_tops[day] = TopK(self.k)
+                while len(chat.days) > self.keep_days:
+                    old, _ = chat.days.popitem(last=False)
+                    del chat.day_tops[old]
+            count = bucket.get(user_id, 0) + 1
+            bucket[user_id] = count
+            chat.day_tops[day].update(user_id, count)
+
+    def dump(self) -> list:
+        """[(chat_id, день, user_id, сообщений)]; день -1 - счетчик за все время"""
+        with self._lock:
+            entries = []
+            for chat_id, chat in self._chats.items():
+                entries.extend((chat_id, -1, user_id, count) for user_id, count in chat.total.items())
+                for day, bucket in chat.days.items():
+                    entries.extend((chat_id, day, user_id, count) for user_id, count in bucket.items())
+            return entries
+
+    def load(self, entries):
+        """Поднять чаты из dump() без обращений к loader"""
+        totals, days = {}, {}
+        for chat_id, day, user_id, count in entries:
+            if day < 0:
+                totals.setdefault(chat_id, {})[user_id] = count
+            else:
+                days.setdefault(chat_id, {}).setdefault(day, {})[user_id] = count
+        with self._lock:
+            for chat_id, counts in totals.items():
+                chat = ChatActivity(self.k, counts)
+                for day in sorted(days.get(chat_id, ()))[-self.keep_days:]:
+                    bucket = chat.days[day] = days[chat_id][day]
+                    chat.day_tops[day] = TopK(self.k, bucket)
+                self._chats[chat_id] = chat
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+
+    def top(self, chat_id: int, period: str = PERIOD_ALL, now: float = None):
+        """[(user_id, сообщений), ...] по убыванию"""
+        day = int((now or time.time()) // DAY)
+        chat = self._chat(chat_id)
+        with self._lock:
+            if period == PERIOD_ALL:
+                return chat.top.ranking()
+            if period == PERIOD_DAY:
+                top = chat.day_tops.get(day)
+                return top.ranking() if top else []
+            week = {}
+            for bucket_day, bucket in chat.days.items():
+                if day - bucket_day < 7:
+                    for user_id, count in bucket.items():
+                        week[user_id] = week.get(user_id, 0) + count
+            return heapq.nlargest(self.k, week.items(), key=lambda item: item[1])
+
+    def summary(self, chat_id: int, user_id: int = None, now: float = None) -> dict:
+        day = int((now or time.time()) // DAY)
+        chat = self._chat(chat_id)
+        with self._lock:
+            today = chat.days.get(day, {})
+            week = [bucket for bucket_day, bucket in chat.days.items() if day - bucket_day < 7]
+            return {
+                "total": sum(chat.total.values()),
+                "members": len(chat.total),
+                "today": sum(today.values()),
+                "active_today": len(today),
+                "week": sum(sum(bucket.values()) for bucket in week),
+                "user_total": chat.total.get(user_id, 0),
+                "user_today": today.get(user_id, 0),
+            }
@@ -0,0 +1,246 @@
+import asyncio
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import aiohttp
+from vk_api.exceptions import ApiError
+
+from dispatcher import parse_event
+from metrics import LOOP_LAG
+
+API_URL = "https://api.vk.com/method/"
+API_VERSION = "5.131"
+
+
+class AsyncVkClient:
+    """Вызовы VK API через общий пул соединений aiohttp"""
+
+    def __init__(self, token: str, session: aiohttp.ClientSession, api_version: str = API_VERSION):
+        self.token = token
+        self.session = session
+        self.api_version = api_version
+
+    async def call(self, method: str, values: dict = None, raw: bool = False):
+        values = dict(values or {})
+        values.setdefault("v", self.api_version)
+        values["access_token"] = self.token
+        async with self.session.post(API_URL + method, data=values) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        if "error" in data:
+            raise ApiError(self, method, values, raw, data["error"])
+        return data if raw else data["response"]
+
+
+class SyncAdapter:
+    """Синхронный фасад над AsyncVkClient для кода в потоках (Sender, обработчики).
+
+    Повторяет интерфейс VkApi.method, поэтому его можно отдать Sender и
+    VkApiMethod вместо vk_api.VkApi.
+    """
+
+    def __init__(self, client: AsyncVkClient, loop: asyncio.AbstractEventLoop, timeout: float = 60):
+        self.client = client
+        self.loop = loop
+        self.timeout = timeout
+
+    def method(self, method: str, values: dict = None, raw: bool = False):
+        future = asyncio.run_coroutine_threadsafe(self.client.call(method, values, raw), self.loop)
+        return future.result(self.timeout)
+
+
+class AsyncLongPoll:
+    """Bots Long Poll на aiohttp. ts хранится между переподключениями"""
+
+    def __init__(self, client: AsyncVkClient, group_id: int, wait: int = 25, ts=None):
+        self.client = client
+        self.group_id = group_id
+        self.wait = wait
+        self.server = None
+        self.key = None
+        self.ts = ts
+
+    async def update_server(self, update_ts: bool = True):
+        response = await self.client.call("groups.getLongPollServer", {"group_id": self.group_id})
+        self.server = response["server"]
+        self.key = response["key"]
+        if update_ts or self.ts is None:
+            self.ts = response["ts"]
+
+    async def check(self):
+        """Сырые события одного запроса; ts сдвигается только после успеха"""
+        if self.server is None:
+            await self.update_server(update_ts=False)
+        params = {"act": "a_check", "key": self.key, "ts": self.ts, "wait": self.wait}
+        timeout = aiohttp.ClientTimeout(total=self.wait + 10)
+        async with self.client.session.get(self.server, params=params, timeout=timeout) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+
+        failed = data.get("failed")
+        if failed is None:
+            self.ts = data["ts"]
+            return data.get("updates", [])
+        if failed == 1:
+            # История частично устарела: продолжаем с нового ts
+            self.ts = data["ts"]
+        elif failed == 2:
+            await self.update_server(update_ts=False)
+        else:
+            await self.update_server(update_ts=True)
+        return []
+
+
+class AsyncRuntime:
+    """Асинхронный режим бота.
+
+    Long poll и вызовы API идут через aiohttp. Обработчики бота остаются
+    синхронными и запускаются как корутины, отдавая блокирующую работу
+    (SQLite, vk_api) в пул потоков. События одного чата выполняются
+    последовательно, разных чатов - параллельно.
+    """
+
+    def __init__(self, bot, token: str, group_id: int, workers: int = 16,
+                 max_pending: int = 1000, max_backoff: float = 60.0):
+        self.bot = bot
+        self.token = token
+        self.group_id = group_id
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.longpoll = None
+        self._tails = {}  # ключ чата -> последняя задача этого чата
+        self._batches = deque()  # [необработанных событий, ts после пачки] по порядку
+        self._loop = None
+        self._resume = None  # сброшен, пока снимается снимок: новые пачки ждут
+        self._idle = None    # установлен, пока пачка не раздается
+
+    async def _handle(self, previous, key, event, slots, executor, batch):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await asyncio.get_running_loop().run_in_executor(executor, self.bot.handle_event, event)
+        except Exception as e:
+            print(f"⚠️  Ошибка обработки события: {e}")
+        finally:
+            if self._tails.get(key) is asyncio.current_task():
+                del self._tails[key]
+            # До завершения задачи: дождавшийся ее снимок видит сдвинутый ts
+            self._event_done(batch)
+            slots.release()
+
+    async def _dispatch(self, raw, slots, executor, batch):
+        event = parse_event(raw)
+        key = self.bot.event_key(event)
+        # Backpressure: не читаем long poll дальше, пока очередь полна
+        await slots.acquire()
+        previous = self._tails.get(key)
+        batch[0] += 1
+        self._tails[key] = asyncio.create_task(self._handle(previous, key, event, slots, executor, batch))
+
+    def _event_done(self, batch):
+        batch[0] -= 1
+        self._commit_ts()
+
+    def _commit_ts(self):
+        """ts для снимка сдвигается, только когда обработаны все события до него"""
+        while self._batches and self._batches[0][0] == 0:
+            self.bot.longpoll_ts = self._batches.popleft()[1]
+
+    @contextmanager
+    def quiesced(self, timeout: float = 5.0):
+        """OrbitBot.quiesced для асинхронного режима; вызывается из потока снимков"""
+        pause = asyncio.run_coroutine_threadsafe(self._pause(timeout), self._loop)
+        try:
+            yield pause.result()
+        finally:
+            self._loop.call_soon_threadsafe(self._resume.set)
+
+    async def _pause(self, timeout: float) -> bool:
+        """Остановить чтение после текущей пачки и дождаться обработки ее событий"""
+        self._resume.clear()
+        await self._idle.wait()
+        if not self._tails:
+            return True
+        _, pending = await asyncio.wait(list(self._tails.values()), timeout=timeout)
+        return not pending
+
+    async def _measure_lag(self, interval: float = 0.5):
+        """Задержка цикла событий: насколько позже срабатывает sleep(interval)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            LOOP_LAG.set(max(0.0, loop.time() - started - interval))
+
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        connector = aiohttp.TCPConnector(limit=100, keepalive_timeout=60)
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix="async-handler")
+        slots = asyncio.Semaphore(self.max_pending)
+        self._loop = loop
+        self._resume = asyncio.Event()
+        self._resume.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Диспетчер бота здесь не используется: снимок ждет конвейер asyncio
+        self.bot.quiesced = self.quiesced
+
+        async with aiohttp.ClientSession(connector=connector) as session:
+            client = AsyncVkClient(self.token, session)
+            self.bot.use_api(SyncAdapter(client, loop))
+            # После теплого старта догоняем события, пришедшие после снимка
+            self.longpoll = AsyncLongPoll(client, self.group_id, ts=self.bot.longpoll_ts)
+            if self.bot.longpoll_ts:
+                print(f"✅ Продолжаем long poll с ts={self.bot.longpoll_ts}")
+            self.bot.start_services(dispatcher=False)
+            lag_probe = asyncio.create_task(self._measure_lag())
+
+            backoff = 1.0
+            try:
+                while True:
+                    try:
+                        updates = await self.longpoll.check()
+                    except ApiError as e:
+                        if e.code == 5:
+                            print("❌ НЕВЕРНЫЙ ТОКЕН! Проверьте BOT_TOKEN в Render")
+                            raise
+                        delay = random.uniform(0, backoff)
+                        print(f"⚠️  Ошибка VK API: {e}, повтор через {delay:.1f} с")
+                        await asyncio.sleep(delay)
+                        backoff = min(self.max_backoff, backoff * 2)
+                        continue
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        # Full jitter; ts не трогаем, чтобы не потерять события
+                        delay = random.uniform(0, backoff)
+                        print(f"⚠️  Long poll недоступен ({type(e).__name__}: {e}), повтор через {delay:.1f} с")
+                        await asyncio.sleep(delay)
+                        backoff = min(self.max_backoff, backoff * 2)
+                        continue
+
+                    backoff = 1.0
+                    await self._resume.wait()
+                    self._idle.clear()
+                    try:
+                        # Пачка не считается обработанной, пока она раздается
+                        batch = [1, self.longpoll.ts]
+                        self._batches.append(batch)
+                        for raw in updates:
+                            await self._dispatch(raw, slots, executor, batch)
+                        self._event_done(batch)
+                    finally:
+                        self._idle.set()
+            finally:
+                lag_probe.cancel()
+                if self._tails:
+                    await asyncio.wait(list(self._tails.values()), timeout=10)
+                # Sender ходит в API через этот цикл, останавливаем его в потоке
+                await loop.run_in_executor(None, self.bot.stop_services)
+                executor.shutdown(wait=False)
+
+    def run(self):
+        print("🚀 Бот запущен в асинхронном режиме! Ожидание сообщений...")
+        print("Для остановки: Ctrl+C")
+        asyncio.run(self.main())
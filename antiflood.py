@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+FLOOD_WARN = "warn"
+FLOOD_MUTE = "mute"
+# Лимит уже превышен и нарушение в этом окне засчитано: сообщение глушится без наказания
+FLOOD_SUPPRESS = "suppress"
+
+
+class FloodControl:
+    """Антифлуд: token bucket на каждую пару (chat_id, user_id).
+
+    Состояние хранится только в памяти, проверка - O(1). Записи лежат в
+    порядке последней активности, поэтому простаивающие пользователи
+    вытесняются с начала словаря.
+    """
+
+    def __init__(self, max_entries: int = 200000, idle_ttl: float = 900.0):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        # (chat_id, user_id) -> [tokens, last_seen, strikes, last_strike]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.violations = 0
+        self.evicted = 0
+
+    def check(self, chat_id: int, user_id: int, limit: int, window: float,
+              max_warns: int, now: float = None):
+        """Учесть сообщение. None - все в порядке, иначе (действие, номер нарушения)"""
+        if now is None:
+            now = time.monotonic()
+        key = (chat_id, user_id)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._buckets[key] = [limit - 1.0, now, 0, float("-inf")]
+                self._created += 1
+                if len(self._buckets) > self.max_entries or not self._created & 1023:
+                    self._evict(now)
+                return None
+            self._buckets.move_to_end(key)
+
+            tokens = bucket[0] + (now - bucket[1]) * limit / window
+            bucket[1] = now
+            if tokens > limit:
+                tokens = limit
+            if tokens >= 1.0:
+                bucket[0] = tokens - 1.0
+                return None
+            bucket[0] = tokens
+
+            # Превышение: одно нарушение на окно, чтобы не наказывать дважды
+            if now - bucket[3] < window:
+                return FLOOD_SUPPRESS, bucket[2]
+            bucket[3] = now
+            bucket[2] += 1
+            self.violations += 1
+            if bucket[2] >= max_warns:
+                bucket[2] = 0
+                return FLOOD_MUTE, max_warns
+            return FLOOD_WARN, bucket[2]
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while len(buckets) > self.max_entries:
+            buckets.popitem(last=False)
+            self.evicted += 1
+        edge = now - self.idle_ttl
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if bucket[1] > edge:
+                break
+            del buckets[key]
+            self.evicted += 1
+
+    def dump(self) -> list:
+        """[(chat_id, user_id, tokens, last_seen, strikes, last_strike)] со временем в unix time"""
+        offset = time.time() - time.monotonic()
+        with self._lock:
+            return [
+                (chat_id, user_id, tokens, last_seen + offset, strikes, last_strike + offset)
+                for (chat_id, user_id), (tokens, last_seen, strikes, last_strike) in self._buckets.items()
+            ]
+
+    def load(self, entries):
+        """Восстановить окна из dump(); простаивавшие дольше idle_ttl пропускаются"""
+        now = time.monotonic()
+        offset = time.time() - now
+        edge = now - self.idle_ttl
+        with self._lock:
+            for chat_id, user_id, tokens, last_seen, strikes, last_strike in entries:
+                last_seen -= offset
+                if last_seen > edge:
+                    self._buckets[(chat_id, user_id)] = [tokens, last_seen, strikes, last_strike - offset]
+
+    def reset(self, chat_id: int, user_id: int):
+        with self._lock:
+            self._buckets.pop((chat_id, user_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tracked": len(self._buckets),
+                "violations": self.violations,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+
+DAY = 86400
+
+
+class AuditLog:
+    """Структурированный журнал модерации поверх таблицы logs.
+
+    emit() только кладет строку в буфер записи (WriteBuffer) и не ходит
+    в БД; вставка идет пачками в потоке буфера. Фоновое обслуживание
+    сворачивает старые записи в дневную сводку и удаляет их.
+    """
+
+    def __init__(self, store, retention_days: int = 90, maintenance_interval: float = 6 * 3600):
+        self.store = store
+        self.retention_days = retention_days
+        self.maintenance_interval = maintenance_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.emitted = 0
+
+    def emit(self, chat_id: int, actor_id: int, action: str, target_id: int = None, **details):
+        """Записать событие. details сохраняются в reason как JSON"""
+        reason = json.dumps(details, ensure_ascii=False, separators=(",", ":")) if details else None
+        self.store.log_action(chat_id, actor_id, action, target_id, reason)
+        self.emitted += 1
+
+    def history(self, chat_id: int, target_id: int = None, before_id: int = None, limit: int = 10):
+        """Страница истории (новые сверху); следующая страница - before_id последней записи"""
+        rows = self.store.log_history(chat_id, target_id, before_id, limit)
+        return [
+            {
+                "id": row["id"],
+                "actor_id": row["user_id"],
+                "action": row["action"],
+                "target_id": row["target_id"],
+                "details": self._details(row["reason"]),
+                "timestamp": row["timestamp"],
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def _details(reason):
+        if not reason:
+            return {}
+        try:
+            details = json.loads(reason)
+        except ValueError:
+            # Старые записи хранили reason строкой
+            return {"reason": reason}
+        return details if isinstance(details, dict) else {"reason": reason}
+
+    # ========== ОБСЛУЖИВАНИЕ ==========
+    def compact(self) -> int:
+        """Свернуть и удалить записи старше retention_days, вернуть число удаленных"""
+        return self.store.compact_logs(time.time() - self.retention_days * DAY)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="audit-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.maintenance_interval):
+            try:
+                removed = self.compact()
+                if removed:
+                    print(f"🧹 Журнал: свернуто и удалено {removed} старых записей")
+            except Exception as e:
+                print(f"⚠️  Ошибка обслуживания журнала: {e}")
@@ -0,0 +1,42 @@
+"""Бенчмарк антифлуда: python benchmarks/bench_antiflood.py [сообщений] [чатов] [пользователей]"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from antiflood import FloodControl
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    chats = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    users = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    rng = random.Random(42)
+    events = [(rng.randrange(chats), rng.randrange(users)) for _ in range(100_000)]
+    flood = FloodControl(max_entries=50_000)
+    check = flood.check
+
+    # Синтетическое время: 20 000 сообщений в секунду
+    step = 1 / 20_000
+    now = 0.0
+    started = time.perf_counter()
+    for i in range(total):
+        chat_id, user_id = events[i % len(events)]
+        now += step
+        check(chat_id, user_id, 5, 5, 3, now)
+    elapsed = time.perf_counter() - started
+
+    stats = flood.stats()
+    print(f"сообщений:        {total}")
+    print(f"время:            {elapsed:.2f} с")
+    print(f"сообщений/сек:    {total / elapsed:,.0f}")
+    print(f"нс на проверку:   {elapsed / total * 1e9:.0f}")
+    print(f"отслеживается:    {stats['tracked']} (вытеснено {stats['evicted']})")
+    print(f"нарушений:        {stats['violations']}")
+
+
+if __name__ == "__main__":
+    main()
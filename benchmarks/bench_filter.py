@@ -0,0 +1,67 @@
+"""Микробенчмарк фильтра контента: python benchmarks/bench_filter.py [сообщений]"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_filter import DEFAULT_BAD_WORDS, LINK_PATTERN, get_filter
+
+CLEAN = (
+    "привет всем, как дела?", "кто идет сегодня вечером на встречу", "ок",
+    "скиньте домашку по алгебре пожалуйста", "ахахах это лучшее что я видел",
+    "завтра пары отменили, расписание обновят позже", "всем спасибо, до завтра!",
+    "Кто-нибудь знает, во сколько начинается трансляция?", "+", "да",
+)
+DIRTY = ("ну ты и сука", "бляяя опять", "XУЙНЯ какая-то", "заходи на example.ru",
+         "смотри https://vk.com/wall-1_2", "пиздец просто", "ВСЕ СЮДА БЫСТРО СМОТРИТЕ",
+         "ааааааааааааааа")
+
+
+def make_corpus(size: int, dirty_share: float = 0.05):
+    rng = random.Random(1)
+    corpus = []
+    for _ in range(size):
+        if rng.random() < dirty_share:
+            corpus.append(rng.choice(DIRTY))
+        else:
+            words = rng.choice(CLEAN).split()
+            rng.shuffle(words)
+            corpus.append(" ".join(words * rng.randint(1, 4)))
+    return corpus
+
+
+def naive_scan(text, link_re=re.compile(LINK_PATTERN, re.IGNORECASE)):
+    """Наивный вариант: цикл по словарю для каждого слова сообщения"""
+    for word in text.lower().split():
+        for bad in DEFAULT_BAD_WORDS:
+            if word.startswith(bad):
+                return True
+    return link_re.search(text) is not None
+
+
+def bench(name, scan, corpus):
+    started = time.perf_counter()
+    hits = sum(1 for text in corpus if scan(text))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<22} {len(corpus) / elapsed:>12,.0f} сообщ/с  "
+          f"{elapsed / len(corpus) * 1e6:6.2f} мкс/сообщ  нарушений: {hits}")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    corpus = make_corpus(size)
+
+    started = time.perf_counter()
+    content_filter = get_filter(True, True)
+    print(f"компиляция фильтра: {(time.perf_counter() - started) * 1000:.2f} мс")
+
+    bench("скомпилированный", content_filter.scan, corpus)
+    bench("+ антикапс", get_filter(True, True, anticaps=True).scan, corpus)
+    bench("наивный цикл", naive_scan, corpus)
+
+
+if __name__ == "__main__":
+    main()
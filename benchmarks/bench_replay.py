@@ -0,0 +1,292 @@
+"""Бенчмарк обработки событий: реплей long poll через диспетчер с фейковым VK API.
+
+    python benchmarks/bench_replay.py [сценарий ...] [--events N] [--vk-latency МС]
+    python benchmarks/bench_replay.py --replay events.jsonl
+    python benchmarks/bench_replay.py --record help_spam events.jsonl
+    python benchmarks/bench_replay.py --save-baseline
+    python benchmarks/bench_replay.py --baseline benchmarks/replay_baseline.json
+
+Сценарии: help_spam, moderation_burst, many_chats. Файл реплея - JSONL с сырыми
+событиями long poll (как в updates ответа a_check). Бот работает на временной
+БД, VK API отвечает из памяти; сеть не используется.
+
+Сравнение с базой: если сообщений/сек стало меньше или p99 больше, чем
+допускает --tolerance, скрипт завершается с кодом 1.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "replay_baseline.json")
+ADMIN_ID = 100
+PEER_OFFSET = 2000000000
+CALL_RE = re.compile(r"API\.([\w.]+)\(")
+
+
+class FakeVk:
+    """VK API в памяти: отвечает как API и считает вызовы"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def method(self, method, values=None, raw=False):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "execute":
+            # Вызовы внутри execute: API.method({...}), параметры - JSON
+            code = values["code"]
+            decoder = json.JSONDecoder()
+            response = {"response": [
+                self.answer(match.group(1), decoder.raw_decode(code, match.end())[0])
+                for match in CALL_RE.finditer(code)
+            ]}
+        else:
+            response = {"response": self.answer(method, values or {})}
+        return response if raw else response["response"]
+
+    @staticmethod
+    def answer(method, values):
+        if method == "users.get":
+            users = []
+            for key in str(values.get("user_ids", "")).split(","):
+                if key.isdigit():
+                    users.append({"id": int(key), "first_name": "Участник", "last_name": key,
+                                  "screen_name": f"id{key}"})
+                elif key:
+                    users.append({"id": 10 ** 9 + sum(map(ord, key)), "first_name": "Участник",
+                                  "last_name": key, "screen_name": key})
+            return users
+        return 1
+
+
+# ========== СЦЕНАРИИ ==========
+def message(chat_id, user_id, text, cmid):
+    return {
+        "type": "message_new",
+        "group_id": 1,
+        "object": {
+            "message": {
+                "from_id": user_id,
+                "peer_id": PEER_OFFSET + chat_id,
+                "text": text,
+                "conversation_message_id": cmid,
+                "date": int(time.time()),
+            },
+            "client_info": {},
+        },
+    }
+
+
+def join(chat_id, user_id, cmid):
+    event = message(chat_id, user_id, "", cmid)
+    event["object"]["message"]["action"] = {"type": "chat_invite_user", "member_id": user_id}
+    return event
+
+
+def help_spam(total, rng):
+    """Много пользователей в нескольких чатах вызывают !помощь"""
+    return [message(1 + i % 20, 1000 + rng.randrange(5000), "!помощь", i) for i in range(total)]
+
+
+def moderation_burst(total, rng):
+    """Админы выдают варны и муты, вперемешку с обычными сообщениями и матом"""
+    events = []
+    for i in range(total):
+        chat_id = 100 + i % 10
+        target = 1000 + rng.randrange(300)
+        roll = rng.random()
+        if roll < 0.3:
+            events.append(message(chat_id, ADMIN_ID, f"!варн {target}", i))
+        elif roll < 0.5:
+            events.append(message(chat_id, ADMIN_ID, f"!мут {target} 10м", i))
+        elif roll < 0.6:
+            events.append(message(chat_id, target, "ну это хуйня какая-то", i))
+        else:
+            events.append(message(chat_id, target, "обычное сообщение в чате", i))
+    return events
+
+
+def many_chats(total, rng):
+    """Тысячи чатов, редкие сообщения в каждом и вступления в чаты"""
+    events = []
+    for i in range(total):
+        chat_id = 1000 + rng.randrange(2000)
+        if rng.random() < 0.05:
+            events.append(join(chat_id, 1000 + rng.randrange(100000), i))
+        elif rng.random() < 0.1:
+            events.append(message(chat_id, 1000 + rng.randrange(100000), "!топ", i))
+        else:
+            events.append(message(chat_id, 1000 + rng.randrange(100000), "привет всем", i))
+    return events
+
+
+SCENARIOS = {
+    "help_spam": help_spam,
+    "moderation_burst": moderation_burst,
+    "many_chats": many_chats,
+}
+
+
+# ========== ЗАПУСК ==========
+def load_bot(workdir):
+    """Импорт main с временной БД и без внешних сервисов"""
+    os.chdir(workdir)
+    os.environ.update(
+        BOT_TOKEN=os.environ.get("BOT_TOKEN") or "benchmark",
+        GROUP_ID=os.environ.get("GROUP_ID") or "1",
+        DEV_IDS="1",
+        PORT="0",
+        LOG_SAMPLE="0",
+        VK_RPS="1000000",
+    )
+    import main
+    return main
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(main, name, raw_events, fake):
+    from dispatcher import parse_event
+    from metrics import DB_SECONDS
+
+    bot = main.OrbitBot(connect_longpoll=False)
+    bot.use_api(fake)
+    for chat_id in {e["object"].get("message", e["object"])["peer_id"] - PEER_OFFSET for e in raw_events}:
+        main.store.set_user_level(ADMIN_ID, chat_id, 7)
+
+    latencies = []
+    handle = bot.handle_event
+
+    def timed(event):
+        started = time.perf_counter()
+        handle(event)
+        latencies.append(time.perf_counter() - started)
+
+    bot.dispatcher.handler = timed
+    events = [parse_event(raw) for raw in raw_events]
+    db_before = DB_SECONDS.count("read") + DB_SECONDS.count("write")
+    flushed_before = main.store.writes.flushed_rows
+    calls_before = fake.calls
+
+    bot.start_services()
+    started = time.perf_counter()
+    for event in events:
+        bot.dispatcher.submit(bot.event_key(event), event)
+    while bot.dispatcher.status()["processed"] < len(events):
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    bot.dispatcher.stop()
+    bot.sanctions.stop()
+    bot.audit.stop()
+    bot.sender.stop()
+    main.store.writes.flush()
+
+    db_ops = DB_SECONDS.count("read") + DB_SECONDS.count("write") - db_before
+    # Буферизованные строки пишутся пачкой, но считаем каждую как операцию
+    db_ops += main.store.writes.flushed_rows - flushed_before
+    return {
+        "events": len(events),
+        "msgs_per_sec": len(events) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "db_ops_per_msg": db_ops / len(events),
+        "vk_calls": fake.calls - calls_before,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Печать отклонений от базы; True - если есть регрессия"""
+    regressed = False
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name}: нет в базе")
+            continue
+        speed = result["msgs_per_sec"] / base["msgs_per_sec"] - 1
+        p99 = result["p99_ms"] / base["p99_ms"] - 1 if base["p99_ms"] else 0.0
+        db_ops = result["db_ops_per_msg"] - base["db_ops_per_msg"]
+        flag = ""
+        if speed < -tolerance or p99 > tolerance:
+            flag = "  ⚠️ регрессия"
+            regressed = True
+        print(f"{name}: сообщений/сек {speed:+.1%}, p99 {p99:+.1%}, операций БД {db_ops:+.2f}/сообщ{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Реплей событий long poll через диспетчер бота")
+    parser.add_argument("scenarios", nargs="*", help="сценарии: " + ", ".join(SCENARIOS))
+    parser.add_argument("--events", type=int, default=5000, help="событий в сценарии")
+    parser.add_argument("--vk-latency", type=float, default=0.0, help="задержка фейкового VK API, мс")
+    parser.add_argument("--replay", help="JSONL с сырыми событиями long poll")
+    parser.add_argument("--record", nargs=2, metavar=("СЦЕНАРИЙ", "ФАЙЛ"), help="записать сценарий в JSONL")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="файл базы для сравнения")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результаты как базу")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение (0.2 = 20%%)")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+
+    rng = random.Random(42)
+    if args.record:
+        name, path = args.record
+        with open(path, "w", encoding="utf-8") as f:
+            for raw in SCENARIOS[name](args.events, rng):
+                f.write(json.dumps(raw, ensure_ascii=False) + "\n")
+        print(f"✅ Записано {args.events} событий в {path}")
+        return 0
+
+    if args.replay:
+        with open(args.replay, encoding="utf-8") as f:
+            workloads = {os.path.basename(args.replay): [json.loads(line) for line in f if line.strip()]}
+    else:
+        names = args.scenarios or list(SCENARIOS)
+        workloads = {name: SCENARIOS[name](args.events, rng) for name in names}
+
+    baseline_path = os.path.abspath(args.baseline)
+    with tempfile.TemporaryDirectory() as workdir:
+        main_module = load_bot(workdir)
+        fake = FakeVk(args.vk_latency / 1000)
+        results = {}
+        for name, raw_events in workloads.items():
+            result = results[name] = run_scenario(main_module, name, raw_events, fake)
+            print(
+                f"{name:18} {result['msgs_per_sec']:10,.0f} сообщ/с   "
+                f"p50 {result['p50_ms']:6.2f} мс   p99 {result['p99_ms']:6.2f} мс   "
+                f"БД {result['db_ops_per_msg']:5.2f} оп/сообщ   VK {result['vk_calls']} вызовов"
+            )
+        main_module.store.close()
+
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ База сохранена: {baseline_path}")
+        return 0
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from router import parse_duration, parse_user
+
+# Не больше стольких целей за одну массовую команду
+MASS_LIMIT = 200
+RECENT_WORDS = ("новые", "new")
+
+
+class RecentJoins:
+    """Недавно вступившие в чат: кольцевой буфер (время, user_id) на чат"""
+
+    def __init__(self, keep: float = 3600, max_per_chat: int = 1000, max_chats: int = 5000):
+        self.keep = keep
+        self.max_per_chat = max_per_chat
+        self.max_chats = max_chats
+        self._chats = OrderedDict()  # chat_id -> deque[(время, user_id)]
+        self._lock = threading.Lock()
+
+    def record(self, chat_id: int, user_id: int, now: float = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            joins = self._chats.get(chat_id)
+            if joins is None:
+                joins = self._chats[chat_id] = deque(maxlen=self.max_per_chat)
+                if len(self._chats) > self.max_chats:
+                    self._chats.popitem(last=False)
+            else:
+                self._chats.move_to_end(chat_id)
+            joins.append((now, user_id))
+            while joins and joins[0][0] < now - self.keep:
+                joins.popleft()
+
+    def since(self, chat_id: int, seconds: float, now: float = None) -> list:
+        """Вступившие за последние seconds секунд, без повторов, по порядку"""
+        now = time.time() if now is None else now
+        with self._lock:
+            joins = list(self._chats.get(chat_id, ()))
+        threshold = now - seconds
+        return list(dict.fromkeys(user_id for joined, user_id in joins if joined >= threshold))
+
+
+def parse_targets(tokens, joins: RecentJoins, chat_id: int, resolve_many=None) -> list:
+    """Цели массовой команды: список ID/упоминаний или "новые 10м".
+
+    resolve_many(tokens) -> [user_id] переводит упоминания в ID (по умолчанию
+    parse_user). ValueError с текстом для пользователя, если разобрать не удалось.
+    """
+    if not tokens:
+        raise ValueError("Укажите пользователей или: новые 10м")
+    if tokens[0].lower() in RECENT_WORDS:
+        seconds = parse_duration(tokens[1]) if len(tokens) > 1 else None
+        if not seconds or seconds > joins.keep:
+            raise ValueError(f"Укажите период до {int(joins.keep // 60)} мин. Пример: новые 10м")
+        targets = joins.since(chat_id, seconds)
+    else:
+        try:
+            if resolve_many is None:
+                targets = [parse_user(token) for token in tokens]
+            else:
+                targets = resolve_many(tokens)
+            targets = list(dict.fromkeys(targets))
+        except ValueError as e:
+            raise ValueError(f"Неверный ID: {e}")
+    if len(targets) > MASS_LIMIT:
+        raise ValueError(f"Слишком много пользователей: {len(targets)} (максимум {MASS_LIMIT})")
+    return targets
+
+
+class BulkProgress:
+    """Счетчик завершения вызовов VK API массовой команды.
+
+    report(text) вызывается каждые step завершенных вызовов, on_done(ok, failed) -
+    когда завершены все. Колбэки выполняются в потоке Sender.
+    """
+
+    def __init__(self, total: int, report, on_done, step: int = 25):
+        self.total = total
+        self.report = report
+        self.on_done = on_done
+        self.step = step
+        self.ok = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        if total == 0:
+            on_done(0, 0)
+
+    def track(self, future):
+        future.add_done_callback(self._complete)
+
+    def _complete(self, future):
+        with self._lock:
+            if future.exception() is None:
+                self.ok += 1
+            else:
+                self.failed += 1
+            done = self.ok + self.failed
+            ok, failed = self.ok, self.failed
+        if done == self.total:
+            self.on_done(ok, failed)
+        elif done % self.step == 0:
+            self.report(f"⏳ Выполнено {done}/{self.total}")
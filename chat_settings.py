@@ -0,0 +1,128 @@
+import json
+import threading
+from collections import OrderedDict
+
+from config import DEFAULT_CHAT_SETTINGS
+from content_filter import get_filter
+
+TRUE_VALUES = {"1", "вкл", "да", "on", "true", "+"}
+FALSE_VALUES = {"0", "выкл", "нет", "off", "false", "-"}
+
+# Верхние границы числовых настроек
+MAX_VALUES = {
+    "flood_limit": 1000,
+    "flood_window": 3600,
+    "max_warns": 100,
+    "warn_expire_hours": 168,
+    "mute_duration": 30 * 86400,
+    "raid_joins": 1000,
+    "raid_window": 3600,
+}
+
+
+class ChatSettings:
+    """Настройки одного чата с примененными значениями по умолчанию.
+
+    Объект не меняется после создания: обновление собирает новый объект
+    и подменяет его в реестре целиком.
+    """
+
+    __slots__ = tuple(DEFAULT_CHAT_SETTINGS) + ("content_filter",)
+
+    def __init__(self, overrides: dict = None):
+        for key, default in DEFAULT_CHAT_SETTINGS.items():
+            value = overrides.get(key, default) if overrides else default
+            object.__setattr__(self, key, value)
+        object.__setattr__(self, "content_filter", get_filter(
+            self.antimat, self.antilinks, anticaps=self.anticaps, antimedia=self.antimedia
+        ))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ChatSettings нельзя менять, используйте SettingsRegistry.update")
+
+    def overrides(self) -> dict:
+        """Только отличия от значений по умолчанию - то, что хранится в БД"""
+        return {
+            key: getattr(self, key)
+            for key, default in DEFAULT_CHAT_SETTINGS.items()
+            if getattr(self, key) != default
+        }
+
+
+DEFAULTS = ChatSettings()
+
+
+def parse_value(key: str, text: str):
+    """Привести строковое значение к типу настройки. ValueError при ошибке"""
+    if key not in DEFAULT_CHAT_SETTINGS:
+        raise KeyError(key)
+    default = DEFAULT_CHAT_SETTINGS[key]
+    text = text.strip().lower()
+    if isinstance(default, bool):
+        if text in TRUE_VALUES:
+            return True
+        if text in FALSE_VALUES:
+            return False
+        raise ValueError(text)
+    value = int(text)
+    if not 1 <= value <= MAX_VALUES.get(key, value):
+        raise ValueError(text)
+    return value
+
+
+class SettingsRegistry:
+    """Кеш настроек чатов: JSON из chats.settings разбирается один раз на чат"""
+
+    def __init__(self, store, max_chats: int = 5000):
+        self.store = store
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chat_id: int) -> ChatSettings:
+        with self._lock:
+            settings = self._chats.get(chat_id)
+            if settings is not None:
+                self._chats.move_to_end(chat_id)
+                self.hits += 1
+                return settings
+            self.misses += 1
+
+        settings = self._load(chat_id)
+        with self._lock:
+            # Пока грузили, другой поток мог уже положить объект
+            settings = self._chats.setdefault(chat_id, settings)
+            self._chats.move_to_end(chat_id)
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+            return settings
+
+    def _load(self, chat_id: int) -> ChatSettings:
+        raw = self.store.load_chat_settings(chat_id)
+        if not raw or raw == "{}":
+            return DEFAULTS
+        try:
+            return ChatSettings(json.loads(raw))
+        except (ValueError, TypeError) as e:
+            print(f"⚠️  Битые настройки чата {chat_id}: {e}")
+            return DEFAULTS
+
+    def update(self, chat_id: int, **changes) -> ChatSettings:
+        """Сохранить изменения в БД и подменить объект в памяти"""
+        unknown = set(changes) - set(DEFAULT_CHAT_SETTINGS)
+        if unknown:
+            raise KeyError(", ".join(sorted(unknown)))
+        overrides = self.get(chat_id).overrides()
+        overrides.update(changes)
+        settings = ChatSettings(overrides)
+        self.store.save_chat_settings(chat_id, json.dumps(settings.overrides()))
+        with self._lock:
+            self._chats[chat_id] = settings
+            self._chats.move_to_end(chat_id)
+        return settings
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"chats": len(self._chats), "hits": self.hits, "misses": self.misses}
@@ -14,14 +14,21 @@ DEV_USER_IDS = list(map(int, os.getenv("DEV_IDS", "123456789,987654321").split('
 
 # Настройки БД
 DATABASE_FILE = "data/orbit.db"
+# Старая база main.py (таблица users): переносится миграцией при первом запуске
+LEGACY_DATABASE_FILE = "orbit.db"
 
 # Настройки по умолчанию для чатов
 DEFAULT_CHAT_SETTINGS = {
     "antimat": True,
     "antiflood": True,
+    "flood_limit": 5,
+    "flood_window": 5,
     "anticaps": False,
     "antilinks": True,
     "antimedia": False,
+    "antiraid": True,
+    "raid_joins": 10,
+    "raid_window": 60,
     "max_warns": 3,
     "warn_expire_hours": 24,
     "mute_duration": 300
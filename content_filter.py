@@ -0,0 +1,151 @@
+import re
+import threading
+
+FILTER_MAT = "mat"
+FILTER_LINK = "link"
+FILTER_CAPS = "caps"
+FILTER_RUN = "run"
+FILTER_MEDIA = "media"
+
+# Антикапс: проверяются сообщения от CAPS_MIN_LENGTH символов с долей
+# заглавных среди букв от CAPS_RATIO; растянутые буквы - от MAX_RUN подряд
+# (скобки и прочая пунктуация вроде "))))))))))" не считаются)
+CAPS_MIN_LENGTH = 10
+CAPS_MIN_LETTERS = 8
+CAPS_RATIO = 0.7
+MAX_RUN = 10
+UPPER_RE = re.compile(r"[A-ZА-ЯЁ]")
+
+# Типы вложений, которые запрещает antimedia
+MEDIA_TYPES = frozenset((
+    "photo", "video", "audio", "doc", "audio_message", "sticker", "graffiti", "video_message",
+))
+
+# Корни нецензурных слов; совпадение ищется с начала слова
+DEFAULT_BAD_WORDS = (
+    "хуй", "хуе", "хуё", "хуя", "хуи", "пизд", "пезд",
+    "ебат", "ебан", "ебал", "ебл", "ебу", "еби", "ебн", "ёб",
+    "заеб", "наеб", "уеб", "выеб", "отъеб", "въеб", "доеб", "поеб", "съеб", "долбоеб",
+    "бля", "сука", "суки", "сучк", "мудак", "мудил", "пидор", "пидар",
+    "гандон", "шлюх", "залуп",
+)
+
+# Латиница и цифры, похожие на кириллицу
+LOOKALIKES = {
+    "а": "aа@", "в": "вb", "е": "еeё", "ё": "ёеe", "з": "з3", "и": "иu",
+    "й": "йиu", "к": "кk", "м": "мm", "н": "нh", "о": "оo0", "р": "рp",
+    "с": "сc", "т": "тt", "у": "уy", "х": "хx", "б": "б6", "ъ": "ъь",
+}
+
+LINK_PATTERN = (
+    r"(?:https?://|www\.)\S+"
+    r"|\b(?:vk\.cc|t\.me|clck\.ru|bit\.ly)/\S*"
+    r"|\b[a-z0-9][a-z0-9-]*\.(?:ru|com|net|org|me|io|su|xyz|info|link|gg|cc|рф)\b"
+)
+
+
+def _char_class(char: str) -> str:
+    variants = LOOKALIKES.get(char, char)
+    if len(variants) == 1:
+        return re.escape(variants) + "+"
+    return "[" + "".join(re.escape(v) for v in variants) + "]+"
+
+
+def _trie_pattern(words) -> str:
+    """Собрать из слов регулярку-префиксное дерево: общие префиксы проверяются один раз"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        if "" in node and len(node) == 1:
+            return ""
+        branches = [
+            _char_class(char) + build(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Конец слова в этом узле: продолжение необязательно
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return build(trie)
+
+
+class FilterHit:
+    __slots__ = ("kind", "fragment")
+
+    def __init__(self, kind: str, fragment: str):
+        self.kind = kind
+        self.fragment = fragment
+
+    def __repr__(self):
+        return f"FilterHit({self.kind!r}, {self.fragment!r})"
+
+
+class ContentFilter:
+    """Фильтр сообщений за один проход по тексту.
+
+    Мат, ссылки и растянутые символы ищутся одной скомпилированной регуляркой
+    по тексту в нижнем регистре; заглавные считаются, только если lower()
+    что-то изменил. Отключенные в чате проверки в регулярку не попадают,
+    короткие сообщения на капс не проверяются.
+    """
+
+    def __init__(self, antimat: bool, antilinks: bool, words=DEFAULT_BAD_WORDS,
+                 anticaps: bool = False, antimedia: bool = False):
+        self.anticaps = anticaps
+        self.antimedia = antimedia
+        parts = []
+        if antimat and words:
+            parts.append(rf"(?P<{FILTER_MAT}>(?<!\w){_trie_pattern(words)})")
+        if antilinks:
+            parts.append(rf"(?P<{FILTER_LINK}>{LINK_PATTERN})")
+        if anticaps:
+            # Растянутые буквы - отдельное нарушение: "приииииииивет" не капс
+            parts.append(rf"(?P<{FILTER_RUN}>(?P<letter>[^\W\d_])(?P=letter){{{MAX_RUN - 1},}})")
+        # Без IGNORECASE регулярка заметно быстрее: текст приводится к нижнему регистру
+        self._search = re.compile("|".join(parts)).search if parts else None
+        self.enabled = bool(parts) or antimedia
+
+    def scan(self, text: str, attachments=()):
+        """Первое нарушение в сообщении или None"""
+        if self.antimedia and attachments:
+            for attachment in attachments:
+                if attachment.get("type") in MEDIA_TYPES:
+                    return FilterHit(FILTER_MEDIA, attachment["type"])
+        if self._search is None or not text:
+            return None
+
+        lowered = text.lower()
+        match = self._search(lowered)
+        if match is not None:
+            return FilterHit(match.lastgroup, match.group())
+
+        if self.anticaps and len(text) >= CAPS_MIN_LENGTH and text != lowered:
+            # Буквы считаем, только если заглавных достаточно для срабатывания
+            upper = len(UPPER_RE.findall(text))
+            if upper >= CAPS_MIN_LETTERS:
+                letters = sum(map(str.isalpha, text))
+                if upper >= letters * CAPS_RATIO:
+                    return FilterHit(FILTER_CAPS, text[:32])
+        return None
+
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def get_filter(antimat: bool, antilinks: bool, words=DEFAULT_BAD_WORDS,
+               anticaps: bool = False, antimedia: bool = False) -> ContentFilter:
+    """Общий скомпилированный фильтр для одинакового набора правил"""
+    key = (bool(antimat), bool(antilinks), tuple(words), bool(anticaps), bool(antimedia))
+    content_filter = _filters.get(key)
+    if content_filter is None:
+        with _filters_lock:
+            content_filter = _filters.get(key)
+            if content_filter is None:
+                content_filter = _filters[key] = ContentFilter(antimat, antilinks, words, anticaps, antimedia)
+    return content_filter
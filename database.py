@@ -1,8 +1,23 @@
-import sqlite3
+import calendar
 import json
 import threading
+import time
 from datetime import datetime
-from config import DATABASE_FILE
+from config import DATABASE_FILE, LEGACY_DATABASE_FILE, DEV_USER_IDS
+from perm_cache import PermissionCache
+from db_pool import ConnectionPool
+from write_buffer import WriteBuffer
+from profiles import Profile
+import migrations
+
+def to_timestamp(ts: float = None) -> str:
+    """unix time -> TIMESTAMP в UTC, как CURRENT_TIMESTAMP в SQLite"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+
+def from_timestamp(value: str) -> float:
+    return calendar.timegm(time.strptime(value[:19], '%Y-%m-%d %H:%M:%S'))
+
 
 class Database:
     _instance = None
@@ -16,107 +31,454 @@ class Database:
             return cls._instance
     
     def _init_db(self):
-        self.conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
-        self._create_tables()
-    
-    def _create_tables(self):
-        """Создание всех таблиц"""
-        # Чаты
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chats (
-                chat_id INTEGER PRIMARY KEY,
-                owner_id INTEGER,
-                settings TEXT DEFAULT '{}',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Права пользователей
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_perms (
-                user_id INTEGER,
-                chat_id INTEGER,
-                level INTEGER DEFAULT 2,
-                warns INTEGER DEFAULT 0,
-                reputation INTEGER DEFAULT 0,
-                muted_until TIMESTAMP,
-                banned_until TIMESTAMP,
-                last_message TIMESTAMP,
-                message_count INTEGER DEFAULT 0,
-                PRIMARY KEY (user_id, chat_id)
-            )
-        ''')
-        
-        # Логи действий
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER,
-                user_id INTEGER,
-                action TEXT,
-                target_id INTEGER,
-                reason TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Кастомные команды
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS custom_commands (
-                chat_id INTEGER,
-                command TEXT,
-                response TEXT,
-                created_by INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (chat_id, command)
-            )
-        ''')
-        
-        self.conn.commit()
+        self.pool = ConnectionPool(DATABASE_FILE)
+        self.perm_cache = PermissionCache()
+        # main.py подменяет список, если DEV_IDS введены при запуске
+        self.dev_ids = set(DEV_USER_IDS)
+        self.schema_version = migrations.migrate(self.pool, LEGACY_DATABASE_FILE)
+        # Частые записи (счетчики, логи) идут через буфер, права - напрямую
+        self.writes = WriteBuffer(self.pool)
     
     def get_user_level(self, user_id: int, chat_id: int) -> int:
         """Получить уровень прав пользователя"""
-        from config import DEV_USER_IDS
-        if user_id in DEV_USER_IDS:
+        if user_id in self.dev_ids:
             return 999
         
-        self.cursor.execute(
-            "SELECT level FROM user_perms WHERE user_id = ? AND chat_id = ?",
-            (user_id, chat_id)
-        )
-        result = self.cursor.fetchone()
+        level = self.perm_cache.get(user_id, chat_id)
+        if level is not None:
+            return level
         
-        if result:
-            return result['level']
+        # Уровень и владелец чата одним запросом
+        level, owner_id = self.pool.fetch_one('''
+            SELECT (SELECT level FROM user_perms WHERE chat_id = ? AND user_id = ?),
+                   (SELECT owner_id FROM chats WHERE chat_id = ?)
+        ''', (chat_id, user_id, chat_id))
+        if level is not None:
+            self.perm_cache.put(user_id, chat_id, level)
+            return level
         
         # Проверяем, владелец ли чата
-        self.cursor.execute(
-            "SELECT owner_id FROM chats WHERE chat_id = ?",
-            (chat_id,)
-        )
-        chat = self.cursor.fetchone()
-        if chat and chat['owner_id'] == user_id:
+        if owner_id == user_id:
             self.set_user_level(user_id, chat_id, 7)
             return 7
         
+        self.perm_cache.put(user_id, chat_id, 2)
         return 2
     
+    def get_user_levels(self, user_ids, chat_id: int) -> dict:
+        """Уровни нескольких пользователей: кеш, затем один запрос на промахи"""
+        levels = {}
+        missing = []
+        for user_id in user_ids:
+            if user_id in self.dev_ids:
+                levels[user_id] = 999
+                continue
+            level = self.perm_cache.get(user_id, chat_id)
+            if level is None:
+                missing.append(user_id)
+            else:
+                levels[user_id] = level
+        
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            rows = self.pool.fetch_all(
+                f"SELECT user_id, level FROM user_perms WHERE chat_id = ? AND user_id IN ({placeholders})",
+                (chat_id, *missing)
+            )
+            found = {row['user_id']: row['level'] for row in rows}
+            # Без записи: владелец чата получает 7, остальные - 2
+            owner_id = None
+            if len(found) < len(missing):
+                owner_id = self.pool.fetch_value("SELECT owner_id FROM chats WHERE chat_id = ?", (chat_id,))
+            for user_id in missing:
+                if user_id in found:
+                    levels[user_id] = found[user_id]
+                    self.perm_cache.put(user_id, chat_id, found[user_id])
+                elif user_id == owner_id:
+                    self.set_user_level(user_id, chat_id, 7)
+                    levels[user_id] = 7
+                else:
+                    levels[user_id] = 2
+                    self.perm_cache.put(user_id, chat_id, 2)
+        return levels
+    
     def set_user_level(self, user_id: int, chat_id: int, level: int):
         """Установить уровень прав"""
-        if level == 7:
-            self.cursor.execute(
-                "UPDATE chats SET owner_id = ? WHERE chat_id = ?",
+        with self.pool.transaction() as conn:
+            if level == 7:
+                conn.execute(
+                    "UPDATE chats SET owner_id = ? WHERE chat_id = ?",
+                    (user_id, chat_id)
+                )
+            
+            conn.execute('''
+                INSERT INTO user_perms (user_id, chat_id, level)
+                VALUES (?, ?, ?)
+                ON CONFLICT (user_id, chat_id) DO UPDATE SET level = excluded.level
+            ''', (user_id, chat_id, level))
+        self.perm_cache.put(user_id, chat_id, level)
+    
+    def add_warn(self, user_id: int, chat_id: int) -> int:
+        """Добавить варн пользователю"""
+        with self.pool.transaction() as conn:
+            conn.execute('''
+                INSERT INTO user_perms (user_id, chat_id, warns)
+                VALUES (?, ?, 1)
+                ON CONFLICT (user_id, chat_id) DO UPDATE SET warns = warns + 1
+            ''', (user_id, chat_id))
+            return conn.execute(
+                "SELECT warns FROM user_perms WHERE user_id = ? AND chat_id = ?",
                 (user_id, chat_id)
+            ).fetchone()['warns']
+    
+    def add_warns(self, user_ids, chat_id: int) -> dict:
+        """Добавить по варну нескольким пользователям, вернуть user_id -> варнов"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        with self.pool.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO user_perms (user_id, chat_id, warns)
+                VALUES (?, ?, 1)
+                ON CONFLICT (user_id, chat_id) DO UPDATE SET warns = warns + 1
+            ''', [(user_id, chat_id) for user_id in user_ids])
+            placeholders = ",".join("?" * len(user_ids))
+            rows = conn.execute(
+                f"SELECT user_id, warns FROM user_perms WHERE chat_id = ? AND user_id IN ({placeholders})",
+                (chat_id, *user_ids)
+            ).fetchall()
+            return {row['user_id']: row['warns'] for row in rows}
+    
+    def reset_warns(self, user_id: int, chat_id: int):
+        """Обнулить варны пользователя"""
+        self.pool.execute(
+            "UPDATE user_perms SET warns = 0 WHERE user_id = ? AND chat_id = ?",
+            (user_id, chat_id)
+        )
+    
+    def expire_warn(self, user_id: int, chat_id: int):
+        """Снять один истекший варн"""
+        self.pool.execute(
+            "UPDATE user_perms SET warns = warns - 1 WHERE user_id = ? AND chat_id = ? AND warns > 0",
+            (user_id, chat_id)
+        )
+    
+    def set_restriction(self, kind: str, user_id: int, chat_id: int, until: float = None):
+        """Записать срок мута/бана (kind: 'muted' или 'banned'); None - снять"""
+        column = {'muted': 'muted_until', 'banned': 'banned_until'}[kind]
+        self.pool.execute(f'''
+            INSERT INTO user_perms (user_id, chat_id, {column})
+            VALUES (?, ?, ?)
+            ON CONFLICT (user_id, chat_id) DO UPDATE SET {column} = excluded.{column}
+        ''', (user_id, chat_id, to_timestamp(until) if until else None))
+    
+    def set_restrictions(self, kind: str, user_ids, chat_id: int, until: float = None):
+        """set_restriction для нескольких пользователей одним запросом"""
+        column = {'muted': 'muted_until', 'banned': 'banned_until'}[kind]
+        until = to_timestamp(until) if until else None
+        self.pool.execute_many(f'''
+            INSERT INTO user_perms (user_id, chat_id, {column})
+            VALUES (?, ?, ?)
+            ON CONFLICT (user_id, chat_id) DO UPDATE SET {column} = excluded.{column}
+        ''', [(user_id, chat_id, until) for user_id in user_ids])
+    
+    def load_restrictions(self, now: float = None):
+        """Действующие муты и баны: (user_id, chat_id, muted_until, banned_until) в unix time"""
+        now = to_timestamp(now)
+        rows = self.pool.fetch_all('''
+            SELECT user_id, chat_id, muted_until, banned_until FROM user_perms
+            WHERE muted_until > ? OR banned_until > ?
+        ''', (now, now))
+        return [
+            (
+                row['user_id'], row['chat_id'],
+                from_timestamp(row['muted_until']) if row['muted_until'] and row['muted_until'] > now else None,
+                from_timestamp(row['banned_until']) if row['banned_until'] and row['banned_until'] > now else None,
             )
+            for row in rows
+        ]
+    
+    def load_active_warns(self, expire_seconds: float):
+        """Варны, которые еще не истекли: (user_id, chat_id, время выдачи).
         
-        self.cursor.execute('''
-            INSERT OR REPLACE INTO user_perms (user_id, chat_id, level)
+        Счетчики варнов, истекших пока бот был выключен, пересчитываются по логу.
+        Варны до последнего warns_reset израсходованы сбросом и не считаются.
+        """
+        since = to_timestamp(time.time() - expire_seconds)
+        with self.pool.transaction() as conn:
+            conn.execute('''
+                UPDATE user_perms SET warns = (
+                    SELECT COUNT(*) FROM logs
+                    WHERE logs.action = 'warn' AND logs.chat_id = user_perms.chat_id
+                      AND logs.target_id = user_perms.user_id AND logs.timestamp > ?
+                      AND logs.id > COALESCE((
+                          SELECT MAX(r.id) FROM logs r
+                          WHERE r.action = 'warns_reset' AND r.chat_id = user_perms.chat_id
+                            AND r.target_id = user_perms.user_id
+                      ), 0)
+                )
+                WHERE warns > 0
+            ''', (since,))
+            rows = conn.execute('''
+                SELECT w.target_id, w.chat_id, w.timestamp FROM logs w
+                WHERE w.action = 'warn' AND w.timestamp > ?
+                  AND w.id > COALESCE((
+                      SELECT MAX(r.id) FROM logs r
+                      WHERE r.action = 'warns_reset' AND r.chat_id = w.chat_id
+                        AND r.target_id = w.target_id
+                  ), 0)
+            ''', (since,)).fetchall()
+        return [(row['target_id'], row['chat_id'], from_timestamp(row['timestamp'])) for row in rows]
+    
+    def load_chat_settings(self, chat_id: int):
+        """JSON настроек чата или None"""
+        return self.pool.fetch_value("SELECT settings FROM chats WHERE chat_id = ?", (chat_id,))
+    
+    def save_chat_settings(self, chat_id: int, settings: str):
+        self.pool.execute('''
+            INSERT INTO chats (chat_id, settings) VALUES (?, ?)
+            ON CONFLICT (chat_id) DO UPDATE SET settings = excluded.settings
+        ''', (chat_id, settings))
+    
+    def load_profiles(self, user_ids):
+        """Сохраненные профили (Profile) для списка ID"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        placeholders = ",".join("?" * len(user_ids))
+        rows = self.pool.fetch_all(
+            f"SELECT * FROM profiles WHERE user_id IN ({placeholders})", user_ids
+        )
+        return [
+            Profile(row['user_id'], row['first_name'], row['last_name'], row['screen_name'], row['updated'])
+            for row in rows
+        ]
+    
+    def find_screen_names(self, names) -> dict:
+        """screen_name -> user_id для известных коротких имен"""
+        names = list(names)
+        if not names:
+            return {}
+        placeholders = ",".join("?" * len(names))
+        rows = self.pool.fetch_all(
+            f"SELECT screen_name, user_id FROM profiles WHERE screen_name IN ({placeholders})", names
+        )
+        return {row['screen_name']: row['user_id'] for row in rows}
+    
+    def save_profiles(self, profiles):
+        self.pool.execute_many('''
+            INSERT INTO profiles (user_id, first_name, last_name, screen_name, updated)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                first_name = excluded.first_name,
+                last_name = excluded.last_name,
+                screen_name = excluded.screen_name,
+                updated = excluded.updated
+        ''', [(p.user_id, p.first_name, p.last_name, p.screen_name, p.updated) for p in profiles])
+    
+    def load_custom_commands(self, chat_id: int):
+        """Кастомные команды чата: [(command, response)]"""
+        return [
+            (row['command'], row['response'])
+            for row in self.pool.fetch_all(
+                "SELECT command, response FROM custom_commands WHERE chat_id = ?",
+                (chat_id,)
+            )
+        ]
+    
+    def save_custom_command(self, chat_id: int, command: str, response: str, created_by: int):
+        self.pool.execute('''
+            INSERT OR REPLACE INTO custom_commands (chat_id, command, response, created_by)
+            VALUES (?, ?, ?, ?)
+        ''', (chat_id, command, response, created_by))
+    
+    def delete_custom_command(self, chat_id: int, command: str) -> bool:
+        return self.pool.execute(
+            "DELETE FROM custom_commands WHERE chat_id = ? AND command = ?",
+            (chat_id, command)
+        ) > 0
+    
+    def load_message_counts(self, chat_id: int):
+        """Счетчики сообщений чата: [(user_id, message_count)]"""
+        return [
+            (row['user_id'], row['message_count'])
+            for row in self.pool.fetch_all(
+                "SELECT user_id, message_count FROM user_perms WHERE chat_id = ? AND message_count > 0",
+                (chat_id,)
+            )
+        ]
+    
+    def record_message(self, user_id: int, chat_id: int):
+        """Учесть сообщение пользователя (запись отложенная)"""
+        self.writes.increment('''
+            INSERT INTO user_perms (user_id, chat_id, message_count, last_message)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, chat_id) DO UPDATE SET
+                message_count = message_count + excluded.message_count,
+                last_message = excluded.last_message
+        ''', (user_id, chat_id), 1, to_timestamp())
+    
+    def log_action(self, chat_id: int, user_id: int, action: str,
+                   target_id: int = None, reason: str = None):
+        """Записать действие в лог (запись отложенная)"""
+        self.writes.append(
+            "INSERT INTO logs (chat_id, user_id, action, target_id, reason) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, user_id, action, target_id, reason)
+        )
+    
+    def log_history(self, chat_id: int, target_id: int = None, before_id: int = None, limit: int = 10):
+        """Страница лога чата по убыванию id (keyset-пагинация по индексу)"""
+        sql = "SELECT id, user_id, action, target_id, reason, timestamp FROM logs WHERE chat_id = ?"
+        params = [chat_id]
+        if target_id is not None:
+            sql += " AND target_id = ?"
+            params.append(target_id)
+        if before_id is not None:
+            sql += " AND id < ?"
+            params.append(before_id)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        return self.pool.fetch_all(sql, params)
+    
+    def compact_logs(self, before: float, batch: int = 5000) -> int:
+        """Свернуть логи старше before в logs_daily и удалить их небольшими транзакциями"""
+        edge = to_timestamp(before)
+        removed = 0
+        while True:
+            with self.pool.transaction() as conn:
+                last_id = conn.execute('''
+                    SELECT MAX(id) FROM (
+                        SELECT id FROM logs WHERE timestamp < ? ORDER BY timestamp LIMIT ?
+                    )
+                ''', (edge, batch)).fetchone()[0]
+                if last_id is None:
+                    return removed
+                conn.execute('''
+                    INSERT INTO logs_daily (chat_id, day, action, count)
+                    SELECT chat_id, date(timestamp), action, COUNT(*) FROM logs
+                    WHERE id <= ? AND timestamp < ?
+                    GROUP BY chat_id, date(timestamp), action
+                    ON CONFLICT (chat_id, day, action) DO UPDATE SET count = count + excluded.count
+                ''', (last_id, edge))
+                removed += conn.execute(
+                    "DELETE FROM logs WHERE id <= ? AND timestamp < ?",
+                    (last_id, edge)
+                ).rowcount
+    
+    def touch_chat(self, chat_id: int):
+        """Отметить, что бот состоит в чате"""
+        self.pool.execute('''
+            INSERT INTO chats (chat_id) VALUES (?)
+            ON CONFLICT (chat_id) DO UPDATE SET left_at = NULL WHERE left_at IS NOT NULL
+        ''', (chat_id,))
+    
+    def leave_chat(self, chat_id: int):
+        self.pool.execute(
+            "UPDATE chats SET left_at = CURRENT_TIMESTAMP WHERE chat_id = ?",
+            (chat_id,)
+        )
+    
+    def active_chats(self, after: int = 0, limit: int = 25, shard=None) -> list:
+        """Чаты бота с chat_id > after по возрастанию; shard = (номер, всего)"""
+        sql = "SELECT chat_id FROM chats WHERE chat_id > ? AND left_at IS NULL"
+        params = [after]
+        if shard is not None:
+            sql += " AND chat_id % ? = ?"
+            params += [shard[1], shard[0]]
+        sql += " ORDER BY chat_id LIMIT ?"
+        params.append(limit)
+        return [row[0] for row in self.pool.fetch_all(sql, params)]
+    
+    def count_active_chats(self) -> int:
+        return self.pool.fetch_value("SELECT COUNT(*) FROM chats WHERE left_at IS NULL", default=0)
+    
+    def set_user_restriction(self, kind: str, user_id: int, chat_ids, until: float = None):
+        """set_restriction одного пользователя сразу в нескольких чатах"""
+        column = {'muted': 'muted_until', 'banned': 'banned_until'}[kind]
+        until = to_timestamp(until) if until else None
+        self.pool.execute_many(f'''
+            INSERT INTO user_perms (user_id, chat_id, {column})
             VALUES (?, ?, ?)
-        ''', (user_id, chat_id, level))
-        self.conn.commit()
+            ON CONFLICT (user_id, chat_id) DO UPDATE SET {column} = excluded.{column}
+        ''', [(user_id, chat_id, until) for chat_id in chat_ids])
     
-    def add_warn(self, user_id: int, chat_id: int) -> int:
-        """Добавить варн пользователю"""
-        self.cursor
\ No newline at end of file
+    def create_job(self, kind: str, payload: dict, created_by: int, from_chat: int) -> int:
+        """Новая фоновая задача по всем чатам бота, вернуть ее id"""
+        with self.pool.transaction() as conn:
+            return conn.execute('''
+                INSERT INTO jobs (kind, payload, created_by, from_chat, total)
+                VALUES (?, ?, ?, ?, (SELECT COUNT(*) FROM chats WHERE left_at IS NULL))
+            ''', (kind, json.dumps(payload, ensure_ascii=False), created_by, from_chat)).lastrowid
+    
+    def load_jobs(self, shard) -> list:
+        """Незавершенные задачи с контрольной точкой шарда; shard = (номер, всего)"""
+        self._reshard_jobs(shard[1])
+        return self.pool.fetch_all('''
+            SELECT jobs.*, COALESCE(p.last_chat, 0) AS last_chat,
+                   COALESCE(p.done, 0) AS done, COALESCE(p.failed, 0) AS failed
+            FROM jobs LEFT JOIN job_progress p ON p.job_id = jobs.id AND p.shard = ?
+            WHERE jobs.state = 'running' AND COALESCE(p.finished, 0) = 0
+            ORDER BY jobs.id
+        ''', (shard[0],))
+    
+    def _reshard_jobs(self, shards: int):
+        """Пересобрать прогресс задач, начатых при другом числе шардов.
+        
+        Старые курсоры относятся к другим наборам чатов, поэтому все новые шарды
+        продолжают с наименьшего курсора незавершенного шарда: часть чатов
+        пройдет повторно (random_id рассылки тот же), но ни один не пропадет.
+        """
+        with self.pool.transaction() as conn:
+            rows = conn.execute('''
+                SELECT p.job_id, p.shards, COUNT(*), SUM(p.done), SUM(p.failed),
+                       MIN(CASE WHEN p.finished THEN NULL ELSE p.last_chat END), MAX(p.last_chat)
+                FROM job_progress p JOIN jobs ON jobs.id = p.job_id
+                WHERE jobs.state = 'running' AND p.shards != ?
+                GROUP BY p.job_id, p.shards
+            ''', (shards,)).fetchall()
+            for job_id, old_shards, written, done, failed, unfinished, last in rows:
+                # Шард, не записавший прогресс, не начинал: его чаты с начала
+                cursor = 0 if written < old_shards else (last if unfinished is None else unfinished)
+                conn.execute("DELETE FROM job_progress WHERE job_id = ?", (job_id,))
+                conn.executemany('''
+                    INSERT INTO job_progress (job_id, shard, last_chat, done, failed, finished, shards)
+                    VALUES (?, ?, ?, ?, ?, 0, ?)
+                ''', [(job_id, index, cursor, done if index == 0 else 0, failed if index == 0 else 0, shards)
+                      for index in range(shards)])
+                print(f"⚠️  Задача #{job_id}: шардов было {old_shards}, стало {shards}, продолжаем с чата {cursor}")
+    
+    def save_job_progress(self, job_id: int, shard, last_chat: int,
+                          done: int, failed: int, finished: bool = False):
+        self.pool.execute('''
+            INSERT OR REPLACE INTO job_progress (job_id, shard, last_chat, done, failed, finished, shards)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id, shard[0], last_chat, done, failed, int(finished), shard[1]))
+    
+    def finish_job(self, job_id: int, shards: int):
+        """Закрыть задачу, если все шарды дошли до конца.
+    
+        (done, failed) по всем шардам - только для вызвавшего, который ее закрыл.
+        """
+        with self.pool.transaction() as conn:
+            row = conn.execute('''
+                SELECT COUNT(*), SUM(done), SUM(failed) FROM job_progress
+                WHERE job_id = ? AND finished = 1 AND shards = ?
+            ''', (job_id, shards)).fetchone()
+            if row[0] < shards:
+                return None
+            closed = conn.execute(
+                "UPDATE jobs SET state = 'done' WHERE id = ? AND state = 'running'",
+                (job_id,)
+            ).rowcount
+            return (row[1], row[2]) if closed else None
+    
+    def cancel_job(self, job_id: int) -> bool:
+        return self.pool.execute(
+            "UPDATE jobs SET state = 'cancelled' WHERE id = ? AND state = 'running'",
+            (job_id,)
+        ) > 0
+    
+    def close(self):
+        """Сбросить отложенные записи и закрыть соединения"""
+        self.writes.close()
+        self.pool.close()
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional
+
+from metrics import DB_SECONDS
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+)
+
+
+class ConnectionPool:
+    """Потокобезопасный доступ к SQLite.
+
+    Каждый поток читает через свое соединение (в WAL читатели не блокируют
+    друг друга), все записи идут через одно соединение под замком.
+    Подготовленные запросы переиспользуются кешем sqlite3 (cached_statements).
+    """
+
+    def __init__(self, path: str, statement_cache: int = 256):
+        self.path = path
+        self.statement_cache = statement_cache
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=self.statement_cache,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # ========== ЧТЕНИЕ ==========
+    def fetch_one(self, sql: str, params: Iterable = ()) -> Optional[sqlite3.Row]:
+        started = time.perf_counter()
+        row = self._reader().execute(sql, params).fetchone()
+        DB_SECONDS.observe(time.perf_counter() - started, "read")
+        return row
+
+    def fetch_all(self, sql: str, params: Iterable = ()) -> List[sqlite3.Row]:
+        started = time.perf_counter()
+        rows = self._reader().execute(sql, params).fetchall()
+        DB_SECONDS.observe(time.perf_counter() - started, "read")
+        return rows
+
+    def iterate(self, sql: str, params: Iterable = (), batch: int = 1000):
+        """Результат запроса пачками по batch строк, без загрузки целиком"""
+        cursor = self._reader().execute(sql, params)
+        while True:
+            started = time.perf_counter()
+            rows = cursor.fetchmany(batch)
+            DB_SECONDS.observe(time.perf_counter() - started, "read")
+            if not rows:
+                return
+            yield rows
+
+    def fetch_value(self, sql: str, params: Iterable = (), default: Any = None) -> Any:
+        row = self.fetch_one(sql, params)
+        return row[0] if row is not None else default
+
+    # ========== ЗАПИСЬ ==========
+    @contextmanager
+    def transaction(self):
+        """Транзакция на соединении записи; коммит при выходе без ошибок.
+
+        Время в метрике write включает ожидание замка записи.
+        """
+        started = time.perf_counter()
+        with self._write_lock:
+            conn = self._writer
+            if conn.in_transaction:
+                # Вложенный вызов: работаем в уже открытой транзакции
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        DB_SECONDS.observe(time.perf_counter() - started, "write")
+
+    def execute(self, sql: str, params: Iterable = ()) -> int:
+        """Выполнить запрос записи, вернуть число затронутых строк"""
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def execute_many(self, sql: str, rows: Iterable[Iterable]) -> int:
+        with self.transaction() as conn:
+            return conn.executemany(sql, rows).rowcount
+
+    def execute_script(self, script: str):
+        with self._write_lock:
+            self._writer.executescript(script)
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
@@ -0,0 +1,141 @@
+"""Обслуживание БД бота: миграции, выгрузка и загрузка данных.
+
+    python dbtool.py version
+    python dbtool.py migrate [--legacy orbit.db]
+    python dbtool.py export dump.jsonl.gz [--table user_perms ...]
+    python dbtool.py import dump.jsonl.gz [--batch 5000]
+
+Формат - JSONL: первая строка каждой таблицы {"table": ..., "columns": [...]},
+дальше по строке-массиву значений на запись. Файлы .gz сжимаются на лету.
+Выгрузка и загрузка идут потоком: в памяти не больше одной пачки строк,
+поэтому таблицы на миллионы записей не требуют памяти под весь дамп.
+Загрузка заменяет записи с теми же ключами (INSERT OR REPLACE).
+Бота на время загрузки лучше остановить.
+"""
+import argparse
+import contextlib
+import gzip
+import json
+import sys
+import time
+
+import migrations
+from config import DATABASE_FILE, LEGACY_DATABASE_FILE
+from db_pool import ConnectionPool
+
+TABLES = ("chats", "user_perms", "custom_commands", "profiles", "logs", "logs_daily", "jobs", "job_progress")
+BATCH = 5000
+
+
+def open_dump(path: str, mode: str):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdout if "w" in mode else sys.stdin)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def table_columns(pool, table: str) -> list:
+    return [row["name"] for row in pool.fetch_all(f"PRAGMA table_info({table})")]
+
+
+def export_tables(pool, path: str, tables=TABLES, batch: int = BATCH) -> dict:
+    """Выгрузить таблицы в JSONL; вернуть table -> записей"""
+    counts = {}
+    with open_dump(path, "w") as out:
+        for table in tables:
+            columns = table_columns(pool, table)
+            out.write(json.dumps({"table": table, "columns": columns}, ensure_ascii=False) + "\n")
+            count = 0
+            for rows in pool.iterate(f"SELECT {', '.join(columns)} FROM {table}", batch=batch):
+                out.writelines(json.dumps(tuple(row), ensure_ascii=False) + "\n" for row in rows)
+                count += len(rows)
+            counts[table] = count
+    return counts
+
+
+def import_tables(pool, path: str, batch: int = BATCH) -> dict:
+    """Загрузить JSONL из export_tables; каждая пачка - отдельная транзакция"""
+    counts = {}
+    sql = None
+    rows = []
+
+    def flush():
+        if rows:
+            pool.execute_many(sql, rows)
+            counts[table] += len(rows)
+            rows.clear()
+
+    with open_dump(path, "r") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict):
+                flush()
+                table = item["table"]
+                if table not in TABLES:
+                    raise ValueError(f"строка {number}: неизвестная таблица {table}")
+                known = set(table_columns(pool, table))
+                columns = [column for column in item["columns"] if column in known]
+                # Колонки, которых нет в текущей схеме, пропускаются
+                keep = [i for i, column in enumerate(item["columns"]) if column in known]
+                sql = (
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})"
+                )
+                counts.setdefault(table, 0)
+                continue
+            if sql is None:
+                raise ValueError(f"строка {number}: данные до заголовка таблицы")
+            rows.append([item[i] for i in keep])
+            if len(rows) >= batch:
+                flush()
+        flush()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции, выгрузка и загрузка БД бота")
+    parser.add_argument("--db", default=DATABASE_FILE, help="файл БД")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("version", help="версия схемы")
+    migrate_parser = commands.add_parser("migrate", help="применить миграции")
+    migrate_parser.add_argument("--legacy", default=LEGACY_DATABASE_FILE, help="старая orbit.db с таблицей users")
+    export_parser = commands.add_parser("export", help="выгрузить таблицы в JSONL")
+    export_parser.add_argument("path", help="файл (.gz - со сжатием, - - stdout)")
+    export_parser.add_argument("--table", action="append", choices=TABLES, help="только эти таблицы")
+    import_parser = commands.add_parser("import", help="загрузить JSONL")
+    import_parser.add_argument("path", help="файл (.gz - со сжатием, - - stdin)")
+    import_parser.add_argument("--batch", type=int, default=BATCH, help="записей в транзакции")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(args.db)
+    try:
+        if args.command == "version":
+            print(f"Схема {migrations.schema_version(pool)}, код до {migrations.LATEST}")
+            return 0
+        # Экспорт и импорт работают только со схемой последней версии; старая
+        # orbit.db переносится только по явному migrate, иначе импорт в чужую
+        # БД подмешал бы записи из рабочего каталога
+        migrations.migrate(pool, args.legacy if args.command == "migrate" else None)
+        if args.command == "migrate":
+            return 0
+
+        started = time.perf_counter()
+        if args.command == "export":
+            counts = export_tables(pool, args.path, args.table or TABLES)
+        else:
+            counts = import_tables(pool, args.path, args.batch)
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        for table, count in counts.items():
+            print(f"  {table}: {count}", file=sys.stderr)
+        print(f"✅ {total} записей за {elapsed:.1f} с ({total / elapsed if elapsed else 0:,.0f}/с)", file=sys.stderr)
+        return 0
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from vk_api.bot_longpoll import VkBotLongPoll
+
+from metrics import HANDLER_SECONDS
+
+
+def parse_event(raw: dict):
+    """Событие Bots Long Poll из сырого словаря, как это делает VkBotLongPoll"""
+    event_class = VkBotLongPoll.CLASS_BY_EVENT_TYPE.get(raw["type"], VkBotLongPoll.DEFAULT_EVENT_CLASS)
+    return event_class(raw)
+
+
+class LatencyStats:
+    """Статистика задержек по именованным обработчикам.
+
+    Если передана гистограмма, каждое наблюдение попадает и в нее (для /metrics).
+    """
+
+    def __init__(self, histogram=None):
+        self.histogram = histogram
+        self._lock = threading.Lock()
+        self._data = {}  # name -> [count, total, max]
+
+    def observe(self, name: str, seconds: float):
+        if self.histogram is not None:
+            self.histogram.observe(seconds, name)
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                self._data[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+    @contextmanager
+    def timed(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self) -> dict:
+        """Копия статистики: name -> (count, avg, max) в секундах"""
+        with self._lock:
+            return {
+                name: (count, total / count, peak)
+                for name, (count, total, peak) in self._data.items()
+            }
+
+
+class Dispatcher:
+    """Конвейер событий: ограниченная очередь и пул воркеров.
+
+    События с одинаковым ключом (чатом) обрабатываются строго по порядку,
+    разные ключи - параллельно. При заполнении очереди submit блокируется.
+    """
+
+    def __init__(self, handler, workers: int = 8, max_pending: int = 1000):
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.stats = LatencyStats(HANDLER_SECONDS)
+
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._not_empty = threading.Condition(self._lock)
+        self._pending = {}      # key -> deque[(item, enqueued_at)]
+        self._ready = deque()   # ключи, готовые к обработке
+        self._depth = 0
+        self._peak_depth = 0
+        self._processed = 0
+        self._paused = False
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"dispatch-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить воркеры, дождавшись обработки очереди"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._depth and time.monotonic() < deadline:
+                self._not_full.wait(0.1)
+            self._running = False
+            self._not_empty.notify_all()
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def submit(self, key, item, timeout: float = None) -> bool:
+        """Поставить событие в очередь. False - если не дождались места"""
+        with self._lock:
+            if not self._not_full.wait_for(
+                lambda: not self._paused and self._depth < self.max_pending, timeout
+            ):
+                return False
+            queue = self._pending.get(key)
+            if queue is None:
+                queue = self._pending[key] = deque()
+                self._ready.append(key)
+                self._not_empty.notify()
+            queue.append((item, time.perf_counter()))
+            self._depth += 1
+            if self._depth > self._peak_depth:
+                self._peak_depth = self._depth
+            return True
+
+    @contextmanager
+    def paused(self, timeout: float = 5.0):
+        """Приостановить прием событий и дождаться пустой очереди.
+
+        Внутри блока все принятые события обработаны, если значение True;
+        False - очередь не опустела за timeout.
+        """
+        with self._lock:
+            self._paused = True
+            drained = self._not_full.wait_for(lambda: self._depth == 0, timeout)
+        try:
+            yield drained
+        finally:
+            with self._lock:
+                self._paused = False
+                self._not_full.notify_all()
+
+    def _next(self):
+        with self._lock:
+            while not self._ready:
+                if not self._running:
+                    return None
+                self._not_empty.wait()
+            key = self._ready.popleft()
+            item, enqueued_at = self._pending[key][0]
+            return key, item, enqueued_at
+
+    def _done(self, key):
+        with self._lock:
+            queue = self._pending[key]
+            queue.popleft()
+            self._depth -= 1
+            self._processed += 1
+            if queue:
+                # Ключ уходит в конец очереди, чтобы не держать воркер
+                self._ready.append(key)
+                self._not_empty.notify()
+            else:
+                del self._pending[key]
+            self._not_full.notify_all()
+
+    def _worker(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            key, item, enqueued_at = task
+            started = time.perf_counter()
+            self.stats.observe("queue_wait", started - enqueued_at)
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"⚠️  Ошибка обработки события: {e}")
+            finally:
+                self.stats.observe("event", time.perf_counter() - started)
+                self._done(key)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "depth": self._depth,
+                "peak_depth": self._peak_depth,
+                "max_pending": self.max_pending,
+                "active_chats": len(self._pending),
+                "processed": self._processed,
+                "workers": self.workers,
+            }
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from metrics import FANOUT_CHATS
+from sender import TokenBucket
+
+BROADCAST = "broadcast"
+GLOBAL_BAN = "global_ban"
+
+# Чатов за шаг: столько вызовов Sender уложит в один execute
+BATCH_SIZE = 25
+
+
+def new_salt() -> int:
+    """Соль задачи для random_id; хранится в payload. Без нее задачи с тем же
+    номером (после сброса таблицы jobs) получили бы те же random_id"""
+    return random.getrandbits(32)
+
+
+def random_id(job, chat_id: int) -> int:
+    """random_id сообщения задачи в чате.
+
+    Свой у каждого чата и у каждой задачи, но тот же при повторе чата после
+    перезапуска: VK отбрасывает повторный random_id, и дубля не будет.
+    """
+    key = f"{job.payload.get('salt', 0)}:{job.id}:{chat_id}".encode()
+    # messages.send принимает int32; 0 означает "без random_id"
+    return int.from_bytes(hashlib.blake2b(key, digest_size=4).digest(), "big") & 0x7FFFFFFF or 1
+
+
+class Job:
+    __slots__ = ("id", "kind", "payload", "created_by", "from_chat", "total",
+                 "last_chat", "done", "failed", "started", "processed")
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.kind = row['kind']
+        self.payload = json.loads(row['payload'] or "{}")
+        self.created_by = row['created_by']
+        self.from_chat = row['from_chat']
+        self.total = row['total']
+        self.last_chat = row['last_chat']
+        self.done = row['done']
+        self.failed = row['failed']
+        # Для скорости: когда и сколько чатов обработано в этом процессе
+        self.started = time.monotonic()
+        self.processed = 0
+
+
+class FanoutRunner:
+    """Фоновые DEV-задачи по всем чатам бота (рассылка, глобальный бан).
+
+    Задачи лежат в БД; поток берет по BATCH_SIZE чатов, вызывает обработчик
+    вида задачи и ждет его вызовы VK API, затем сохраняет контрольную точку
+    (последний chat_id). После перезапуска задача продолжается с нее.
+    Скорость ограничена rate чатов в секунду, чтобы не вытеснять ответы
+    на команды из общего лимита VK API. В шарде обходятся только свои чаты.
+    """
+
+    def __init__(self, store, shard=(0, 1), rate: float = 25.0, poll: float = 5.0,
+                 timeout: float = 120.0):
+        self.store = store
+        self.shard = shard
+        self.bucket = TokenBucket(rate, BATCH_SIZE)
+        self.poll = poll
+        self.timeout = timeout
+        # kind -> (handler(job, chat_ids) -> [Future], коды ошибок VK, которые считаются успехом)
+        self._handlers = {}
+        self.on_done = None  # (job, done, failed), вызывается в шарде, закрывшем задачу
+
+        self._jobs = {}  # id -> Job, незавершенные в этом шарде
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._recent = deque()  # (время, чатов) за последнюю минуту
+
+    def register(self, kind: str, handler, ok_codes=()):
+        self._handlers[kind] = (handler, frozenset(ok_codes))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="fanout", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановиться после текущей пачки; прогресс уже сохранен"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def wake(self):
+        """Проверить новые задачи сразу, не дожидаясь poll"""
+        self._wake.set()
+
+    # ========== ВЫПОЛНЕНИЕ ==========
+    def _reload(self):
+        rows = self.store.load_jobs(self.shard)
+        with self._lock:
+            jobs = {}
+            for row in rows:
+                job = self._jobs.get(row['id'])
+                jobs[row['id']] = job if job is not None else Job(row)
+            # Отмененные исчезают из выборки
+            self._jobs = jobs
+            return list(jobs.values())
+
+    def _step(self, job: Job) -> bool:
+        """Одна пачка чатов задачи. False - чатов не осталось"""
+        chats = self.store.active_chats(job.last_chat, BATCH_SIZE, self.shard)
+        if not chats:
+            self.store.save_job_progress(job.id, self.shard, job.last_chat, job.done, job.failed, True)
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            totals = self.store.finish_job(job.id, self.shard[1])
+            if totals is not None and self.on_done:
+                self.on_done(job, *totals)
+            return False
+
+        handler, ok_codes = self._handlers[job.kind]
+        self.bucket.acquire(len(chats))
+        futures = handler(job, chats)
+        deadline = time.monotonic() + self.timeout
+        ok = failed = 0
+        for future in futures:
+            try:
+                future.result(max(0.0, deadline - time.monotonic()))
+                ok += 1
+            except FutureTimeout:
+                failed += 1
+            except Exception as e:
+                if getattr(e, "code", None) in ok_codes:
+                    ok += 1
+                else:
+                    failed += 1
+
+        FANOUT_CHATS.inc(job.kind, "ok", amount=ok)
+        FANOUT_CHATS.inc(job.kind, "failed", amount=failed)
+        with self._lock:
+            job.last_chat = chats[-1]
+            job.done += ok
+            job.failed += failed
+            job.processed += len(chats)
+            now = time.monotonic()
+            self._recent.append((now, len(chats)))
+            while self._recent and self._recent[0][0] < now - 60:
+                self._recent.popleft()
+        self.store.save_job_progress(job.id, self.shard, job.last_chat, job.done, job.failed)
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                jobs = self._reload()
+            except Exception as e:
+                print(f"⚠️  Ошибка загрузки задач: {e}")
+                jobs = []
+            if not jobs:
+                self._wake.wait(self.poll)
+                self._wake.clear()
+                continue
+            # По пачке от каждой задачи: отмена и новые задачи видны между пачками
+            for job in jobs:
+                if self._stop.is_set():
+                    return
+                try:
+                    self._step(job)
+                except Exception as e:
+                    print(f"⚠️  Ошибка задачи #{job.id}: {e}")
+                    self._stop.wait(self.poll)
+
+    # ========== СТАТУС ==========
+    def status(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            recent = sum(count for at, count in self._recent if at >= now - 60)
+            jobs = [
+                {
+                    "id": job.id,
+                    "kind": job.kind,
+                    "done": job.done,
+                    "failed": job.failed,
+                    "total": job.total,
+                    "rate": job.processed / max(now - job.started, 1e-9),
+                }
+                for job in self._jobs.values()
+            ]
+        return {"jobs": jobs, "chats_per_sec": recent / 60}
@@ -1,13 +1,32 @@
 import vk_api
 from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
-from vk_api.utils import get_random_id
-import sqlite3
+from vk_api.vk_api import VkApiGroup, VkApiMethod
 import json
 import time
 from datetime import datetime, timedelta
 import os
 import sys
+import signal
 import threading
+from contextlib import ExitStack, contextmanager
+from dispatcher import Dispatcher
+from sender import Sender
+from database import Database as Storage
+from antiflood import FloodControl, FLOOD_MUTE, FLOOD_SUPPRESS
+from content_filter import FILTER_MAT, FILTER_LINK, FILTER_CAPS, FILTER_RUN
+from sanctions import SanctionScheduler, MUTE, BAN, WARN, LOCKDOWN
+from activity import ActivityTracker, PERIOD_DAY, PERIOD_WEEK, PERIOD_ALL
+from audit import AuditLog
+from router import CommandRouter, CustomCommand, CUSTOM_NAME_RE, parse_duration, format_duration
+from chat_settings import SettingsRegistry, parse_value, MAX_VALUES
+from message_log import MessageLog
+from bulk import RecentJoins, BulkProgress, parse_targets
+from raid import RaidDetector, RAID_START
+from profiles import ProfileCache
+from fanout import FanoutRunner, BROADCAST, GLOBAL_BAN, new_salt, random_id
+import snapshot
+import metrics
+from config import DEFAULT_CHAT_SETTINGS
 
 # ========== КОНФИГ ==========
 # Получаем настройки из переменных окружения Render
@@ -56,65 +75,84 @@ print(f"✅ DEV IDS: {DEV_IDS}")
 PREFIX = "!"
 DEV_PREFIX = "!!"
 
-# ========== БАЗА ДАННЫХ ==========
-class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('orbit.db', check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
-        self.init_db()
-    
-    def init_db(self):
-        # Пользователи
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER,
-                chat_id INTEGER,
-                level INTEGER DEFAULT 2,
-                warns INTEGER DEFAULT 0,
-                muted_until TEXT,
-                PRIMARY KEY (user_id, chat_id)
-            )
-        ''')
-        # Чаты
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chats (
-                chat_id INTEGER PRIMARY KEY,
-                owner_id INTEGER,
-                title TEXT
-            )
-        ''')
-        self.conn.commit()
-    
-    def get_user_level(self, user_id, chat_id):
-        if user_id in DEV_IDS:
-            return 999
-        
-        self.cursor.execute(
-            "SELECT level FROM users WHERE user_id=? AND chat_id=?",
-            (user_id, chat_id)
-        )
-        row = self.cursor.fetchone()
-        return row['level'] if row else 2
-    
-    def set_user_level(self, user_id, chat_id, level):
-        self.cursor.execute('''
-            INSERT OR REPLACE INTO users (user_id, chat_id, level)
-            VALUES (?, ?, ?)
-        ''', (user_id, chat_id, level))
-        self.conn.commit()
-        return True
+# Пул обработчиков событий
+WORKERS = int(os.getenv("WORKERS", "8"))
+QUEUE_SIZE = int(os.getenv("QUEUE_SIZE", "1000"))
+
+SETTING_KEYS = tuple(DEFAULT_CHAT_SETTINGS)
+
+COMMAND_ALIASES = {
+    "старт": ("start",),
+    "помощь": ("help", "хелп"),
+    "профиль": ("profile", "проф"),
+    "права": ("rights",),
+    "варн": ("warn", "пред"),
+    "кик": ("kick",),
+    "мут": ("mute",),
+    "размут": ("unmute",),
+    "бан": ("ban",),
+    "стата": ("stats", "статистика"),
+    "топ": ("top",),
+    "настройки": ("settings",),
+    "масскик": ("masskick",),
+    "массмут": ("massmute",),
+    "массварн": ("masswarn",),
+}
+
+# Вступления в беседу (MESSAGE_NEW с action)
+JOIN_ACTIONS = ('chat_invite_user', 'chat_invite_user_by_link')
+
+TOP_PERIODS = {
+    "": (PERIOD_ALL, "за все время"),
+    "все": (PERIOD_ALL, "за все время"),
+    "день": (PERIOD_DAY, "за день"),
+    "сегодня": (PERIOD_DAY, "за день"),
+    "неделя": (PERIOD_WEEK, "за неделю"),
+}
+
+# Лимит запросов к VK API в секунду (для токена группы - 20)
+VK_RPS = float(os.getenv("VK_RPS", "20"))
+
+# Асинхронный режим (aiohttp): ASYNC_MODE=1 или python main.py --async
+ASYNC_MODE = os.getenv("ASYNC_MODE", "0") == "1" or "--async" in sys.argv
+
+# Шардирование: SHARDS=N запускает N процессов-обработчиков (0/1 - без шардов)
+SHARDS = int(os.getenv("SHARDS", "0"))
+LONGPOLL_CHECKPOINT = os.getenv("LONGPOLL_CHECKPOINT", "data/longpoll_ts")
+
+# Скорость DEV-рассылок и глобальных банов, чатов в секунду (делится между шардами)
+FANOUT_RATE = float(os.getenv("FANOUT_RATE", "25"))
+# removeChatUser: пользователя нет в чате - для глобального бана это не ошибка
+USER_NOT_IN_CHAT = 935
+FANOUT_NAMES = {BROADCAST: "рассылка", GLOBAL_BAN: "глобан"}
+
+# Метрики Prometheus на http://0.0.0.0:PORT/metrics (Render задает PORT сам; 0 - выключено)
+METRICS_PORT = int(os.getenv("PORT", "0"))
+# Снимок состояния для быстрого перезапуска (пустой путь - выключено)
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "data/state.snap")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "30"))
+# Более старый снимок не используем: long poll столько не хранит, а БД уже ушла вперед
+SNAPSHOT_MAX_AGE = 3600
 
-db = Database()
+# Доля входящих сообщений, попадающих в журнал (0.01 = 1%)
+LOG_SAMPLE = float(os.getenv("LOG_SAMPLE", "0.01"))
+
+# Замков варнов (полос по хешу чата и пользователя)
+WARN_LOCK_STRIPES = 64
+
+# ========== БАЗА ДАННЫХ ==========
+# Единое хранилище (data/orbit.db); схема и перенос старой orbit.db - в migrations.py
+store = Storage()
+store.dev_ids = set(DEV_IDS)
 
 # ========== ОСНОВНОЙ КЛАСС БОТА ==========
 class OrbitBot:
-    def __init__(self):
+    def __init__(self, connect_longpoll=True, shard=None):
         print("🔧 Инициализация бота...")
         try:
-            self.vk_session = vk_api.VkApi(token=BOT_TOKEN)
+            self.vk_session = VkApiGroup(token=BOT_TOKEN)
             self.vk = self.vk_session.get_api()
-            self.longpoll = VkBotLongPoll(self.vk_session, GROUP_ID)
+            self.longpoll = VkBotLongPoll(self.vk_session, GROUP_ID) if connect_longpoll else None
             print("✅ VK API подключен")
         except Exception as e:
             print(f"❌ Ошибка подключения: {e}")
@@ -128,16 +166,72 @@ class OrbitBot:
             "варн": self.cmd_warn,
             "кик": self.cmd_kick,
             "мут": self.cmd_mute,
+            "размут": self.cmd_unmute,
+            "бан": self.cmd_ban,
             "стата": self.cmd_stats,
             "топ": self.cmd_top,
+            "настройки": self.cmd_settings,
+            "история": self.cmd_history,
+            "команды": self.cmd_custom_list,
+            "команда+": self.cmd_custom_add,
+            "команда-": self.cmd_custom_delete,
+            "масскик": self.cmd_mass_kick,
+            "массмут": self.cmd_mass_mute,
+            "массварн": self.cmd_mass_warn,
         }
         
         self.dev_commands = {
             "обновить": self.dev_update,
             "выйти": self.dev_leave,
             "статус": self.dev_status,
+            "рассылка": self.dev_broadcast,
+            "глобан": self.dev_global_ban,
+            "отмена": self.dev_cancel,
         }
         
+        self.router = CommandRouter(store, PREFIX, DEV_PREFIX)
+        for name, handler in self.commands.items():
+            self.router.add(name, handler, COMMAND_ALIASES.get(name, ()))
+        for name, handler in self.dev_commands.items():
+            self.router.add(name, handler, dev=True)
+        
+        self.dispatcher = Dispatcher(self.handle_event, WORKERS, QUEUE_SIZE)
+        # shard = (номер, всего): процесс отвечает только за свои чаты
+        self.shard = shard
+        shards = shard[1] if shard else 1
+        self.sender = Sender(self.vk_session, rate=VK_RPS / shards)
+        self.flood = FloodControl()
+        self.sanctions = SanctionScheduler(self.on_sanction_expire)
+        self.activity = ActivityTracker(store.load_message_counts)
+        self.settings = SettingsRegistry(store)
+        self.audit = AuditLog(store)
+        self.joins = RecentJoins()
+        self.raids = RaidDetector()
+        self.profiles = ProfileCache(store, self.sender.call)
+        self.message_log = MessageLog(LOG_SAMPLE)
+        self.fanout = FanoutRunner(store, shard or (0, 1), rate=FANOUT_RATE / shards)
+        self.fanout.register(BROADCAST, self.fanout_broadcast)
+        self.fanout.register(GLOBAL_BAN, self.fanout_ban, ok_codes=(USER_NOT_IN_CHAT,))
+        self.fanout.on_done = self.on_fanout_done
+        # Чаты, участие в которых уже отмечено в БД этим процессом
+        self.known_chats = set()
+        self.metrics_server = None
+        self.register_metrics()
+        
+        # ts long poll, до которого все события уже поставлены в очередь / обработаны
+        self.longpoll_ts = None
+        # Держится, пока пачка long poll раздается воркерам и сдвигается ts
+        self._batch_lock = threading.Lock()
+        # Полосы замков варнов по (чат, пользователь), см. warn_lock
+        self._warn_locks = [threading.Lock() for _ in range(WARN_LOCK_STRIPES)]
+        self.snapshot_ts = None
+        self.snapshots = None
+        if SNAPSHOT_PATH:
+            path = f"{SNAPSHOT_PATH}.{shard[0]}" if shard else SNAPSHOT_PATH
+            self.snapshots = snapshot.Snapshotter(path, self.capture_state, SNAPSHOT_INTERVAL, shard or (0, 1))
+        if not self.restore_state():
+            self.load_sanctions()
+        
         print("✅ Бот инициализирован")
         print("=" * 50)
     
@@ -156,7 +250,7 @@ class OrbitBot:
     def cmd_help(self, event, args):
         chat_id = event.chat_id
         user_id = event.object.message['from_id']
-        level = db.get_user_level(user_id, chat_id)
+        level = store.get_user_level(user_id, chat_id)
         
         help_text = "📚 Команды Orbit Manager:\n\n"
         
@@ -164,24 +258,39 @@ class OrbitBot:
             help_text += "👤 Основные:\n"
             help_text += "!помощь - эта справка\n"
             help_text += "!профиль - информация\n"
-            help_text += "!стата - статистика\n\n"
+            help_text += "!стата - статистика\n"
+            help_text += "!команды - команды чата\n\n"
         
         if level >= 3:
             help_text += "🛡️ Модерация:\n"
             help_text += "!варн @user - предупреждение\n"
             help_text += "!кик @user - исключить\n"
-            help_text += "!мут @user 30м - мут\n\n"
+            help_text += "!мут @user 30м - мут\n"
+            help_text += "!размут @user - снять мут\n"
+            help_text += "!бан @user 1д - бан\n"
+            help_text += "!история [@user] - журнал модерации\n\n"
+        
+        if level >= 4:
+            help_text += "🚨 Массовые действия (до 200 человек):\n"
+            help_text += "!масскик id1 id2 ... | новые 10м\n"
+            help_text += "!массмут 30м id1 id2 ... | новые 10м\n"
+            help_text += "!массварн id1 id2 ... | новые 10м\n\n"
         
         if level >= 5:
             help_text += "👑 Админ:\n"
             help_text += "!права @user 0-7 - права\n"
-            help_text += "!топ - топ активных\n\n"
+            help_text += "!топ [день|неделя] - топ активных\n"
+            help_text += "!настройки [ключ значение] - настройки чата\n"
+            help_text += "!команда+ имя ответ / !команда- имя - свои команды\n\n"
         
         if level == 999:
             help_text += "⚡ DEV:\n"
             help_text += "!!обновить - перезагрузка\n"
             help_text += "!!выйти id - выйти из чата\n"
             help_text += "!!статус - статус бота\n"
+            help_text += "!!рассылка текст - сообщение во все чаты\n"
+            help_text += "!!глобан id время - бан во всех чатах\n"
+            help_text += "!!отмена номер - остановить рассылку или глобан\n"
         
         self.send(chat_id, help_text)
     
@@ -189,7 +298,7 @@ class OrbitBot:
         chat_id = event.chat_id
         user_id = event.object.message['from_id']
         
-        level = db.get_user_level(user_id, chat_id)
+        level = store.get_user_level(user_id, chat_id)
         level_names = {
             0: "🚫 Заблокированный",
             1: "👤 Гость",
@@ -214,7 +323,7 @@ class OrbitBot:
         chat_id = event.chat_id
         user_id = event.object.message['from_id']
         
-        if db.get_user_level(user_id, chat_id) < 5:
+        if store.get_user_level(user_id, chat_id) < 5:
             self.send(chat_id, "❌ Требуется уровень 5+")
             return
         
@@ -224,7 +333,7 @@ class OrbitBot:
             return
         
         try:
-            target_id = int(parts[0])
+            target_id = self.profiles.resolve(parts[0])
             new_level = int(parts[1])
             if not (0 <= new_level <= 7):
                 raise ValueError
@@ -232,14 +341,15 @@ class OrbitBot:
             self.send(chat_id, "❌ Неверный формат. Пример: !права 123456789 5")
             return
         
-        db.set_user_level(target_id, chat_id, new_level)
-        self.send(chat_id, f"✅ Права пользователя [id{target_id}|...] изменены на уровень {new_level}")
+        store.set_user_level(target_id, chat_id, new_level)
+        self.audit.emit(chat_id, user_id, "rights", target_id, level=new_level)
+        self.send(chat_id, f"✅ Права пользователя {self.profiles.mention(target_id)} изменены на уровень {new_level}")
     
     def cmd_warn(self, event, args):
         chat_id = event.chat_id
         user_id = event.object.message['from_id']
         
-        if db.get_user_level(user_id, chat_id) < 3:
+        if store.get_user_level(user_id, chat_id) < 3:
             self.send(chat_id, "❌ Требуется уровень 3+")
             return
         
@@ -248,18 +358,18 @@ class OrbitBot:
             return
         
         try:
-            target_id = int(args.split()[0])
+            target_id = self.profiles.resolve(args.split()[0])
         except:
             self.send(chat_id, "❌ Неверный ID")
             return
         
-        self.send(chat_id, f"⚠️ Пользователю [id{target_id}|...] выдано предупреждение")
+        self.warn_user(chat_id, target_id, user_id)
     
     def cmd_kick(self, event, args):
         chat_id = event.chat_id
         user_id = event.object.message['from_id']
         
-        if db.get_user_level(user_id, chat_id) < 3:
+        if store.get_user_level(user_id, chat_id) < 3:
             self.send(chat_id, "❌ Требуется уровень 3+")
             return
         
@@ -268,17 +378,16 @@ class OrbitBot:
             return
         
         try:
-            target_id = int(args.split()[0])
+            target_id = self.profiles.resolve(args.split()[0])
         except:
             self.send(chat_id, "❌ Неверный ID")
             return
         
         try:
-            self.vk.messages.removeChatUser(
-                chat_id=chat_id,
-                user_id=target_id
-            )
-            self.send(chat_id, f"👢 Пользователь [id{target_id}|...] исключен")
+            # Через очередь Sender: общий лимит запросов и пачки execute
+            self.kick(chat_id, target_id).result(timeout=60)
+            self.audit.emit(chat_id, user_id, "kick", target_id)
+            self.send(chat_id, f"👢 Пользователь {self.profiles.mention(target_id)} исключен")
         except Exception as e:
             self.send(chat_id, f"❌ Ошибка: {e}")
     
@@ -286,7 +395,7 @@ class OrbitBot:
         chat_id = event.chat_id
         user_id = event.object.message['from_id']
         
-        if db.get_user_level(user_id, chat_id) < 3:
+        if store.get_user_level(user_id, chat_id) < 3:
             self.send(chat_id, "❌ Требуется уровень 3+")
             return
         
@@ -296,19 +405,217 @@ class OrbitBot:
             return
         
         try:
-            target_id = int(parts[0])
-            time_str = parts[1]
-            self.send(chat_id, f"🔇 Пользователь [id{target_id}|...] замьючен на {time_str}")
+            target_id = self.profiles.resolve(parts[0])
         except:
             self.send(chat_id, "❌ Неверный формат")
+            return
+        
+        seconds = parse_duration(parts[1])
+        if not seconds:
+            self.send(chat_id, "❌ Неверное время. Пример: 30м, 2ч, 1д")
+            return
+        
+        self.mute_user(chat_id, target_id, seconds, user_id)
+        self.send(chat_id, f"🔇 Пользователь {self.profiles.mention(target_id)} замьючен на {format_duration(seconds)}")
+    
+    def cmd_unmute(self, event, args):
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        
+        if store.get_user_level(user_id, chat_id) < 3:
+            self.send(chat_id, "❌ Требуется уровень 3+")
+            return
+        
+        try:
+            target_id = self.profiles.resolve(args.split()[0])
+        except:
+            self.send(chat_id, "❌ Формат: !размут [id]")
+            return
+        
+        if not self.sanctions.remove(MUTE, chat_id, target_id):
+            self.send(chat_id, "❌ Пользователь не в муте")
+            return
+        store.set_restriction('muted', target_id, chat_id, None)
+        self.audit.emit(chat_id, user_id, "unmute", target_id)
+        self.send(chat_id, f"🔊 С пользователя {self.profiles.mention(target_id)} снят мут")
+    
+    def cmd_ban(self, event, args):
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        
+        if store.get_user_level(user_id, chat_id) < 3:
+            self.send(chat_id, "❌ Требуется уровень 3+")
+            return
+        
+        parts = args.split()
+        if len(parts) < 2:
+            self.send(chat_id, "❌ Формат: !бан [id] [время]\nПример: !бан 123456789 1д")
+            return
+        
+        try:
+            target_id = self.profiles.resolve(parts[0])
+        except:
+            self.send(chat_id, "❌ Неверный ID")
+            return
+        
+        seconds = parse_duration(parts[1])
+        if not seconds:
+            self.send(chat_id, "❌ Неверное время. Пример: 30м, 2ч, 1д")
+            return
+        
+        until = time.time() + seconds
+        store.set_restriction('banned', target_id, chat_id, until)
+        self.sanctions.add(BAN, chat_id, target_id, until)
+        self.audit.emit(chat_id, user_id, "ban", target_id, seconds=seconds)
+        self.kick(chat_id, target_id)
+        self.send(chat_id, f"⛔ Пользователь {self.profiles.mention(target_id)} забанен на {format_duration(seconds)}")
     
     def cmd_stats(self, event, args):
         chat_id = event.chat_id
-        self.send(chat_id, f"📊 Чат #{chat_id}\n👑 Бот Orbit Manager v1.0")
+        user_id = event.object.message['from_id']
+        stats = self.activity.summary(chat_id, user_id)
+        self.send(chat_id,
+            f"📊 Чат #{chat_id}\n"
+            f"💬 Сообщений: {stats['total']} (сегодня {stats['today']}, за неделю {stats['week']})\n"
+            f"👥 Участников писало: {stats['members']} (сегодня {stats['active_today']})\n"
+            f"🙋 Ваших сообщений: {stats['user_total']} (сегодня {stats['user_today']})\n"
+            f"👑 Бот Orbit Manager v1.0"
+        )
     
     def cmd_top(self, event, args):
         chat_id = event.chat_id
-        self.send(chat_id, "🏆 Топ пользователей:\n1. [id1|User1]\n2. [id2|User2]\n3. [id3|User3]")
+        period, title = TOP_PERIODS.get(args.strip().lower(), TOP_PERIODS[""])
+        ranking = self.activity.top(chat_id, period)
+        if not ranking:
+            self.send(chat_id, f"🏆 Топ {title}: пока пусто")
+            return
+        names = self.profiles.mentions([uid for uid, _ in ranking])
+        lines = [f"{place}. {names[uid]} - {count}" for place, (uid, count) in enumerate(ranking, 1)]
+        self.send(chat_id, f"🏆 Топ {title}:\n" + "\n".join(lines))
+    
+    def cmd_settings(self, event, args):
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        settings = self.settings.get(chat_id)
+        
+        parts = args.split()
+        if not parts:
+            lines = []
+            for key in SETTING_KEYS:
+                value = getattr(settings, key)
+                if isinstance(value, bool):
+                    value = "вкл" if value else "выкл"
+                lines.append(f"{key}: {value}")
+            self.send(chat_id, "⚙️ Настройки чата:\n" + "\n".join(lines) +
+                "\n\nИзменить: !настройки [ключ] [значение]")
+            return
+        
+        if store.get_user_level(user_id, chat_id) < 5:
+            self.send(chat_id, "❌ Требуется уровень 5+")
+            return
+        
+        if len(parts) < 2:
+            self.send(chat_id, "❌ Формат: !настройки [ключ] [значение]\nПример: !настройки antimat выкл")
+            return
+        
+        key = parts[0].lower()
+        try:
+            value = parse_value(key, parts[1])
+        except KeyError:
+            self.send(chat_id, f"❌ Неизвестная настройка: {key}")
+            return
+        except ValueError:
+            self.send(chat_id, f"❌ Недопустимое значение для {key}")
+            return
+        
+        self.settings.update(chat_id, **{key: value})
+        self.audit.emit(chat_id, user_id, "settings", key=key, value=value)
+        self.send(chat_id, f"✅ {key} = {parts[1]}")
+    
+    def cmd_history(self, event, args):
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        
+        if store.get_user_level(user_id, chat_id) < 3:
+            self.send(chat_id, "❌ Требуется уровень 3+")
+            return
+        
+        target_id = before_id = None
+        try:
+            for token in args.split():
+                if token.startswith("#"):
+                    before_id = int(token[1:])
+                else:
+                    target_id = self.profiles.resolve(token)
+        except ValueError:
+            self.send(chat_id, "❌ Формат: !история [@user] [#номер]")
+            return
+        
+        entries = self.audit.history(chat_id, target_id, before_id)
+        if not entries:
+            self.send(chat_id, "📜 Записей нет")
+            return
+        
+        names = self.profiles.mentions(
+            {uid for entry in entries for uid in (entry['actor_id'], entry['target_id']) if uid}
+        )
+        lines = []
+        for entry in entries:
+            line = f"#{entry['id']} {entry['timestamp']} {entry['action']}"
+            if entry['actor_id']:
+                line += f" от {names[entry['actor_id']]}"
+            if entry['target_id']:
+                line += f" → {names[entry['target_id']]}"
+            if entry['details']:
+                line += " (" + ", ".join(f"{k}={v}" for k, v in entry['details'].items()) + ")"
+            lines.append(line)
+        more = f"{PREFIX}история" + (f" {target_id}" if target_id else "") + f" #{entries[-1]['id']}"
+        self.send(chat_id, "📜 Журнал:\n" + "\n".join(lines) + f"\n\nДальше: {more}")
+    
+    def cmd_custom_list(self, event, args):
+        chat_id = event.chat_id
+        commands = sorted(self.router.custom_commands(chat_id))
+        if not commands:
+            self.send(chat_id, "📝 Своих команд пока нет. Добавить: !команда+ [имя] [ответ]")
+            return
+        self.send(chat_id, "📝 Команды чата:\n" + "\n".join(f"{PREFIX}{name}" for name in commands))
+    
+    def cmd_custom_add(self, event, args):
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        
+        if store.get_user_level(user_id, chat_id) < 5:
+            self.send(chat_id, "❌ Требуется уровень 5+")
+            return
+        
+        parts = args.split(maxsplit=1)
+        if len(parts) < 2 or not CUSTOM_NAME_RE.match(parts[0]):
+            self.send(chat_id, "❌ Формат: !команда+ [имя] [ответ]\nПример: !команда+ правила Не спамить")
+            return
+        
+        name = parts[0].lower()
+        if self.router.is_builtin(name):
+            self.send(chat_id, f"❌ {PREFIX}{name} - встроенная команда")
+            return
+        
+        self.router.set_custom(chat_id, name, parts[1], user_id)
+        self.audit.emit(chat_id, user_id, "custom_command", name=name)
+        self.send(chat_id, f"✅ Команда {PREFIX}{name} сохранена")
+    
+    def cmd_custom_delete(self, event, args):
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        
+        if store.get_user_level(user_id, chat_id) < 5:
+            self.send(chat_id, "❌ Требуется уровень 5+")
+            return
+        
+        name = args.strip().lower()
+        if not name or not self.router.delete_custom(chat_id, name):
+            self.send(chat_id, "❌ Такой команды нет")
+            return
+        self.audit.emit(chat_id, user_id, "custom_command_delete", name=name)
+        self.send(chat_id, f"🗑 Команда {PREFIX}{name} удалена")
     
     # ========== DEV КОМАНДЫ ==========
     def dev_update(self, event, args):
@@ -332,6 +639,9 @@ class OrbitBot:
                 chat_id=chat_id,
                 member_id=-int(GROUP_ID)
             )
+            store.leave_chat(chat_id)
+            self.known_chats.discard(chat_id)
+            self.audit.emit(chat_id, user_id, "dev_leave", from_chat=event.chat_id)
             self.send(event.chat_id, f"✅ Бот вышел из чата {chat_id}")
         except Exception as e:
             self.send(event.chat_id, f"❌ Ошибка: {e}")
@@ -346,91 +656,714 @@ class OrbitBot:
             f"✅ Активен\n"
             f"👑 DEV: {DEV_IDS}\n"
             f"📊 Группа: {GROUP_ID}\n"
-            f"🕐 Время: {datetime.now()}"
+            f"🕐 Время: {datetime.now()}\n"
+            f"{self.dispatcher_report()}"
         )
         self.send(event.chat_id, status)
     
+    def dev_broadcast(self, event, args):
+        user_id = event.object.message['from_id']
+        if user_id not in DEV_IDS:
+            return
+        
+        text = args.strip()
+        if not text:
+            self.send(event.chat_id, "❌ Формат: !!рассылка текст")
+            return
+        
+        job_id = store.create_job(BROADCAST, {"text": text, "salt": new_salt()}, user_id, event.chat_id)
+        self.fanout.wake()
+        self.send(event.chat_id,
+            f"📣 Рассылка #{job_id} запущена: {store.count_active_chats()} чатов\n"
+            f"Остановить: !!отмена {job_id}")
+    
+    def dev_global_ban(self, event, args):
+        user_id = event.object.message['from_id']
+        if user_id not in DEV_IDS:
+            return
+        
+        parts = args.split()
+        if len(parts) < 2:
+            self.send(event.chat_id, "❌ Формат: !!глобан [id] [время]\nПример: !!глобан 123456789 30д")
+            return
+        
+        try:
+            target_id = self.profiles.resolve(parts[0])
+        except ValueError:
+            self.send(event.chat_id, "❌ Неверный ID")
+            return
+        if target_id in DEV_IDS:
+            self.send(event.chat_id, "❌ Нельзя забанить разработчика")
+            return
+        
+        seconds = parse_duration(parts[1])
+        if not seconds:
+            self.send(event.chat_id, "❌ Неверное время. Пример: 30м, 2ч, 1д")
+            return
+        
+        payload = {"user_id": target_id, "until": time.time() + seconds, "seconds": seconds}
+        job_id = store.create_job(GLOBAL_BAN, payload, user_id, event.chat_id)
+        self.fanout.wake()
+        self.send(event.chat_id,
+            f"⛔ Глобальный бан #{job_id}: {self.profiles.mention(target_id)} на {format_duration(seconds)} "
+            f"в {store.count_active_chats()} чатах\nОстановить: !!отмена {job_id}")
+    
+    def dev_cancel(self, event, args):
+        user_id = event.object.message['from_id']
+        if user_id not in DEV_IDS:
+            return
+        
+        try:
+            job_id = int(args.strip().lstrip('#'))
+        except ValueError:
+            self.send(event.chat_id, "❌ Укажите номер задачи")
+            return
+        
+        if store.cancel_job(job_id):
+            self.fanout.wake()
+            self.send(event.chat_id, f"🛑 Задача #{job_id} остановлена")
+        else:
+            self.send(event.chat_id, f"❌ Нет активной задачи #{job_id}")
+    
+    # ========== РАССЫЛКИ ПО ЧАТАМ ==========
+    def fanout_broadcast(self, job, chat_ids):
+        return [
+            self.sender.send(chat_id, job.payload["text"], random_id=random_id(job, chat_id))
+            for chat_id in chat_ids
+        ]
+    
+    def fanout_ban(self, job, chat_ids):
+        target_id = job.payload["user_id"]
+        until = job.payload["until"]
+        store.set_user_restriction('banned', target_id, chat_ids, until)
+        futures = []
+        for chat_id in chat_ids:
+            self.sanctions.add(BAN, chat_id, target_id, until)
+            self.audit.emit(chat_id, job.created_by, "ban", target_id, seconds=job.payload["seconds"], job=job.id)
+            futures.append(self.kick(chat_id, target_id))
+        return futures
+    
+    def on_fanout_done(self, job, done, failed):
+        errors = f", ошибок {failed}" if failed else ""
+        if job.kind == BROADCAST:
+            text = f"📣 Рассылка #{job.id} завершена: доставлено в {done} чатов{errors}"
+        else:
+            text = f"⛔ Глобальный бан #{job.id} завершен: {done} чатов{errors}"
+        self.send(job.from_chat, text)
+    
+    # ========== МАССОВЫЕ ДЕЙСТВИЯ ==========
+    def mass_targets(self, event, tokens):
+        """Цели массовой команды, которые по уровню ниже вызвавшего.
+        
+        Уровни всех целей берутся одним запросом. None - если команда отклонена.
+        """
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        level = store.get_user_level(user_id, chat_id)
+        if level < 4:
+            self.send(chat_id, "❌ Требуется уровень 4+")
+            return None
+        
+        try:
+            targets = parse_targets(tokens, self.joins, chat_id, self.profiles.resolve_many)
+        except ValueError as e:
+            self.send(chat_id, f"❌ {e}")
+            return None
+        
+        levels = store.get_user_levels(targets, chat_id)
+        allowed = [t for t in targets if t != user_id and levels[t] < level]
+        skipped = len(targets) - len(allowed)
+        if not allowed:
+            self.send(chat_id, "❌ Нет подходящих пользователей")
+            return None
+        return allowed, skipped
+    
+    @staticmethod
+    def skipped_note(skipped):
+        return f", пропущено {skipped} (уровень не ниже вашего)" if skipped else ""
+    
+    def cmd_mass_kick(self, event, args):
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        selected = self.mass_targets(event, args.split())
+        if selected is None:
+            return
+        targets, skipped = selected
+        
+        def done(ok, failed):
+            errors = f", ошибок {failed}" if failed else ""
+            self.send(chat_id, f"👢 Массовый кик: исключено {ok}/{len(targets)}{errors}{self.skipped_note(skipped)}")
+        
+        self.send(chat_id, f"⏳ Исключаю {len(targets)} пользователей...")
+        progress = BulkProgress(len(targets), lambda text: self.send(chat_id, text), done)
+        # Sender собирает вызовы в пачки execute по 25
+        for target_id in targets:
+            progress.track(self.kick(chat_id, target_id))
+            self.audit.emit(chat_id, user_id, "kick", target_id, bulk=True)
+    
+    def cmd_mass_mute(self, event, args):
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        tokens = args.split()
+        seconds = parse_duration(tokens[0]) if tokens else None
+        if not seconds:
+            self.send(chat_id, "❌ Формат: !массмут 30м id1 id2 ... или !массмут 30м новые 10м")
+            return
+        selected = self.mass_targets(event, tokens[1:])
+        if selected is None:
+            return
+        targets, skipped = selected
+        
+        until = time.time() + seconds
+        store.set_restrictions('muted', targets, chat_id, until)
+        for target_id in targets:
+            self.sanctions.add(MUTE, chat_id, target_id, until)
+            self.audit.emit(chat_id, user_id, "mute", target_id, seconds=seconds, bulk=True)
+        self.send(chat_id,
+            f"🔇 Массовый мут на {format_duration(seconds)}: {len(targets)} пользователей"
+            f"{self.skipped_note(skipped)}")
+    
+    def cmd_mass_warn(self, event, args):
+        chat_id = event.chat_id
+        user_id = event.object.message['from_id']
+        selected = self.mass_targets(event, args.split())
+        if selected is None:
+            return
+        targets, skipped = selected
+        
+        settings = self.settings.get(chat_id)
+        now = time.time()
+        until = now + settings.mute_duration
+        expire_at = now + settings.warn_expire_hours * 3600
+        with self.warn_lock(chat_id, targets):
+            # Варны, обнуление и муты достигших лимита - одной транзакцией
+            with store.pool.transaction():
+                warns = store.add_warns(targets, chat_id)
+                muted = [t for t in targets if warns.get(t, 0) >= settings.max_warns]
+                for target_id in muted:
+                    store.reset_warns(target_id, chat_id)
+                if muted:
+                    store.set_restrictions('muted', muted, chat_id, until)
+            
+            for target_id in targets:
+                self.audit.emit(chat_id, user_id, "warn", target_id, bulk=True)
+                self.sanctions.expire_warn_at(chat_id, target_id, expire_at)
+            for target_id in muted:
+                # После варнов: сброс в логе должен идти позже израсходованных варнов
+                self.audit.emit(chat_id, user_id, "warns_reset", target_id, bulk=True)
+                self.sanctions.clear_warns(chat_id, target_id)
+                self.sanctions.add(MUTE, chat_id, target_id, until)
+                self.audit.emit(chat_id, user_id, "mute", target_id, seconds=settings.mute_duration, bulk=True)
+        
+        report = f"⚠️ Массовый варн: {len(targets)} пользователей{self.skipped_note(skipped)}"
+        if muted:
+            report += f"\n🔇 Достигли {settings.max_warns} варнов и замьючены: {len(muted)}"
+        self.send(chat_id, report)
+    
     # ========== СЛУЖЕБНЫЕ ФУНКЦИИ ==========
-    def send(self, chat_id, text):
+    def send(self, chat_id, text, wait=False):
+        """Поставить сообщение в очередь отправки.
+        
+        С wait=True дожидается доставки и возвращает id сообщения (или None).
+        """
+        future = self.sender.send(chat_id, text)
+        future.add_done_callback(self._report_send)
+        if not wait:
+            return future
         try:
-            self.vk.messages.send(
-                chat_id=chat_id,
-                message=text,
-                random_id=get_random_id()
-            )
-        except Exception as e:
-            print(f"❌ Ошибка отправки: {e}")
-    
-    def parse_command(self, text):
-        text = text.strip()
-        if text.startswith(DEV_PREFIX):
-            prefix = DEV_PREFIX
-            text = text[len(DEV_PREFIX):].strip()
-            is_dev = True
-        elif text.startswith(PREFIX):
-            prefix = PREFIX
-            text = text[len(PREFIX):].strip()
-            is_dev = False
+            return future.result(timeout=60)
+        except Exception:
+            return None
+    
+    def _report_send(self, future):
+        if future.exception() is not None:
+            print(f"❌ Ошибка отправки: {future.exception()}")
+    
+    def kick(self, chat_id, user_id):
+        return self.sender.call("messages.removeChatUser", {"chat_id": chat_id, "user_id": user_id})
+    
+    def mute_user(self, chat_id, user_id, seconds, by=0):
+        until = time.time() + seconds
+        store.set_restriction('muted', user_id, chat_id, until)
+        self.sanctions.add(MUTE, chat_id, user_id, until)
+        self.audit.emit(chat_id, by, "mute", user_id, seconds=seconds)
+    
+    @contextmanager
+    def warn_lock(self, chat_id, user_ids):
+        """Замки варнов пользователей чата.
+        
+        Выдача варна и сброс по лимиту (БД, лог, таймеры) идут под ним целиком:
+        варн, выданный параллельно другим воркером, не попадет в израсходованные.
+        Полосы берутся по возрастанию, поэтому массовые команды не блокируют друг друга.
+        """
+        stripes = sorted({hash((chat_id, user_id)) % WARN_LOCK_STRIPES for user_id in user_ids})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._warn_locks[stripe])
+            yield
+    
+    def warn_user(self, chat_id, user_id, by=0):
+        """Выдать варн; при достижении max_warns - мут на mute_duration"""
+        settings = self.settings.get(chat_id)
+        with self.warn_lock(chat_id, (user_id,)):
+            warns = store.add_warn(user_id, chat_id)
+            self.audit.emit(chat_id, by, "warn", user_id)
+            self.sanctions.expire_warn_at(chat_id, user_id, time.time() + settings.warn_expire_hours * 3600)
+            if warns >= settings.max_warns:
+                store.reset_warns(user_id, chat_id)
+                self.audit.emit(chat_id, by, "warns_reset", user_id)
+                self.sanctions.clear_warns(chat_id, user_id)
+        
+        if warns >= settings.max_warns:
+            self.mute_user(chat_id, user_id, settings.mute_duration, by)
+            self.send(chat_id,
+                f"🔇 [id{user_id}|Пользователь] получил {warns}/{settings.max_warns} предупреждений "
+                f"и замьючен на {format_duration(settings.mute_duration)}")
         else:
-            return None, None, False
+            self.send(chat_id, f"⚠️ Пользователю {self.profiles.mention(user_id)} выдано предупреждение ({warns}/{settings.max_warns})")
+    
+    def owns_chat(self, chat_id):
+        return self.shard is None or chat_id % self.shard[1] == self.shard[0]
+    
+    def load_sanctions(self):
+        """Поднять действующие муты, баны и варны из БД при старте"""
+        for user_id, chat_id, muted_until, banned_until in store.load_restrictions():
+            if not self.owns_chat(chat_id):
+                continue
+            if muted_until:
+                self.sanctions.add(MUTE, chat_id, user_id, muted_until)
+            if banned_until:
+                self.sanctions.add(BAN, chat_id, user_id, banned_until)
+        # Берем максимально возможный срок, точный срок чата применяется при планировании
+        lookback = MAX_VALUES["warn_expire_hours"] * 3600
+        for user_id, chat_id, issued in store.load_active_warns(lookback):
+            if not self.owns_chat(chat_id):
+                continue
+            expire = self.settings.get(chat_id).warn_expire_hours * 3600
+            self.sanctions.expire_warn_at(chat_id, user_id, issued + expire)
+        counts = self.sanctions.counts()
+        print(f"✅ Ограничения загружены: мутов {counts['mutes']}, банов {counts['bans']}")
+    
+    def restore_state(self):
+        """Теплый старт из снимка. False - снимка нет, состояние строится из БД"""
+        if not self.snapshots:
+            return False
+        started = time.perf_counter()
+        state = snapshot.load(self.snapshots.path)
+        if state is None:
+            return False
+        age = time.time() - state['created']
+        if age > SNAPSHOT_MAX_AGE:
+            print(f"⚠️  Снимок устарел ({age / 60:.0f} мин), загрузка из БД")
+            return False
+        # При другом числе шардов часть чатов снимка ушла в другие шарды, а
+        # свои чаты лежат в чужих снимках: санкции и счетчики берем из БД
+        if state['shard'] != self.snapshots.shard:
+            print(f"⚠️  Снимок другой раскладки шардов {state['shard']}, загрузка из БД")
+            return False
+        
+        store.perm_cache.load(e for e in state['perms'] if self.owns_chat(e[1]))
+        self.flood.load(e for e in state['flood'] if self.owns_chat(e[0]))
+        self.sanctions.load(e for e in state['sanctions'] if self.owns_chat(e[1]))
+        self.activity.load([e for e in state['activity'] if self.owns_chat(e[0])])
+        self.longpoll_ts = self.snapshot_ts = state['ts']
+        counts = self.sanctions.counts()
+        print(
+            f"✅ Состояние восстановлено из снимка ({age:.0f} с назад) за "
+            f"{(time.perf_counter() - started) * 1000:.0f} мс: прав {len(state['perms'])}, "
+            f"мутов {counts['mutes']}, банов {counts['bans']}"
+        )
+        return True
+    
+    @contextmanager
+    def quiesced(self):
+        """Точка между пачками long poll: события до longpoll_ts обработаны, новых нет.
         
-        parts = text.split(maxsplit=1)
-        command = parts[0].lower()
-        args = parts[1] if len(parts) > 1 else ""
+        Значение False - очередь не опустела за отведенное время. Асинхронный
+        режим подменяет метод своей реализацией (AsyncRuntime.quiesced).
+        """
+        with self._batch_lock, self.dispatcher.paused() as drained:
+            yield drained
+    
+    def capture_state(self):
+        """(ts, разделы) для снимка или None, если согласованной точки не дождались.
         
-        return command, args, is_dev
+        Разделы снимаются между пачками при пустой очереди: в них нет последствий
+        событий новее ts, и после падения ни одно событие не обработается дважды.
+        """
+        with self.quiesced() as drained:
+            if not drained:
+                return None
+            self.snapshot_ts = self.longpoll_ts
+            sections = {
+                "perms": store.perm_cache.dump(),
+                "flood": self.flood.dump(),
+                "sanctions": self.sanctions.dump(),
+                "activity": self.activity.dump(),
+            }
+        return self.snapshot_ts, sections
     
-    def run(self):
-        print("🚀 Бот запущен! Ожидание сообщений...")
-        print("Для остановки: Ctrl+C")
+    def on_sanction_expire(self, kind, chat_id, user_id):
+        if kind == MUTE:
+            store.set_restriction('muted', user_id, chat_id, None)
+            self.send(chat_id, f"🔊 У [id{user_id}|пользователя] закончился мут")
+        elif kind == BAN:
+            store.set_restriction('banned', user_id, chat_id, None)
+        elif kind == WARN:
+            store.expire_warn(user_id, chat_id)
+        elif kind == LOCKDOWN:
+            self.check_lockdown(chat_id)
+    
+    def delete_message(self, msg):
+        return self.sender.call("messages.delete", {
+            "peer_id": msg['peer_id'],
+            "cmids": msg['conversation_message_id'],
+            "delete_for_all": 1,
+        })
+    
+    def check_sanctions(self, chat_id, user_id, msg):
+        """Муты и баны. True - сообщение не обрабатываем дальше"""
+        action = msg.get('action')
+        if action and action.get('type') in JOIN_ACTIONS:
+            member_id = action.get('member_id', user_id)
+            if self.sanctions.is_banned(chat_id, member_id):
+                self.kick(chat_id, member_id)
+                self.send(chat_id, f"⛔ [id{member_id}|Пользователь] забанен в этом чате")
+                return True
         
-        while True:
-            try:
-                for event in self.longpoll.listen():
-                    if event.type == VkBotEventType.MESSAGE_NEW and event.from_chat:
-                        msg = event.object.message
-                        chat_id = event.chat_id
-                        user_id = msg['from_id']
-                        text = msg.get('text', '').strip()
-                        
-                        print(f"[{chat_id}] {user_id}: {text}")
-                        
-                        command, args, is_dev = self.parse_command(text)
-                        
-                        if command:
-                            if is_dev:
-                                if user_id in DEV_IDS and command in self.dev_commands:
-                                    self.dev_commands[command](event, args)
-                            else:
-                                if command in self.commands:
-                                    self.commands[command](event, args)
-                    
-                    elif event.type == VkBotEventType.GROUP_JOIN:
-                        chat_id = event.object['peer_id'] - 2000000000
-                        print(f"✅ Бота добавили в чат {chat_id}")
-                        self.send(chat_id, "👋 Orbit Manager добавлен! Напишите !старт")
-                    
-                    elif event.type == VkBotEventType.GROUP_LEAVE:
-                        chat_id = event.object['peer_id'] - 2000000000
-                        print(f"❌ Бота исключили из чата {chat_id}")
+        if self.sanctions.is_muted(chat_id, user_id):
+            self.delete_message(msg)
+            return True
+        return False
+    
+    def check_raid(self, chat_id, member_id):
+        """Всплеск вступлений включает режим защиты: новые участники получают мут.
+        
+        Модераторы (уровень 3+) и разработчики мут не получают.
+        """
+        settings = self.settings.get(chat_id)
+        if not settings.antiraid:
+            return
+        if self.raids.observe(chat_id, settings.raid_joins, settings.raid_window) == RAID_START:
+            self.start_lockdown(chat_id, settings)
+        elif self.raids.is_locked(chat_id) and store.get_user_level(member_id, chat_id) < 3:
+            self.mute_user(chat_id, member_id, settings.mute_duration)
+    
+    def start_lockdown(self, chat_id, settings):
+        now = time.time()
+        # Мутим и тех, кто вошел в окне до срабатывания
+        burst = self.joins.since(chat_id, settings.raid_window, now)
+        levels = store.get_user_levels(burst, chat_id)
+        muted = [user_id for user_id in burst if levels[user_id] < 3]
+        until = now + settings.mute_duration
+        store.set_restrictions('muted', muted, chat_id, until)
+        for user_id in muted:
+            self.sanctions.add(MUTE, chat_id, user_id, until)
+        self.sanctions.schedule(LOCKDOWN, chat_id, 0, now + settings.raid_window)
+        self.audit.emit(chat_id, 0, "lockdown", joins=len(burst), window=settings.raid_window)
+        print(f"🚨 Рейд в чате {chat_id}: {len(burst)} вступлений за {settings.raid_window} с")
+        self.send(chat_id,
+            f"🚨 Обнаружен рейд: {len(burst)} вступлений за {format_duration(settings.raid_window)}.\n"
+            f"🔒 Режим защиты: новые участники получают мут на {format_duration(settings.mute_duration)}.\n"
+            f"Исключить вошедших: !масскик новые {max(1, settings.raid_window // 60)}м")
+    
+    def check_lockdown(self, chat_id):
+        """Таймер режима защиты: снять, если вступления утихли, иначе проверить позже"""
+        settings = self.settings.get(chat_id)
+        if self.raids.release(chat_id, settings.raid_joins, settings.raid_window):
+            self.audit.emit(chat_id, 0, "unlock")
+            self.send(chat_id, "🔓 Режим защиты снят: поток вступлений нормализовался")
+        else:
+            self.sanctions.schedule(LOCKDOWN, chat_id, 0, time.time() + settings.raid_window)
+    
+    def check_flood(self, chat_id, user_id):
+        """Антифлуд. True - сообщение не обрабатываем дальше"""
+        settings = self.settings.get(chat_id)
+        if not settings.antiflood:
+            return False
+        verdict = self.flood.check(
+            chat_id, user_id,
+            settings.flood_limit, settings.flood_window, settings.max_warns
+        )
+        if verdict is None:
+            return False
+        # Модераторов не наказываем; уровень берется из кеша прав
+        if store.get_user_level(user_id, chat_id) >= 3:
+            return False
+        
+        action, strikes = verdict
+        if action == FLOOD_SUPPRESS:
+            # Флуд в том же окне: без нового наказания, но и без команд и фильтров
+            return True
+        if action == FLOOD_MUTE:
+            duration = settings.mute_duration
+            self.mute_user(chat_id, user_id, duration)
+            self.send(chat_id, f"🔇 [id{user_id}|Пользователь] замьючен на {format_duration(duration)} за флуд")
+        else:
+            self.audit.emit(chat_id, 0, "flood_warn", user_id, strike=strikes)
+            self.send(chat_id, f"⚠️ [id{user_id}|Не флудите]! Предупреждение {strikes}/{settings.max_warns}")
+        return True
+    
+    def check_content(self, chat_id, user_id, text, msg):
+        """Антимат, антиссылки, антикапс и антимедиа за один проход. True - сообщение удалено"""
+        content_filter = self.settings.get(chat_id).content_filter
+        if not content_filter.enabled:
+            return False
+        hit = content_filter.scan(text, msg.get('attachments'))
+        if hit is None or store.get_user_level(user_id, chat_id) >= 3:
+            return False
+        
+        self.delete_message(msg)
+        self.audit.emit(chat_id, 0, "filter", user_id, kind=hit.kind)
+        if hit.kind == FILTER_MAT:
+            self.send(chat_id, f"🤬 [id{user_id}|Пользователь], без мата!")
+        elif hit.kind == FILTER_LINK:
+            self.send(chat_id, f"🔗 [id{user_id}|Пользователь], ссылки запрещены")
+        elif hit.kind == FILTER_CAPS:
+            self.send(chat_id, f"🔠 [id{user_id}|Пользователь], не пишите капсом")
+        elif hit.kind == FILTER_RUN:
+            self.send(chat_id, f"🔁 [id{user_id}|Пользователь], не растягивайте слова")
+        else:
+            self.send(chat_id, f"📎 [id{user_id}|Пользователь], вложения в этом чате запрещены")
+        return True
+    
+    def dispatcher_report(self):
+        state = self.dispatcher.status()
+        report = (
+            f"📥 Очередь: {state['depth']}/{state['max_pending']} "
+            f"(пик {state['peak_depth']})\n"
+            f"⚙️ Воркеров: {state['workers']}, чатов в работе: {state['active_chats']}\n"
+            f"✉️ Обработано событий: {state['processed']}"
+        )
+        stats = self.dispatcher.stats.snapshot()
+        for name, (count, avg, peak) in sorted(stats.items()):
+            report += f"\n⏱ {name}: {count} шт, ср {avg * 1000:.1f} мс, макс {peak * 1000:.1f} мс"
+        raids = self.raids.stats()
+        report += f"\n🚨 Рейдов: {raids['raids']}, в режиме защиты: {raids['locked']}"
+        counts = self.sanctions.counts()
+        report += f"\n🔇 Мутов: {counts['mutes']}, ⛔ банов: {counts['bans']}, таймеров: {counts['timers']}"
+        settings = self.settings.stats()
+        report += f"\n⚙️ Настроек в памяти: {settings['chats']} (промахов {settings['misses']})"
+        cache = store.perm_cache.stats()
+        report += (
+            f"\n🗂 Кеш прав: {cache['size']}/{cache['maxsize']}, "
+            f"попаданий {cache['hit_rate']:.1%} ({cache['hits']}/{cache['hits'] + cache['misses']})"
+        )
+        profiles = self.profiles.stats()
+        report += (
+            f"\n🪪 Профилей в памяти: {profiles['size']}, попаданий {profiles['hit_rate']:.1%}, "
+            f"запросов users.get: {profiles['api_calls']}"
+        )
+        if self.snapshots:
+            report += (
+                f"\n💾 Снимков: {self.snapshots.saved}, последний {self.snapshots.last_size // 1024} КБ "
+                f"за {self.snapshots.last_duration * 1000:.0f} мс"
+            )
+        fanout = self.fanout.status()
+        if fanout['jobs']:
+            report += f"\n📣 Задачи по чатам: {fanout['chats_per_sec']:.1f} чат/с за минуту"
+            for job in fanout['jobs']:
+                report += (
+                    f"\n  #{job['id']} {FANOUT_NAMES[job['kind']]}: {job['done'] + job['failed']}/{job['total']} "
+                    f"(ошибок {job['failed']}), {job['rate']:.1f} чат/с"
+                )
+        sender = self.sender.status()
+        report += (
+            f"\n📤 Отправка: в очереди {sender['pending']}, доставлено {sender['sent']}, "
+            f"ошибок {sender['failed']}, повторов {sender['retried']}, запросов {sender['requests']}"
+        )
+        return report
+    
+    def register_metrics(self):
+        """Показатели кешей и очередей, вычисляемые в момент сбора /metrics"""
+        def hit_ratio():
+            settings = self.settings.stats()
+            lookups = settings['hits'] + settings['misses']
+            return {
+                "permissions": store.perm_cache.stats()['hit_rate'],
+                "settings": settings['hits'] / lookups if lookups else 0.0,
+                "profiles": self.profiles.stats()['hit_rate'],
+            }
+        
+        registry = metrics.REGISTRY
+        registry.gauge("orbit_cache_hit_ratio", "Доля попаданий в кеши", ("cache",), hit_ratio)
+        registry.gauge("orbit_queue_depth", "Событий в очереди диспетчера",
+                       callback=lambda: self.dispatcher.status()['depth'])
+        registry.gauge("orbit_sender_pending", "Вызовов VK API в очереди отправки",
+                       callback=self.sender.pending)
+        registry.gauge("orbit_message_log_dropped", "Записей журнала, отброшенных при переполнении",
+                       callback=lambda: self.message_log.dropped)
+    
+    @staticmethod
+    def event_key(event):
+        """Ключ упорядочивания: события одного чата идут строго по очереди"""
+        if getattr(event, 'chat_id', None) is not None:
+            return event.chat_id
+        peer_id = event.object.get('peer_id', 0)
+        return peer_id - 2000000000 if peer_id > 2000000000 else peer_id
+    
+    def handle_event(self, event):
+        metrics.EVENTS.inc(getattr(event.type, 'value', event.type))
+        if event.type == VkBotEventType.MESSAGE_NEW and event.from_chat:
+            msg = event.object.message
+            chat_id = event.chat_id
+            user_id = msg['from_id']
+            text = msg.get('text', '').strip()
+            
+            # Добавление и исключение бота приходят служебными сообщениями чата
+            action = msg.get('action') or {}
+            if action.get('member_id') == -GROUP_ID:
+                if action.get('type') == 'chat_invite_user':
+                    print(f"✅ Бота добавили в чат {chat_id}")
+                    store.touch_chat(chat_id)
+                    self.known_chats.add(chat_id)
+                    self.send(chat_id, "👋 Orbit Manager добавлен! Напишите !старт")
+                elif action.get('type') == 'chat_kick_user':
+                    print(f"❌ Бота исключили из чата {chat_id}")
+                    store.leave_chat(chat_id)
+                    self.known_chats.discard(chat_id)
+                return
+            
+            if chat_id not in self.known_chats:
+                self.known_chats.add(chat_id)
+                store.touch_chat(chat_id)
+            self.message_log.message(chat_id, user_id, text)
+            self.activity.record(chat_id, user_id)
+            store.record_message(user_id, chat_id)
+            
+            if action.get('type') in JOIN_ACTIONS:
+                member_id = action.get('member_id', user_id)
+                self.joins.record(chat_id, member_id)
+                self.check_raid(chat_id, member_id)
+            
+            if self.check_sanctions(chat_id, user_id, msg):
+                return
+            
+            if self.check_flood(chat_id, user_id):
+                return
             
-            except vk_api.exceptions.ApiError as e:
-                if "invalid access_token" in str(e):
-                    print("❌ НЕВЕРНЫЙ ТОКЕН! Проверьте BOT_TOKEN в Render")
-                    print("Получите новый токен в настройках группы ВК")
-                    sys.exit(1)
-                print(f"⚠️  Ошибка VK API: {e}")
-                time.sleep(5)
+            if self.check_content(chat_id, user_id, text, msg):
+                return
             
+            match = self.router.route(chat_id, text)
+            if match is None:
+                return
+            
+            route, args = match
+            if isinstance(route, CustomCommand):
+                self.send(chat_id, route.response)
+            elif not route.dev or user_id in DEV_IDS:
+                with self.dispatcher.stats.timed(route.label):
+                    route.handler(event, args)
+    
+    def use_api(self, session):
+        """Подменить транспорт VK API (объект с методом method, как у VkApi)"""
+        self.vk_session = session
+        self.vk = VkApiMethod(session)
+        self.sender.vk_session = session
+    
+    def start_services(self, dispatcher=True):
+        self.message_log.start()
+        if METRICS_PORT:
+            # Шарды слушают соседние порты: PORT+1, PORT+2, ...
+            port = METRICS_PORT + (self.shard[0] + 1 if self.shard else 0)
+            try:
+                self.metrics_server = metrics.serve(port)
+                print(f"✅ Метрики: http://0.0.0.0:{port}/metrics")
+            except OSError as e:
+                print(f"⚠️  Не удалось запустить /metrics на порту {port}: {e}")
+        self.sender.start()
+        self.profiles.start()
+        self.fanout.start()
+        self.sanctions.start()
+        if self.snapshots:
+            self.snapshots.start()
+        self.audit.start()
+        if dispatcher:
+            self.dispatcher.start()
+    
+    def stop_services(self):
+        self.dispatcher.stop()
+        if self.snapshots:
+            self.snapshots.stop()
+            try:
+                self.snapshots.save_now()
             except Exception as e:
-                print(f"⚠️  Ошибка: {e}")
-                time.sleep(5)
+                print(f"⚠️  Не удалось сохранить снимок: {e}")
+        self.fanout.stop()
+        self.sanctions.stop()
+        self.audit.stop()
+        self.profiles.stop()
+        self.sender.stop()
+        store.close()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+        self.message_log.stop()
+    
+    def submit_batch(self, events, ts):
+        """Раздать пачку long poll воркерам и сдвинуть ts (снимок ждет конца пачки)"""
+        with self._batch_lock:
+            for event in events:
+                # Блокируется, если воркеры не успевают (backpressure)
+                self.dispatcher.submit(self.event_key(event), event)
+            self.longpoll_ts = ts
+    
+    def run(self):
+        print("🚀 Бот запущен! Ожидание сообщений...")
+        print("Для остановки: Ctrl+C")
+        
+        if self.longpoll_ts:
+            # Догоняем события, пришедшие после снимка
+            self.longpoll.ts = self.longpoll_ts
+            print(f"✅ Продолжаем long poll с ts={self.longpoll_ts}")
+        
+        self.start_services()
+        try:
+            while True:
+                try:
+                    events = self.longpoll.check()
+                    self.submit_batch(events, self.longpoll.ts)
+                
+                except vk_api.exceptions.ApiError as e:
+                    if "invalid access_token" in str(e):
+                        print("❌ НЕВЕРНЫЙ ТОКЕН! Проверьте BOT_TOKEN в Render")
+                        print("Получите новый токен в настройках группы ВК")
+                        sys.exit(1)
+                    print(f"⚠️  Ошибка VK API: {e}")
+                    time.sleep(5)
+                
+                except Exception as e:
+                    print(f"⚠️  Ошибка: {e}")
+                    time.sleep(5)
+        finally:
+            self.stop_services()
 
 # ========== ЗАПУСК ==========
 if __name__ == "__main__":
+    # Render останавливает сервис через SIGTERM: выходим штатно, с сохранением снимка
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     try:
-        bot = OrbitBot()
-        bot.run()
+        if SHARDS > 1:
+            from sharding import ShardedRuntime
+            # Дочерние процессы читают DEV_IDS из окружения
+            os.environ["DEV_IDS"] = ",".join(map(str, DEV_IDS))
+            session = VkApiGroup(token=BOT_TOKEN)
+            ShardedRuntime(
+                OrbitBot,
+                lambda: VkBotLongPoll(session, GROUP_ID),
+                OrbitBot.event_key,
+                SHARDS,
+                LONGPOLL_CHECKPOINT,
+                QUEUE_SIZE,
+                METRICS_PORT,
+            ).run()
+        elif ASYNC_MODE:
+            from aio_runtime import AsyncRuntime
+            bot = OrbitBot(connect_longpoll=False)
+            AsyncRuntime(bot, BOT_TOKEN, GROUP_ID, WORKERS, QUEUE_SIZE).run()
+        else:
+            bot = OrbitBot()
+            bot.run()
     except KeyboardInterrupt:
         print("\n🛑 Бот остановлен")
     except Exception as e:
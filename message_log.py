@@ -0,0 +1,71 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись: время, уровень и поля из extra['fields']"""
+
+    def format(self, record):
+        data = {"ts": round(record.created, 3), "level": record.levelname, "msg": record.getMessage()}
+        data.update(getattr(record, "fields", {}))
+        return json.dumps(data, ensure_ascii=False)
+
+
+class MessageLog:
+    """Выборочный журнал входящих сообщений.
+
+    В лог попадает только доля sample_rate сообщений, а форматирование и
+    запись в stdout идут в отдельном потоке (QueueHandler/QueueListener),
+    поэтому воркеры не ждут вывода. Полный текст не пишется - только длина.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, stream=None, queue_size: int = 10000):
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+
+        self.logger = logging.getLogger("orbit.messages")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.handlers = [_DroppingQueueHandler(self._queue, self)]
+
+    def start(self):
+        self._listener.start()
+
+    def stop(self):
+        try:
+            self._listener.stop()
+        except AttributeError:
+            # Слушатель не был запущен
+            pass
+
+    def message(self, chat_id: int, user_id: int, text: str):
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return
+        self.logger.info("message", extra={"fields": {
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "length": len(text),
+            "sampled": self.sample_rate,
+        }})
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Не блокируется на полной очереди: запись отбрасывается и считается"""
+
+    def __init__(self, log_queue, owner):
+        super().__init__(log_queue)
+        self.owner = owner
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.owner.dropped += 1
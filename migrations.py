@@ -0,0 +1,194 @@
+import os
+import sqlite3
+
+# Версия схемы хранится в PRAGMA user_version; каждая миграция выполняется
+# в своей транзакции вместе с повышением версии, поэтому прерванный запуск
+# просто повторится со следующего старта.
+
+INITIAL_SCHEMA = (
+    # Чаты
+    '''CREATE TABLE IF NOT EXISTS chats (
+        chat_id INTEGER PRIMARY KEY,
+        owner_id INTEGER,
+        settings TEXT DEFAULT '{}',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    # Права пользователей
+    '''CREATE TABLE IF NOT EXISTS user_perms (
+        user_id INTEGER,
+        chat_id INTEGER,
+        level INTEGER DEFAULT 2,
+        warns INTEGER DEFAULT 0,
+        reputation INTEGER DEFAULT 0,
+        muted_until TIMESTAMP,
+        banned_until TIMESTAMP,
+        last_message TIMESTAMP,
+        message_count INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, chat_id)
+    )''',
+    # Логи действий
+    '''CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER,
+        user_id INTEGER,
+        action TEXT,
+        target_id INTEGER,
+        reason TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_logs_chat ON logs (chat_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_target ON logs (chat_id, target_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)",
+    # Дневная сводка по логам, ушедшим за срок хранения
+    '''CREATE TABLE IF NOT EXISTS logs_daily (
+        chat_id INTEGER,
+        day TEXT,
+        action TEXT,
+        count INTEGER DEFAULT 0,
+        PRIMARY KEY (chat_id, day, action)
+    )''',
+    # Кастомные команды
+    '''CREATE TABLE IF NOT EXISTS custom_commands (
+        chat_id INTEGER,
+        command TEXT,
+        response TEXT,
+        created_by INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (chat_id, command)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS profiles (
+        user_id INTEGER PRIMARY KEY,
+        first_name TEXT,
+        last_name TEXT,
+        screen_name TEXT,
+        updated REAL
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_profiles_screen_name ON profiles (screen_name)",
+)
+
+# Покрывающие индексы: частые запросы читают только индекс, без обращения к строкам
+COVERING_INDEXES = (
+    # Уровни прав пачкой: get_user_levels (chat_id = ? AND user_id IN ...)
+    "CREATE INDEX IF NOT EXISTS idx_perms_level ON user_perms (chat_id, user_id, level)",
+    # Рейтинг чата: load_message_counts для !топ
+    "CREATE INDEX IF NOT EXISTS idx_perms_messages ON user_perms (chat_id, message_count DESC, user_id)",
+    # Действующие муты и баны при старте; строк без срока в индексах нет
+    "CREATE INDEX IF NOT EXISTS idx_perms_muted ON user_perms (muted_until) WHERE muted_until IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_perms_banned ON user_perms (banned_until) WHERE banned_until IS NOT NULL",
+    # Пересчет варнов по логу: load_active_warns
+    "CREATE INDEX IF NOT EXISTS idx_logs_warns ON logs (action, chat_id, target_id, timestamp)",
+    "ANALYZE",
+)
+
+
+def import_legacy_users(conn, legacy_path: str, batch: int = 5000):
+    """Перенос таблицы users из старой orbit.db в user_perms.
+
+    Уровень берется из старой базы (там он и менялся), варны - наибольшие
+    из двух, остальные поля user_perms не трогаются. Строки читаются пачками.
+    """
+    if not legacy_path or not os.path.exists(legacy_path):
+        return 0
+    legacy = sqlite3.connect(f"file:{legacy_path}?mode=ro", uri=True)
+    moved = 0
+    try:
+        tables = {row[0] for row in legacy.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "users" in tables:
+            cursor = legacy.execute("SELECT user_id, chat_id, level, warns, muted_until FROM users")
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                conn.executemany('''
+                    INSERT INTO user_perms (user_id, chat_id, level, warns, muted_until)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, chat_id) DO UPDATE SET
+                        level = excluded.level,
+                        warns = MAX(warns, excluded.warns),
+                        muted_until = COALESCE(muted_until, excluded.muted_until)
+                ''', rows)
+                moved += len(rows)
+        if "chats" in tables:
+            conn.executemany('''
+                INSERT INTO chats (chat_id, owner_id) VALUES (?, ?)
+                ON CONFLICT (chat_id) DO UPDATE SET owner_id = COALESCE(owner_id, excluded.owner_id)
+            ''', legacy.execute("SELECT chat_id, owner_id FROM chats WHERE owner_id IS NOT NULL"))
+    finally:
+        legacy.close()
+    print(f"✅ Перенесено из {legacy_path}: {moved} записей прав")
+    return moved
+
+
+# Фоновые DEV-задачи по всем чатам и чаты, в которых состоит бот
+FANOUT_JOBS = (
+    "ALTER TABLE chats ADD COLUMN left_at TIMESTAMP",
+    # Чаты, известные до учета участия бота, считаем активными
+    "INSERT OR IGNORE INTO chats (chat_id) SELECT DISTINCT chat_id FROM user_perms",
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT,
+        payload TEXT,
+        created_by INTEGER,
+        from_chat INTEGER,
+        total INTEGER DEFAULT 0,
+        state TEXT DEFAULT 'running',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, id)",
+    # Контрольная точка задачи по шардам: чаты обходятся по возрастанию chat_id
+    '''CREATE TABLE IF NOT EXISTS job_progress (
+        job_id INTEGER,
+        shard INTEGER,
+        last_chat INTEGER DEFAULT 0,
+        done INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        finished INTEGER DEFAULT 0,
+        PRIMARY KEY (job_id, shard)
+    )''',
+)
+
+
+# Контрольные точки задач помнят число шардов: при другом числе их курсоры
+# не подходят и прогресс пересобирается (Database.load_jobs)
+JOB_PROGRESS_SHARDS = (
+    "ALTER TABLE job_progress ADD COLUMN shards INTEGER DEFAULT 1",
+    # Для уже начатых задач - сколько шардов успели записать прогресс
+    '''UPDATE job_progress SET shards = (
+        SELECT MAX(p.shard) + 1 FROM job_progress p WHERE p.job_id = job_progress.job_id
+    )''',
+)
+
+
+# (версия, описание, шаг): шаг - набор SQL или функция (conn, legacy_path)
+MIGRATIONS = (
+    (1, "базовая схема", INITIAL_SCHEMA),
+    (2, "покрывающие индексы", COVERING_INDEXES),
+    (3, "перенос users из старой базы", import_legacy_users),
+    (4, "задачи рассылки и участие бота в чатах", FANOUT_JOBS),
+    (5, "число шардов в прогрессе задач", JOB_PROGRESS_SHARDS),
+)
+LATEST = MIGRATIONS[-1][0]
+
+
+def schema_version(pool) -> int:
+    return pool.fetch_value("PRAGMA user_version", default=0)
+
+
+def migrate(pool, legacy_path: str = None) -> int:
+    """Применить недостающие миграции, вернуть итоговую версию схемы"""
+    version = schema_version(pool)
+    if version > LATEST:
+        raise RuntimeError(f"Схема БД версии {version} новее кода (до {LATEST}), обновите бота")
+    for target, name, step in MIGRATIONS:
+        if target <= version:
+            continue
+        with pool.transaction() as conn:
+            if callable(step):
+                step(conn, legacy_path)
+            else:
+                for sql in step:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {target}")
+        print(f"✅ Миграция БД {target}: {name}")
+        version = target
+    return version
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class PermissionCache:
+    """LRU/TTL кеш уровней прав по ключу (user_id, chat_id)"""
+
+    def __init__(self, maxsize: int = 50000, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # (user_id, chat_id) -> (level, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, chat_id: int):
+        """Уровень из кеша или None"""
+        key = (user_id, chat_id)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, user_id: int, chat_id: int, level: int):
+        key = (user_id, chat_id)
+        with self._lock:
+            self._data[key] = (level, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id: int, chat_id: int):
+        with self._lock:
+            self._data.pop((user_id, chat_id), None)
+
+    def dump(self) -> list:
+        """[(user_id, chat_id, уровень, истекает в unix time)] для снимка состояния"""
+        offset = time.time() - time.monotonic()
+        with self._lock:
+            return [
+                (user_id, chat_id, level, expires + offset)
+                for (user_id, chat_id), (level, expires) in self._data.items()
+            ]
+
+    def load(self, entries):
+        """Восстановить записи из dump(), пропуская истекшие"""
+        now = time.monotonic()
+        offset = time.time() - now
+        with self._lock:
+            for user_id, chat_id, level, expires in entries:
+                expires -= offset
+                if expires > now:
+                    self._data[(user_id, chat_id)] = (level, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
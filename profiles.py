@@ -0,0 +1,271 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from router import parse_user
+
+# Короткое имя: @durov или vk.com/durov
+SCREEN_NAME_RE = re.compile(r"^(?:@|(?:https?://)?(?:m\.)?vk\.com/)([a-z0-9_.]{2,32})$", re.IGNORECASE)
+
+# users.get принимает до 1000 идентификаторов за вызов
+BATCH_SIZE = 1000
+
+
+class Profile:
+    __slots__ = ("user_id", "first_name", "last_name", "screen_name", "updated")
+
+    def __init__(self, user_id: int, first_name: str, last_name: str, screen_name: str, updated: float):
+        self.user_id = user_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.screen_name = screen_name
+        self.updated = updated
+
+    @property
+    def name(self) -> str:
+        return f"{self.first_name} {self.last_name}".strip()
+
+
+class ProfileCache:
+    """Имена и короткие адреса пользователей: память -> SQLite -> users.get.
+
+    Промахи от всех обработчиков копятся linger секунд и уходят одним
+    users.get на до 1000 ID (короткие имена идут в тот же запрос).
+    Устаревшие по ttl записи отдаются сразу и обновляются в фоне.
+    """
+
+    def __init__(self, store, call, ttl: float = 86400, linger: float = 0.05,
+                 timeout: float = 3.0, maxsize: int = 100000):
+        self.store = store
+        self.call = call  # (method, params) -> Future, например Sender.call
+        self.ttl = ttl
+        self.linger = linger
+        self.timeout = timeout
+        self.maxsize = maxsize
+
+        self._profiles = OrderedDict()  # user_id -> Profile
+        self._screen_names = {}         # screen_name -> user_id
+        self._pending = OrderedDict()   # user_id или screen_name -> Future
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._loop, name="profiles", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+
+    # ========== ПАМЯТЬ ==========
+    def _remember(self, profile: Profile):
+        self._profiles[profile.user_id] = profile
+        self._profiles.move_to_end(profile.user_id)
+        if profile.screen_name:
+            self._screen_names[profile.screen_name] = profile.user_id
+        if len(self._profiles) > self.maxsize:
+            _, evicted = self._profiles.popitem(last=False)
+            if evicted.screen_name:
+                self._screen_names.pop(evicted.screen_name, None)
+
+    def _request(self, keys) -> list:
+        """Futures для ключей, которых нет в памяти; ставит их в очередь на users.get"""
+        futures = []
+        with self._cond:
+            for key in keys:
+                future = self._pending.get(key)
+                if future is None:
+                    future = self._pending[key] = Future()
+                futures.append(future)
+            if futures:
+                self._cond.notify()
+        return futures
+
+    def _wait(self, futures):
+        deadline = time.monotonic() + self.timeout
+        for future in futures:
+            try:
+                future.result(max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                return
+            except Exception:
+                continue
+
+    # ========== ПОИСК ==========
+    def get_many(self, user_ids) -> dict:
+        """user_id -> Profile для найденных; не найденные за timeout пропускаются"""
+        now = time.time()
+        found, missing, stale = {}, [], []
+        with self._cond:
+            for user_id in dict.fromkeys(user_ids):
+                profile = self._profiles.get(user_id)
+                if profile is None:
+                    missing.append(user_id)
+                    continue
+                self._profiles.move_to_end(user_id)
+                found[user_id] = profile
+                if now - profile.updated > self.ttl:
+                    stale.append(user_id)
+        self.hits += len(found)
+
+        if missing:
+            for profile in self.store.load_profiles(missing):
+                with self._cond:
+                    self._remember(profile)
+                found[profile.user_id] = profile
+                if now - profile.updated > self.ttl:
+                    stale.append(profile.user_id)
+            missing = [user_id for user_id in missing if user_id not in found]
+
+        if stale:
+            # Обновляем в фоне, отвечаем тем, что есть
+            self._request(stale)
+        if missing:
+            self.misses += len(missing)
+            self._wait(self._request(missing))
+            with self._cond:
+                for user_id in missing:
+                    profile = self._profiles.get(user_id)
+                    if profile is not None:
+                        found[user_id] = profile
+        return found
+
+    def get(self, user_id: int):
+        return self.get_many((user_id,)).get(user_id)
+
+    def mention(self, user_id: int, fallback: str = "...") -> str:
+        profile = self.get(user_id)
+        return f"[id{user_id}|{profile.name if profile else fallback}]"
+
+    def mentions(self, user_ids, fallback: str = "...") -> dict:
+        """user_id -> упоминание; все промахи одним запросом"""
+        profiles = self.get_many(user_ids)
+        return {
+            user_id: f"[id{user_id}|{profiles[user_id].name if user_id in profiles else fallback}]"
+            for user_id in user_ids
+        }
+
+    # ========== УПОМИНАНИЯ ==========
+    def resolve_many(self, tokens) -> list:
+        """ID из числа, [id|...] или @короткого_имени. ValueError на первом нераспознанном"""
+        result = []
+        unknown = {}
+        for token in tokens:
+            try:
+                result.append(parse_user(token))
+                continue
+            except ValueError:
+                pass
+            match = SCREEN_NAME_RE.match(token.strip())
+            if not match:
+                raise ValueError(token)
+            name = match.group(1).lower()
+            result.append(name)
+            unknown[name] = token
+
+        names = [name for name in unknown if name not in self._screen_names]
+        if names:
+            for name, user_id in self.store.find_screen_names(names).items():
+                self._screen_names[name] = user_id
+            names = [name for name in names if name not in self._screen_names]
+        if names:
+            self._wait(self._request(names))
+
+        resolved = []
+        for item in result:
+            if isinstance(item, int):
+                resolved.append(item)
+                continue
+            user_id = self._screen_names.get(item)
+            if user_id is None:
+                raise ValueError(unknown[item])
+            resolved.append(user_id)
+        return resolved
+
+    def resolve(self, token: str) -> int:
+        return self.resolve_many((token,))[0]
+
+    # ========== ЗАГРУЗКА ==========
+    def _take(self):
+        with self._cond:
+            while self._running and not self._pending:
+                self._cond.wait()
+            if not self._running:
+                return None
+            # Даем другим обработчикам дописать свои промахи в тот же запрос
+            deadline = time.monotonic() + self.linger
+            while self._running and len(self._pending) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = {}
+            while self._pending and len(batch) < BATCH_SIZE:
+                key, future = self._pending.popitem(last=False)
+                batch[key] = future
+            return batch
+
+    def _fetch(self, batch: dict):
+        self.api_calls += 1
+        users = self.call("users.get", {
+            "user_ids": ",".join(str(key) for key in batch),
+            "fields": "screen_name",
+        }).result(60)
+
+        now = time.time()
+        profiles = [
+            Profile(user["id"], user.get("first_name", ""), user.get("last_name", ""),
+                    (user.get("screen_name") or "").lower() or None, now)
+            for user in users or ()
+        ]
+        with self._cond:
+            for profile in profiles:
+                self._remember(profile)
+        self.store.save_profiles(profiles)
+
+        by_key = {}
+        for profile in profiles:
+            by_key[profile.user_id] = profile
+            if profile.screen_name:
+                by_key[profile.screen_name] = profile
+        for key, future in batch.items():
+            future.set_result(by_key.get(key))
+
+    def _loop(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            try:
+                self._fetch(batch)
+            except Exception as e:
+                print(f"⚠️  Ошибка загрузки профилей: {e}")
+                for future in batch.values():
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self) -> dict:
+        with self._cond:
+            size = len(self._profiles)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "api_calls": self.api_calls,
+        }
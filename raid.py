@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+RAID_START = "raid_start"
+
+
+class JoinWindow:
+    """Счетчики вступлений текущего и прошлого окна (скользящее окно по двум корзинам)"""
+
+    __slots__ = ("start", "current", "previous", "locked_since")
+
+    def __init__(self, now: float):
+        self.start = now
+        self.current = 0
+        self.previous = 0
+        self.locked_since = None
+
+    def rate(self, window: float, now: float) -> float:
+        """Оценка числа вступлений за последние window секунд"""
+        passed = int((now - self.start) // window)
+        if passed >= 2:
+            self.previous = 0
+            self.current = 0
+            self.start += passed * window
+        elif passed == 1:
+            self.previous = self.current
+            self.current = 0
+            self.start += window
+        weight = 1.0 - (now - self.start) / window
+        return self.previous * weight + self.current
+
+
+class RaidDetector:
+    """Детектор рейдов: всплеск вступлений в чат за короткое окно.
+
+    На событие - O(1) и без обращений к БД. При превышении limit вступлений
+    за window секунд чат переходит в режим защиты; выход - через release(),
+    когда поток вступлений спал вдвое и прошло хотя бы одно окно.
+    """
+
+    def __init__(self, max_chats: int = 20000):
+        self.max_chats = max_chats
+        self._chats = OrderedDict()  # chat_id -> JoinWindow
+        self._lock = threading.Lock()
+        self.raids = 0
+
+    def _window(self, chat_id: int, now: float) -> JoinWindow:
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = JoinWindow(now)
+            if len(self._chats) > self.max_chats:
+                oldest, evicted = next(iter(self._chats.items()))
+                # Чаты в режиме защиты не вытесняем
+                if evicted.locked_since is None:
+                    del self._chats[oldest]
+        else:
+            self._chats.move_to_end(chat_id)
+        return state
+
+    def observe(self, chat_id: int, limit: int, window: float, now: float = None):
+        """Учесть вступление. RAID_START - если чат только что перешел в режим защиты"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._window(chat_id, now)
+            rate = state.rate(window, now)
+            state.current += 1
+            if state.locked_since is None and rate + 1 >= limit:
+                state.locked_since = now
+                self.raids += 1
+                return RAID_START
+            return None
+
+    def is_locked(self, chat_id: int) -> bool:
+        with self._lock:
+            state = self._chats.get(chat_id)
+            return state is not None and state.locked_since is not None
+
+    def release(self, chat_id: int, limit: int, window: float, now: float = None) -> bool:
+        """Снять режим защиты, если рейд закончился. True - режим снят"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._chats.get(chat_id)
+            if state is None or state.locked_since is None:
+                return True
+            if now - state.locked_since < window or state.rate(window, now) >= limit / 2:
+                return False
+            state.locked_since = None
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tracked": len(self._chats),
+                "locked": sum(1 for state in self._chats.values() if state.locked_since is not None),
+                "raids": self.raids,
+            }
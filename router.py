@@ -0,0 +1,143 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Длительность: 30м, 2ч, 1д, 45с (без единицы - минуты)
+DURATION_RE = re.compile(r"^(\d+)\s*([смчдsmhd]?)$", re.IGNORECASE)
+DURATION_UNITS = {"с": 1, "s": 1, "м": 60, "m": 60, "": 60, "ч": 3600, "h": 3600, "д": 86400, "d": 86400}
+
+# Пользователь: 123, id123, [id123|Имя], @id123, vk.com/id123
+USER_RE = re.compile(r"^(?:\[id(\d+)\|[^\]]*\]|(?:@|(?:https?://)?vk\.com/)?(?:id)?(\d+))$", re.IGNORECASE)
+
+CUSTOM_NAME_RE = re.compile(r"^[\w-]{1,32}$")
+
+
+def parse_duration(text: str):
+    """Длительность в секундах или None"""
+    match = DURATION_RE.match(text.strip())
+    if not match:
+        return None
+    return int(match.group(1)) * DURATION_UNITS[match.group(2).lower()]
+
+
+def format_duration(seconds: int) -> str:
+    for unit, size in (("д", 86400), ("ч", 3600), ("мин", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{seconds // size} {unit}"
+    return f"{seconds} сек"
+
+
+def parse_user(token: str) -> int:
+    """ID пользователя из числа или упоминания. ValueError, если не распознан"""
+    match = USER_RE.match(token.strip())
+    if not match:
+        raise ValueError(token)
+    return int(match.group(1) or match.group(2))
+
+
+class Route:
+    __slots__ = ("name", "handler", "dev", "label")
+
+    def __init__(self, name: str, handler, dev: bool, label: str):
+        self.name = name
+        self.handler = handler
+        self.dev = dev
+        self.label = label
+
+
+class CustomCommand:
+    __slots__ = ("name", "response")
+
+    def __init__(self, name: str, response: str):
+        self.name = name
+        self.response = response
+
+
+class CommandRouter:
+    """Единый индекс команд: встроенные, алиасы и кастомные команды чатов.
+
+    Кастомные команды чата грузятся из custom_commands при первом обращении
+    и сбрасываются при изменении.
+    """
+
+    def __init__(self, store, prefix: str = "!", dev_prefix: str = "!!", max_chats: int = 5000):
+        self.store = store
+        self.prefix = prefix
+        self.dev_prefix = dev_prefix
+        self.max_chats = max_chats
+        self._first_chars = frozenset((prefix[:1], dev_prefix[:1]))
+        self._commands = {}  # имя или алиас -> Route
+        self._dev_commands = {}
+        self._custom = OrderedDict()  # chat_id -> {имя: CustomCommand}
+        self._lock = threading.Lock()
+
+    # ========== РЕГИСТРАЦИЯ ==========
+    def add(self, name: str, handler, aliases=(), dev: bool = False):
+        index = self._dev_commands if dev else self._commands
+        route = Route(name, handler, dev, (self.dev_prefix if dev else self.prefix) + name)
+        for key in (name, *aliases):
+            index[key.lower()] = route
+
+    def is_builtin(self, name: str) -> bool:
+        return name.lower() in self._commands
+
+    # ========== ПОИСК ==========
+    def route(self, chat_id: int, text: str):
+        """(Route или CustomCommand, аргументы) либо None, если это не команда"""
+        if not text or text[0] not in self._first_chars:
+            return None
+
+        if text.startswith(self.dev_prefix):
+            index = self._dev_commands
+            text = text[len(self.dev_prefix):]
+        elif text.startswith(self.prefix):
+            index = self._commands
+            text = text[len(self.prefix):]
+        else:
+            return None
+
+        parts = text.split(maxsplit=1)
+        if not parts:
+            return None
+        name = parts[0].lower()
+        args = parts[1] if len(parts) > 1 else ""
+
+        route = index.get(name)
+        if route is not None:
+            return route, args
+        if index is self._commands:
+            custom = self.custom_commands(chat_id).get(name)
+            if custom is not None:
+                return custom, args
+        return None
+
+    # ========== КАСТОМНЫЕ КОМАНДЫ ==========
+    def custom_commands(self, chat_id: int) -> dict:
+        with self._lock:
+            commands = self._custom.get(chat_id)
+            if commands is not None:
+                self._custom.move_to_end(chat_id)
+                return commands
+
+        commands = {
+            name: CustomCommand(name, response)
+            for name, response in self.store.load_custom_commands(chat_id)
+        }
+        with self._lock:
+            commands = self._custom.setdefault(chat_id, commands)
+            if len(self._custom) > self.max_chats:
+                self._custom.popitem(last=False)
+            return commands
+
+    def invalidate(self, chat_id: int):
+        with self._lock:
+            self._custom.pop(chat_id, None)
+
+    def set_custom(self, chat_id: int, name: str, response: str, created_by: int):
+        self.store.save_custom_command(chat_id, name.lower(), response, created_by)
+        self.invalidate(chat_id)
+
+    def delete_custom(self, chat_id: int, name: str) -> bool:
+        deleted = self.store.delete_custom_command(chat_id, name.lower())
+        self.invalidate(chat_id)
+        return deleted
@@ -0,0 +1,166 @@
+import heapq
+import threading
+import time
+
+MUTE = "mute"
+BAN = "ban"
+WARN = "warn"
+LOCKDOWN = "lockdown"
+
+
+class SanctionScheduler:
+    """Активные муты/баны в памяти и куча таймеров их снятия.
+
+    Проверка "замьючен ли отправитель" - поиск в словаре. Поток планировщика
+    спит до ближайшего истечения и вызывает on_expire(kind, chat_id, user_id).
+    """
+
+    def __init__(self, on_expire):
+        self.on_expire = on_expire
+        self._active = {MUTE: {}, BAN: {}}  # kind -> {(chat_id, user_id): until}
+        self._heap = []  # (when, seq, kind, chat_id, user_id)
+        self._seq = 0
+        self._warns = {}    # (chat_id, user_id) -> таймеров варнов в куче
+        self._cleared = {}  # (chat_id, user_id) -> seq сброса: таймеры до него пропускаются
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._loop, name="sanctions", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+
+    def _push(self, when: float, kind: str, chat_id: int, user_id: int):
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, kind, chat_id, user_id))
+        if kind == WARN:
+            key = (chat_id, user_id)
+            self._warns[key] = self._warns.get(key, 0) + 1
+        if self._heap[0][1] == self._seq:
+            self._cond.notify()
+
+    # ========== ПОСТАНОВКА ==========
+    def add(self, kind: str, chat_id: int, user_id: int, until: float):
+        """Мут или бан до until (unix time)"""
+        with self._cond:
+            self._active[kind][(chat_id, user_id)] = until
+            self._push(until, kind, chat_id, user_id)
+
+    def remove(self, kind: str, chat_id: int, user_id: int) -> bool:
+        """Досрочно снять. Таймер в куче останется, но будет пропущен"""
+        with self._cond:
+            return self._active[kind].pop((chat_id, user_id), None) is not None
+
+    def expire_warn_at(self, chat_id: int, user_id: int, when: float):
+        self.schedule(WARN, chat_id, user_id, when)
+
+    def clear_warns(self, chat_id: int, user_id: int):
+        """Варны сброшены (достигнут max_warns): их таймеры больше не снимают варнов"""
+        with self._cond:
+            if (chat_id, user_id) in self._warns:
+                self._cleared[(chat_id, user_id)] = self._seq
+
+    def schedule(self, kind: str, chat_id: int, user_id: int, when: float):
+        """Разовый таймер без состояния (истечение варна, проверка режима защиты)"""
+        with self._cond:
+            self._push(when, kind, chat_id, user_id)
+
+    # ========== СНИМОК ==========
+    def dump(self) -> list:
+        """[(kind, chat_id, user_id, until)]: действующие муты/баны и таймеры варнов"""
+        with self._cond:
+            entries = [
+                (kind, chat_id, user_id, until)
+                for kind, active in self._active.items()
+                for (chat_id, user_id), until in active.items()
+            ]
+            entries.extend(
+                (kind, chat_id, user_id, when)
+                for when, seq, kind, chat_id, user_id in self._heap
+                if kind == WARN and seq > self._cleared.get((chat_id, user_id), 0)
+            )
+            return entries
+
+    def load(self, entries):
+        now = time.time()
+        for kind, chat_id, user_id, until in entries:
+            if kind in self._active:
+                if until > now:
+                    self.add(kind, chat_id, user_id, until)
+            else:
+                self.schedule(kind, chat_id, user_id, until)
+
+    # ========== ПРОВЕРКИ ==========
+    def _until(self, kind: str, chat_id: int, user_id: int):
+        until = self._active[kind].get((chat_id, user_id))
+        return until if until is not None and until > time.time() else None
+
+    def is_muted(self, chat_id: int, user_id: int) -> bool:
+        return self._until(MUTE, chat_id, user_id) is not None
+
+    def is_banned(self, chat_id: int, user_id: int) -> bool:
+        return self._until(BAN, chat_id, user_id) is not None
+
+    def muted_until(self, chat_id: int, user_id: int):
+        return self._until(MUTE, chat_id, user_id)
+
+    def counts(self) -> dict:
+        with self._cond:
+            return {
+                "mutes": len(self._active[MUTE]),
+                "bans": len(self._active[BAN]),
+                "timers": len(self._heap),
+            }
+
+    # ========== ИСТЕЧЕНИЕ ==========
+    def _pop_due(self):
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                when, seq, kind, chat_id, user_id = heapq.heappop(self._heap)
+                if kind == WARN:
+                    key = (chat_id, user_id)
+                    cleared = self._cleared.get(key, 0)
+                    left = self._warns.pop(key) - 1
+                    if left:
+                        self._warns[key] = left
+                    else:
+                        self._cleared.pop(key, None)
+                    # Варн израсходован сбросом - снимать нечего
+                    if seq <= cleared:
+                        continue
+                    return kind, chat_id, user_id
+                if kind not in self._active:
+                    return kind, chat_id, user_id
+                # Пропускаем таймеры, перекрытые новым сроком или досрочным снятием
+                if self._active[kind].get((chat_id, user_id)) == when:
+                    del self._active[kind][(chat_id, user_id)]
+                    return kind, chat_id, user_id
+            return None
+
+    def _loop(self):
+        while True:
+            due = self._pop_due()
+            if due is None:
+                return
+            try:
+                self.on_expire(*due)
+            except Exception as e:
+                print(f"⚠️  Ошибка снятия ограничения {due}: {e}")
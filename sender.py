@@ -0,0 +1,260 @@
+import heapq
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from vk_api.exceptions import ApiError
+from vk_api.utils import get_random_id
+
+from metrics import VK_SECONDS, VK_ERRORS
+
+# Коды ошибок VK, после которых запрос стоит повторить позже
+RATE_LIMIT_CODES = {6, 9, 29}
+
+
+class SendError(Exception):
+    """Ошибка вызова, вернувшаяся из execute"""
+
+    def __init__(self, method: str, code: int, message: str):
+        super().__init__(f"[{code}] {message}")
+        self.method = method
+        self.code = code
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов (token bucket)"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        """Дождаться и забрать токены"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """Обнулить запас после ответа VK о превышении лимита"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = 0.0
+
+
+class _Call:
+    __slots__ = ("method", "params", "future", "attempt")
+
+    def __init__(self, method, params):
+        self.method = method
+        self.params = params
+        self.future = Future()
+        self.attempt = 0
+
+
+class Sender:
+    """Очередь исходящих вызовов VK API.
+
+    Вызовы складываются в очередь и уходят пачками до 25 штук через один
+    execute. Ошибки лимитов повторяются с экспоненциальной задержкой.
+    """
+
+    BATCH_SIZE = 25
+
+    def __init__(self, vk_session, rate: float = 20, max_retries: int = 5,
+                 linger: float = 0.02, backoff: float = 0.5, max_backoff: float = 30.0):
+        self.vk_session = vk_session
+        self.bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.linger = linger
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._delayed = []  # heap: (ready_at, seq, call)
+        self._seq = 0
+        self._running = False
+        self._thread = None
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.requests = 0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._loop, name="sender", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Дождаться отправки очереди и остановить поток"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._queue or self._delayed) and time.monotonic() < deadline:
+                self._cond.wait(0.1)
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(max(0.0, deadline - time.monotonic()))
+
+    # ========== ПОСТАНОВКА В ОЧЕРЕДЬ ==========
+    def call(self, method: str, params: dict) -> Future:
+        """Поставить произвольный вызов API в очередь"""
+        call = _Call(method, params)
+        with self._cond:
+            self._queue.append(call)
+            self._cond.notify()
+        return call.future
+
+    def send(self, chat_id: int, text: str, **params) -> Future:
+        """Поставить сообщение в очередь, не дожидаясь отправки"""
+        params.update(chat_id=chat_id, message=text)
+        # random_id выдается сразу: повтор не приведет к дублю сообщения
+        params.setdefault("random_id", get_random_id())
+        return self.call("messages.send", params)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue) + len(self._delayed)
+
+    # ========== ОТПРАВКА ==========
+    def _take_batch(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._queue.append(heapq.heappop(self._delayed)[2])
+                if self._queue:
+                    break
+                if not self._running and not self._delayed:
+                    return None
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._cond.wait(timeout)
+
+            # Небольшая пауза, чтобы собрать пачку побольше
+            if len(self._queue) < self.BATCH_SIZE and self.linger:
+                self._cond.wait(self.linger)
+
+            batch = []
+            while self._queue and len(batch) < self.BATCH_SIZE:
+                batch.append(self._queue.popleft())
+            return batch
+
+    def _retry(self, call, error):
+        if call.attempt >= self.max_retries:
+            self._fail(call, error)
+            return
+        delay = min(self.max_backoff, self.backoff * 2 ** call.attempt)
+        delay *= random.uniform(0.5, 1.0)
+        call.attempt += 1
+        self.retried += 1
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._delayed, (time.monotonic() + delay, self._seq, call))
+            self._cond.notify()
+
+    def _fail(self, call, error):
+        self.failed += 1
+        call.future.set_exception(error)
+
+    def _execute(self, batch):
+        if len(batch) == 1:
+            call = batch[0]
+            return [self.vk_session.method(call.method, call.params)], []
+
+        code = "return [" + ",".join(
+            f"API.{call.method}({json.dumps(call.params, ensure_ascii=False)})"
+            for call in batch
+        ) + "];"
+        response = self.vk_session.method("execute", {"code": code}, raw=True)
+        return response.get("response") or [], response.get("execute_errors") or []
+
+    def _flush(self, batch):
+        self.bucket.acquire()
+        self.requests += 1
+        method = batch[0].method if len(batch) == 1 else "execute"
+        started = time.perf_counter()
+        try:
+            results, errors = self._execute(batch)
+        except ApiError as e:
+            VK_SECONDS.observe(time.perf_counter() - started, method)
+            VK_ERRORS.inc(str(e.code))
+            if e.code in RATE_LIMIT_CODES:
+                self.bucket.drain()
+                for call in batch:
+                    self._retry(call, e)
+            else:
+                for call in batch:
+                    self._fail(call, e)
+            return
+        except Exception as e:
+            # Сетевые ошибки: повторяем всю пачку
+            VK_SECONDS.observe(time.perf_counter() - started, method)
+            VK_ERRORS.inc("network")
+            for call in batch:
+                self._retry(call, e)
+            return
+        VK_SECONDS.observe(time.perf_counter() - started, method)
+
+        errors = iter(errors)
+        for i, call in enumerate(batch):
+            result = results[i] if i < len(results) else False
+            if result is not False:
+                self.sent += 1
+                call.future.set_result(result)
+                continue
+            error = next(errors, None) or {}
+            error = SendError(
+                error.get("method", call.method),
+                error.get("error_code", 0),
+                error.get("error_msg", "unknown error"),
+            )
+            VK_ERRORS.inc(str(error.code))
+            if error.code in RATE_LIMIT_CODES:
+                self.bucket.drain()
+                self._retry(call, error)
+            else:
+                self._fail(call, error)
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                self._flush(batch)
+            except Exception as e:
+                print(f"❌ Ошибка отправки пачки: {e}")
+                for call in batch:
+                    if not call.future.done():
+                        self._fail(call, e)
+            with self._cond:
+                self._cond.notify_all()
+
+    def status(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "requests": self.requests,
+        }
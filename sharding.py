@@ -0,0 +1,227 @@
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+import vk_api
+
+import metrics
+from dispatcher import parse_event
+
+# Сколько ждать места в очереди шарда, прежде чем проверить, жив ли он
+PUT_TIMEOUT = 1.0
+
+
+def shard_of(chat_key: int, shards: int) -> int:
+    return chat_key % shards
+
+
+def load_checkpoint(path: str):
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path: str, ts):
+    """Атомарная запись ts: временный файл + os.replace"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(str(ts))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def shard_worker(index: int, count: int, bot_factory, inbox, acks):
+    """Процесс шарда: свои кеши и модерация только для своих чатов"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    bot = bot_factory(connect_longpoll=False, shard=(index, count))
+
+    def handle(item):
+        seq, event = item
+        try:
+            bot.handle_event(event)
+        finally:
+            acks.put(seq)
+
+    bot.dispatcher.handler = handle
+    bot.start_services()
+    print(f"✅ Шард {index + 1}/{count} запущен (pid {os.getpid()})")
+    try:
+        while True:
+            item = inbox.get()
+            if item is None:
+                break
+            seq, raw = item
+            event = parse_event(raw)
+            bot.dispatcher.submit(bot.event_key(event), (seq, event))
+    finally:
+        bot.stop_services()
+
+
+class ShardedRuntime:
+    """Один процесс читает long poll и раздает события шардам по chat_id.
+
+    ts long poll сохраняется в файл только когда все события до него
+    подтверждены шардами. После перезапуска (в том числе с другим числом
+    шардов) чтение продолжается с сохраненного ts: необработанные события
+    придут повторно, а не потеряются.
+    """
+
+    def __init__(self, bot_factory, longpoll_factory, key_of, shards: int,
+                 checkpoint_path: str, queue_size: int = 1000, metrics_port: int = 0):
+        self.bot_factory = bot_factory
+        self.longpoll_factory = longpoll_factory
+        self.key_of = key_of
+        self.shards = shards
+        self.checkpoint_path = checkpoint_path
+        self.queue_size = queue_size
+        self.metrics_port = metrics_port
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._acks = self._ctx.Queue()
+        self._inboxes = [None] * shards
+        self._workers = [None] * shards
+        self._seq = 0
+        self._inflight = {}  # seq -> (шард, сырое событие)
+        self._acked = set()
+        self._low = 1        # наименьший неподтвержденный seq
+        self._batches = []   # [(последний seq пачки, ts после пачки)]
+
+    def _start_worker(self, index: int):
+        self._inboxes[index] = self._ctx.Queue(self.queue_size)
+        worker = self._ctx.Process(
+            target=shard_worker,
+            args=(index, self.shards, self.bot_factory, self._inboxes[index], self._acks),
+            name=f"shard-{index}",
+            daemon=True,
+        )
+        worker.start()
+        self._workers[index] = worker
+
+    def _check_workers(self):
+        for index, worker in enumerate(self._workers):
+            if not worker.is_alive():
+                self._restart_worker(index)
+
+    def _restart_worker(self, index: int):
+        while True:
+            print(f"⚠️  Шард {index} упал (код {self._workers[index].exitcode}), перезапуск")
+            self._start_worker(index)
+            if self._resend(index):
+                return
+
+    def _resend(self, index: int) -> bool:
+        """Очередь упавшего шарда потеряна: отдаем новому все неподтвержденное.
+
+        False - новый процесс тоже упал, не разобрав очередь.
+        """
+        inbox = self._inboxes[index]
+        for seq in sorted(self._inflight):
+            item = self._inflight.get(seq)
+            if item is None or item[0] != index:
+                continue
+            while True:
+                try:
+                    inbox.put((seq, item[1]), timeout=PUT_TIMEOUT)
+                    break
+                except queue.Full:
+                    if not self._workers[index].is_alive():
+                        return False
+                    self._drain_acks()
+        return True
+
+    def _drain_acks(self):
+        while True:
+            try:
+                seq = self._acks.get_nowait()
+            except queue.Empty:
+                break
+            if self._inflight.pop(seq, None) is not None:
+                self._acked.add(seq)
+        while self._low in self._acked:
+            self._acked.discard(self._low)
+            self._low += 1
+
+        committed = None
+        while self._batches and self._batches[0][0] < self._low:
+            committed = self._batches.pop(0)[1]
+        if committed is not None:
+            save_checkpoint(self.checkpoint_path, committed)
+
+    def _dispatch(self, events, ts):
+        for event in events:
+            self._seq += 1
+            shard = shard_of(self.key_of(event), self.shards)
+            self._inflight[self._seq] = (shard, event.raw)
+            # Блокируется, если шард не успевает (backpressure). Очередь упавшего
+            # шарда никто не разберет, поэтому пока ждем - проверяем процессы
+            inbox = self._inboxes[shard]
+            while True:
+                try:
+                    inbox.put((self._seq, event.raw), timeout=PUT_TIMEOUT)
+                    break
+                except queue.Full:
+                    self._drain_acks()
+                    self._check_workers()
+                    if self._inboxes[shard] is not inbox:
+                        # Перезапущенный шард получил событие вместе с неподтвержденными
+                        break
+        self._batches.append((self._seq, ts))
+
+    def run(self):
+        print(f"🚀 Бот запущен в режиме шардирования: {self.shards} шардов")
+        print("Для остановки: Ctrl+C")
+        for index in range(self.shards):
+            self._start_worker(index)
+        if self.metrics_port:
+            # Процесс чтения отвечает на PORT (health check), шарды - на PORT+1..PORT+N
+            metrics.REGISTRY.gauge("orbit_shard_inflight", "Событий, не подтвержденных шардами",
+                                   callback=lambda: len(self._inflight))
+            metrics.serve(self.metrics_port)
+
+        longpoll = self.longpoll_factory()
+        stored = load_checkpoint(self.checkpoint_path)
+        if stored:
+            longpoll.ts = stored
+            print(f"✅ Продолжаем long poll с ts={stored}")
+
+        backoff = 1.0
+        try:
+            while True:
+                try:
+                    events = longpoll.check()
+                    backoff = 1.0
+                except vk_api.exceptions.ApiError as e:
+                    if e.code == 5:
+                        print("❌ НЕВЕРНЫЙ ТОКЕН! Проверьте BOT_TOKEN в Render")
+                        raise
+                    print(f"⚠️  Ошибка VK API: {e}")
+                    time.sleep(backoff)
+                    backoff = min(60.0, backoff * 2)
+                    continue
+                except Exception as e:
+                    print(f"⚠️  Ошибка long poll: {e}")
+                    time.sleep(backoff)
+                    backoff = min(60.0, backoff * 2)
+                    continue
+
+                self._dispatch(events, longpoll.ts)
+                self._drain_acks()
+                self._check_workers()
+        finally:
+            for inbox in self._inboxes:
+                inbox.put(None)
+            deadline = time.monotonic() + 15
+            for worker in self._workers:
+                worker.join(max(0.0, deadline - time.monotonic()))
+            self._drain_acks()
+            for worker in self._workers:
+                if worker.is_alive():
+                    worker.terminate()
@@ -0,0 +1,154 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from sanctions import MUTE, BAN, WARN
+
+MAGIC = b"ORBS"
+VERSION = 1
+# magic, версия, время снимка, CRC32 тела, длина тела
+HEADER = struct.Struct("<4sHdII")
+SECTION = struct.Struct("<4sI")
+# Раскладка шардов (номер, всего): снимок годится только для той же раскладки
+SHARD = struct.Struct("<ii")
+
+# Формат записей по разделам
+RECORDS = {
+    b"PERM": struct.Struct("<qqid"),     # user_id, chat_id, уровень, истекает
+    b"FLOD": struct.Struct("<qqddid"),   # chat_id, user_id, tokens, last_seen, strikes, last_strike
+    b"SANC": struct.Struct("<Bqqd"),     # вид, chat_id, user_id, до
+    b"ACTV": struct.Struct("<qiqi"),     # chat_id, день (-1 - все время), user_id, сообщений
+}
+KIND_CODES = {MUTE: 0, BAN: 1, WARN: 2}
+KINDS = {code: kind for kind, code in KIND_CODES.items()}
+
+
+def encode(created: float, ts, shard=(0, 1), perms=(), flood=(), sanctions=(), activity=()) -> bytes:
+    sanctions = [(KIND_CODES[kind], chat_id, user_id, until) for kind, chat_id, user_id, until in sanctions]
+    parts = []
+    for tag, records in ((b"PERM", perms), (b"FLOD", flood), (b"SANC", sanctions), (b"ACTV", activity)):
+        record = RECORDS[tag]
+        parts.append(SECTION.pack(tag, len(records)))
+        parts.extend(record.pack(*item) for item in records)
+    ts = str(ts).encode() if ts is not None else b""
+    parts.append(SECTION.pack(b"LPTS", len(ts)))
+    parts.append(ts)
+    parts.append(SECTION.pack(b"SHRD", 1))
+    parts.append(SHARD.pack(*shard))
+    body = b"".join(parts)
+    return HEADER.pack(MAGIC, VERSION, created, zlib.crc32(body), len(body)) + body
+
+
+def save(path: str, ts=None, shard=(0, 1), **sections):
+    """Атомарная запись снимка: временный файл + fsync + os.replace"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    data = encode(time.time(), ts, shard, **sections)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(data)
+
+
+def load(path: str):
+    """Прочитать снимок через mmap. None - файла нет или он поврежден"""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return _decode(view)
+    except FileNotFoundError:
+        return None
+    except (struct.error, ValueError, KeyError) as e:
+        print(f"⚠️  Снимок {path} поврежден: {e}")
+        return None
+
+
+def _decode(view: memoryview) -> dict:
+    magic, version, created, crc, length = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("неизвестный формат")
+    # Снимки без раскладки шардов не подходят ни одной
+    result = {"created": created, "ts": None, "shard": None}
+    with view[HEADER.size:HEADER.size + length] as body:
+        if len(body) != length or zlib.crc32(body) != crc:
+            raise ValueError("контрольная сумма не совпадает")
+        offset = 0
+        while offset < length:
+            tag, count = SECTION.unpack_from(body, offset)
+            offset += SECTION.size
+            if tag == b"LPTS":
+                result["ts"] = bytes(body[offset:offset + count]).decode() or None
+                offset += count
+                continue
+            if tag == b"SHRD":
+                result["shard"] = SHARD.unpack_from(body, offset)
+                offset += SHARD.size * count
+                continue
+            record = RECORDS[tag]
+            size = record.size * count
+            # iter_unpack читает прямо из отображенной памяти, без копии файла
+            with body[offset:offset + size] as chunk:
+                result[tag] = list(record.iter_unpack(chunk))
+            offset += size
+
+    result["sanctions"] = [
+        (KINDS[code], chat_id, user_id, until)
+        for code, chat_id, user_id, until in result.pop(b"SANC", ())
+    ]
+    result["perms"] = result.pop(b"PERM", [])
+    result["flood"] = result.pop(b"FLOD", [])
+    result["activity"] = result.pop(b"ACTV", [])
+    return result
+
+
+class Snapshotter:
+    """Фоновый поток, сохраняющий снимок раз в interval секунд.
+
+    capture() возвращает (ts, разделы) - см. save(), или None, если снимок
+    сейчас не согласован: тогда он пропускается до следующего раза.
+    """
+
+    def __init__(self, path: str, capture, interval: float = 30.0, shard=(0, 1)):
+        self.path = path
+        self.shard = shard
+        self.capture = capture
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.saved = 0
+        self.last_size = 0
+        self.last_duration = 0.0
+
+    def save_now(self):
+        started = time.perf_counter()
+        captured = self.capture()
+        if captured is None:
+            print("⚠️  Снимок пропущен: события не успели обработаться")
+            return
+        ts, sections = captured
+        self.last_size = save(self.path, ts, self.shard, **sections)
+        self.last_duration = time.perf_counter() - started
+        self.saved += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save_now()
+            except Exception as e:
+                print(f"⚠️  Ошибка сохранения снимка: {e}")
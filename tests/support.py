@@ -0,0 +1,111 @@
+"""Общее для тестов: фейковый api.vk.com и импорт main на временной БД.
+
+Запросы vk_api уходят не в сеть, а в транспорт requests, подключенный к
+сессии на https://api.vk.com/: так проверяется весь путь, включая разбор
+ответа и ошибок самим vk_api.
+"""
+import atexit
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qsl
+
+import requests
+from requests.adapters import BaseAdapter
+from vk_api.bot_longpoll import VkBotMessageEvent
+from vk_api.vk_api import VkApiGroup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CALL_RE = re.compile(r"API\.([\w.]+)\((\{.*?\})\)")
+PEER_OFFSET = 2000000000
+
+
+class FakeVkEndpoint(BaseAdapter):
+    """Фейковый api.vk.com: handler(method, params) -> JSON-ответ"""
+
+    def __init__(self, handler=None):
+        super().__init__()
+        self.handler = handler or self.default
+        self.requests = []  # (method, params)
+        self._next_id = 0
+
+    def message_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def default(self, method, params):
+        if method == "execute":
+            return {"response": [self.message_id() for _ in calls(params)]}
+        return {"response": self.message_id()}
+
+    def send(self, request, **kwargs):
+        method = request.url.rsplit("/", 1)[-1]
+        params = dict(parse_qsl(request.body))
+        self.requests.append((method, params))
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(self.handler(method, params)).encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def calls(params) -> list:
+    """Вызовы внутри execute: [(method, params)]"""
+    return [(method, json.loads(args)) for method, args in CALL_RE.findall(params["code"])]
+
+
+def session(endpoint) -> VkApiGroup:
+    vk = VkApiGroup(token="test")
+    vk.RPS_DELAY = 0
+    vk.http.mount("https://api.vk.com/", endpoint)
+    return vk
+
+
+_main = None
+
+
+def load_main():
+    """Импорт main один раз на процесс, во временном каталоге.
+
+    main при импорте открывает data/orbit.db в текущем каталоге и держит ее
+    до выхода, поэтому каталог и БД общие для всех тестов с ботом.
+    """
+    global _main
+    if _main is None:
+        workdir = tempfile.TemporaryDirectory()
+        os.chdir(workdir.name)
+        os.environ.update(BOT_TOKEN="test", GROUP_ID="1", DEV_IDS="1", PORT="0", LOG_SAMPLE="0")
+        import main
+        # Другие тесты меняют каталог: новые соединения должны открывать ту же БД
+        main.store.pool.path = os.path.abspath(main.store.pool.path)
+        atexit.register(workdir.cleanup)
+        atexit.register(main.store.close)
+        _main = main
+    return _main
+
+
+def message_event(chat_id, from_id, text, cmid=1, action=None):
+    message = {
+        "from_id": from_id,
+        "peer_id": PEER_OFFSET + chat_id,
+        "text": text,
+        "conversation_message_id": cmid,
+        "date": int(time.time()),
+    }
+    if action:
+        message["action"] = action
+    return VkBotMessageEvent({
+        "type": "message_new",
+        "group_id": 1,
+        "object": {"message": message, "client_info": {}},
+    })
@@ -0,0 +1,78 @@
+"""Антифлуд: одно нарушение на окно, остальной флуд глушится без наказания.
+
+    python -m pytest -q tests
+"""
+import unittest
+
+from support import FakeVkEndpoint, calls, load_main, message_event, session
+
+from antiflood import FLOOD_MUTE, FLOOD_SUPPRESS, FLOOD_WARN, FloodControl
+
+LIMIT = 3
+WINDOW = 5.0
+
+
+class FloodControlTest(unittest.TestCase):
+    def setUp(self):
+        self.flood = FloodControl()
+
+    def check(self, now, max_warns=3):
+        return self.flood.check(1, 2, LIMIT, WINDOW, max_warns, now)
+
+    def test_over_limit_is_suppressed_until_next_window(self):
+        self.assertEqual([self.check(0.0) for _ in range(LIMIT)], [None] * LIMIT)
+        self.assertEqual(self.check(0.1), (FLOOD_WARN, 1))
+        # В том же окне: без нового нарушения, но и не None
+        self.assertEqual(self.check(0.2), (FLOOD_SUPPRESS, 1))
+        self.assertEqual(self.check(0.5), (FLOOD_SUPPRESS, 1))
+        self.assertEqual(self.flood.stats()["violations"], 1)
+        # Окно прошло: накопленный лимит проходит, следующий всплеск - второе нарушение
+        self.assertEqual([self.check(5.2) for _ in range(LIMIT)], [None] * LIMIT)
+        self.assertEqual(self.check(5.2), (FLOOD_WARN, 2))
+
+    def test_mute_after_max_warns(self):
+        for _ in range(LIMIT):
+            self.check(0.0)
+        self.assertEqual(self.check(0.0, max_warns=1), (FLOOD_MUTE, 1))
+
+    def test_recovers_after_pause(self):
+        for _ in range(LIMIT + 2):
+            self.check(0.0)
+        self.assertIsNone(self.check(20.0))
+
+
+class FloodedCommandsTest(unittest.TestCase):
+    CHAT = 401
+
+    def setUp(self):
+        main = load_main()
+        self.endpoint = FakeVkEndpoint()
+        self.bot = main.OrbitBot(connect_longpoll=False)
+        self.bot.use_api(session(self.endpoint))
+        self.bot.sender.start()
+        self.addCleanup(self.bot.sender.stop)
+
+    def replies(self):
+        texts = []
+        for method, params in self.endpoint.requests:
+            if method == "messages.send":
+                texts.append(params["message"])
+            elif method == "execute":
+                texts += [args["message"] for name, args in calls(params) if name == "messages.send"]
+        return texts
+
+    def test_flooded_commands_do_not_run(self):
+        limit = self.bot.settings.get(self.CHAT).flood_limit
+        for cmid in range(limit + 5):
+            self.bot.handle_event(message_event(self.CHAT, 701, "!помощь", cmid))
+        self.bot.send(self.CHAT, "конец", wait=True)
+
+        replies = self.replies()[:-1]
+        warns = [text for text in replies if "Не флудите" in text]
+        self.assertEqual(len(warns), 1)
+        # Ответы на команды - только на сообщения в пределах лимита
+        self.assertEqual(len(replies) - len(warns), limit)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Антикапс: капс и растянутые буквы - разные нарушения со своим ответом.
+
+    python -m pytest -q tests
+"""
+import unittest
+
+from support import FakeVkEndpoint, calls, load_main, message_event, session
+
+from content_filter import FILTER_CAPS, FILTER_RUN, ContentFilter
+
+
+class AnticapsTest(unittest.TestCase):
+    def setUp(self):
+        self.filter = ContentFilter(antimat=False, antilinks=False, anticaps=True)
+
+    def test_lowercase_stretched_letters_are_runs(self):
+        hit = self.filter.scan("приииииииииивет всем")
+        self.assertEqual(hit.kind, FILTER_RUN)
+        self.assertEqual(self.filter.scan("ПРИИИИИИИИИИВЕТ").kind, FILTER_RUN)
+
+    def test_caps_is_caps(self):
+        self.assertEqual(self.filter.scan("ПРИВЕТ ВСЕМ В ЭТОМ ЧАТЕ").kind, FILTER_CAPS)
+
+    def test_punctuation_and_short_runs_pass(self):
+        for text in ("ахаха))))))))))))", "!!!!!!!!!!!!", "1111111111111", "приииивет"):
+            with self.subTest(text=text):
+                self.assertIsNone(self.filter.scan(text))
+
+
+class CheckContentTest(unittest.TestCase):
+    def setUp(self):
+        main = load_main()
+        self.endpoint = FakeVkEndpoint()
+        self.bot = main.OrbitBot(connect_longpoll=False)
+        self.bot.use_api(session(self.endpoint))
+        self.bot.sender.start()
+        self.addCleanup(self.bot.sender.stop)
+        self.bot.settings.update(201, anticaps=True)
+
+    def replies(self):
+        texts = []
+        for method, params in self.endpoint.requests:
+            if method == "messages.send":
+                texts.append(params["message"])
+            elif method == "execute":
+                texts += [args["message"] for name, args in calls(params) if name == "messages.send"]
+        return texts
+
+    def test_stretched_lowercase_gets_its_own_reply(self):
+        self.bot.handle_event(message_event(201, 501, "приииииииииивет"))
+        # Очередь отправки FIFO: дождавшись этого сообщения, видим и ответ фильтра
+        self.bot.send(201, "конец", wait=True)
+        replies = self.replies()
+        self.assertTrue(any("не растягивайте" in text for text in replies), replies)
+        self.assertFalse(any("капсом" in text for text in replies), replies)
+
+
+if __name__ == "__main__":
+    unittest.main()
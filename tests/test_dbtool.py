@@ -0,0 +1,64 @@
+"""dbtool: выгрузка и загрузка не трогают старую orbit.db из рабочего каталога.
+
+    python -m pytest -q tests
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dbtool  # noqa: E402
+import migrations  # noqa: E402
+from config import LEGACY_DATABASE_FILE  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+
+
+def perms(path: str) -> list:
+    with sqlite3.connect(path) as conn:
+        return sorted(conn.execute("SELECT user_id, chat_id, level FROM user_perms"))
+
+
+class DbToolTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        os.chdir(workdir.name)
+        self.addCleanup(os.chdir, self.cwd)
+
+        # Старая база в рабочем каталоге, как у бота до миграций
+        with sqlite3.connect(LEGACY_DATABASE_FILE) as legacy:
+            legacy.execute("CREATE TABLE users (user_id, chat_id, level, warns, muted_until)")
+            legacy.executemany("INSERT INTO users VALUES (?, ?, 5, 0, NULL)", [(900, 1), (901, 2)])
+
+        source = ConnectionPool("source.db")
+        migrations.migrate(source)
+        source.execute_many("INSERT INTO user_perms (user_id, chat_id, level) VALUES (?, ?, ?)",
+                            [(10, 1, 3), (11, 1, 2)])
+        source.close()
+
+    def run_tool(self, *args):
+        with mock.patch.object(sys, "argv", ["dbtool.py", *args]):
+            self.assertEqual(dbtool.main(), 0)
+
+    def test_import_into_fresh_db_contains_only_dump(self):
+        self.run_tool("--db", "source.db", "export", "dump.jsonl.gz")
+        self.run_tool("--db", "target.db", "import", "dump.jsonl.gz")
+        self.assertEqual(perms("target.db"), [(10, 1, 3), (11, 1, 2)])
+
+    def test_export_does_not_change_source(self):
+        self.run_tool("--db", "source.db", "export", "dump.jsonl")
+        self.assertEqual(perms("source.db"), [(10, 1, 3), (11, 1, 2)])
+
+    def test_migrate_imports_legacy_explicitly(self):
+        self.run_tool("--db", "target.db", "migrate")
+        self.assertEqual(perms("target.db"), [(900, 1, 5), (901, 2, 5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
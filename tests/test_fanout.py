@@ -0,0 +1,144 @@
+"""FanoutRunner: random_id рассылки и продолжение задачи после перезапуска.
+
+    python -m pytest -q tests
+"""
+import json
+import os
+import sys
+import unittest
+from concurrent.futures import Future
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fanout import BATCH_SIZE, BROADCAST, FanoutRunner, Job, new_salt, random_id  # noqa: E402
+from support import load_main  # noqa: E402
+
+
+class FakeStore:
+    """Задачи и чаты в памяти с тем же интерфейсом, что у Database"""
+
+    def __init__(self, chats, payload):
+        self.chats = sorted(chats)
+        self.job = {"id": 1, "kind": BROADCAST, "payload": json.dumps(payload),
+                    "created_by": 1, "from_chat": 1, "total": len(chats)}
+        self.progress = {}  # shard -> (last_chat, done, failed, finished)
+
+    def load_jobs(self, shard):
+        last_chat, done, failed, finished = self.progress.get(shard[0], (0, 0, 0, False))
+        if finished:
+            return []
+        return [dict(self.job, last_chat=last_chat, done=done, failed=failed)]
+
+    def active_chats(self, after=0, limit=25, shard=None):
+        chats = [chat_id for chat_id in self.chats
+                 if chat_id > after and (shard is None or chat_id % shard[1] == shard[0])]
+        return chats[:limit]
+
+    def save_job_progress(self, job_id, shard, last_chat, done, failed, finished=False):
+        self.progress[shard[0]] = (last_chat, done, failed, finished)
+
+    def finish_job(self, job_id, shards):
+        return None
+
+
+class FanoutTest(unittest.TestCase):
+    def setUp(self):
+        self.store = FakeStore(range(1, 61), {"text": "новости", "salt": new_salt()})
+        self.sent = {}  # chat_id -> [random_id, ...]
+
+    def runner(self):
+        def broadcast(job, chat_ids):
+            futures = []
+            for chat_id in chat_ids:
+                self.sent.setdefault(chat_id, []).append(random_id(job, chat_id))
+                future = Future()
+                future.set_result(1)
+                futures.append(future)
+            return futures
+
+        runner = FanoutRunner(self.store, rate=10000)
+        runner.register(BROADCAST, broadcast)
+        return runner
+
+    def test_chats_of_one_job_get_different_ids(self):
+        runner = self.runner()
+        (job,) = runner._reload()
+        while runner._step(job):
+            pass
+        ids = [chat_ids[0] for chat_ids in self.sent.values()]
+        self.assertEqual(len(ids), 60)
+        self.assertEqual(len(set(ids)), 60)
+        self.assertTrue(all(0 < rid < 2 ** 31 for rid in ids))
+
+    def test_resumed_job_keeps_ids(self):
+        runner = self.runner()
+        (job,) = runner._reload()
+        runner._step(job)
+        first = {chat_id: ids[0] for chat_id, ids in self.sent.items()}
+        self.assertEqual(len(first), BATCH_SIZE)
+
+        # Перезапуск: контрольная точка откатывается на пачку назад, чаты идут повторно
+        self.store.progress[0] = (0, 0, 0, False)
+        restarted = self.runner()
+        (resumed,) = restarted._reload()
+        self.assertIsNot(resumed, job)
+        restarted._step(resumed)
+        for chat_id, rid in first.items():
+            self.assertEqual(self.sent[chat_id], [rid, rid])
+
+    def test_salt_separates_jobs_with_same_id(self):
+        row = dict(self.store.job, last_chat=0, done=0, failed=0)
+        other = dict(row, payload=json.dumps({"text": "новости", "salt": new_salt()}))
+        self.assertNotEqual(
+            [random_id(Job(row), chat_id) for chat_id in range(1, 11)],
+            [random_id(Job(other), chat_id) for chat_id in range(1, 11)],
+        )
+
+
+class ReshardTest(unittest.TestCase):
+    """Задача, прерванная при 2 шардах и продолженная при 3, проходит все чаты"""
+
+    CHATS = range(5001, 5101)
+
+    def setUp(self):
+        self.store = load_main().store
+        for chat_id in self.CHATS:
+            self.store.touch_chat(chat_id)
+        self.job_id = self.store.create_job(BROADCAST, {"text": "новости", "salt": new_salt()}, 1, 1)
+        self.handled = []
+
+    def runner(self, shard):
+        def broadcast(job, chat_ids):
+            self.handled.extend(chat_ids)
+            futures = []
+            for _ in chat_ids:
+                future = Future()
+                future.set_result(1)
+                futures.append(future)
+            return futures
+
+        runner = FanoutRunner(self.store, shard, rate=10000)
+        runner.register(BROADCAST, broadcast)
+        return runner
+
+    def step(self, runner) -> bool:
+        jobs = [job for job in runner._reload() if job.id == self.job_id]
+        return bool(jobs) and runner._step(jobs[0])
+
+    def test_shard_count_change_skips_no_chats(self):
+        for index in range(2):
+            self.assertTrue(self.step(self.runner((index, 2))))
+
+        for index in range(3):
+            runner = self.runner((index, 3))
+            while self.step(runner):
+                pass
+
+        self.assertLessEqual(set(self.CHATS), set(self.handled))
+        state = self.store.pool.fetch_value("SELECT state FROM jobs WHERE id = ?", (self.job_id,))
+        self.assertEqual(state, "done")
+
+
+if __name__ == "__main__":
+    unittest.main()
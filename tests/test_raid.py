@@ -0,0 +1,89 @@
+"""RaidDetector на синтетических потоках вступлений и режим защиты бота.
+
+    python -m pytest -q tests
+"""
+import unittest
+
+from support import load_main, message_event
+
+from raid import RAID_START, RaidDetector
+
+LIMIT = 5
+WINDOW = 10.0
+
+
+class RaidDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.raids = RaidDetector()
+
+    def observe(self, *times, chat_id=1):
+        return [self.raids.observe(chat_id, LIMIT, WINDOW, now) for now in times]
+
+    def test_threshold(self):
+        self.assertEqual(self.observe(0, 1, 2, 3), [None] * 4)
+        self.assertFalse(self.raids.is_locked(1))
+        self.assertEqual(self.observe(4), [RAID_START])
+        self.assertTrue(self.raids.is_locked(1))
+        # Уже в режиме защиты: повторно не срабатывает
+        self.assertEqual(self.observe(5), [None])
+        self.assertEqual(self.raids.stats()["raids"], 1)
+
+    def test_chats_are_independent(self):
+        self.observe(0, 1, 2, 3, chat_id=1)
+        self.assertEqual(self.observe(4, chat_id=2), [None])
+        self.assertFalse(self.raids.is_locked(2))
+
+    def test_window_expiry(self):
+        self.observe(0, 1, 2, 3)
+        # Два окна спустя старые вступления не считаются
+        self.assertEqual(self.observe(25, 26, 27, 28), [None] * 4)
+        self.assertFalse(self.raids.is_locked(1))
+        self.assertEqual(self.observe(29), [RAID_START])
+
+    def test_bucket_boundary(self):
+        # Окно начинается с первого вступления: 4 в конце первой корзины
+        self.observe(0, 9, 9, 9)
+        # Во второй корзине прошлая учитывается с весом: 4 * 0.95 + 1 < 5
+        self.assertEqual(self.observe(10.5), [None])
+        # 4 * 0.9 + 1 + 1 >= 5: всплеск на стыке корзин не теряется
+        self.assertEqual(self.observe(11), [RAID_START])
+
+    def test_release_after_quiet_window(self):
+        self.observe(0, 1, 2, 3, 4)
+        self.assertFalse(self.raids.release(1, LIMIT, WINDOW, now=8))
+        self.assertTrue(self.raids.release(1, LIMIT, WINDOW, now=30))
+        self.assertFalse(self.raids.is_locked(1))
+
+
+class LockdownTest(unittest.TestCase):
+    CHAT = 301
+
+    def setUp(self):
+        self.main = load_main()
+        self.bot = self.main.OrbitBot(connect_longpoll=False)
+        self.bot.settings.update(self.CHAT, raid_joins=3)
+        self.main.store.set_user_level(601, self.CHAT, 3)
+        self.main.store.set_user_level(603, self.CHAT, 4)
+        self.cmid = 0
+
+    def join(self, user_id):
+        self.cmid += 1
+        action = {"type": "chat_invite_user", "member_id": user_id}
+        self.bot.handle_event(message_event(self.CHAT, user_id, "", self.cmid, action))
+
+    def test_moderators_and_devs_are_not_muted(self):
+        for user_id in (601, 1, 602):
+            self.join(user_id)
+        self.assertTrue(self.bot.raids.is_locked(self.CHAT))
+        muted = self.bot.sanctions.is_muted
+        self.assertEqual([muted(self.CHAT, user_id) for user_id in (601, 1, 602)], [False, False, True])
+
+        # Вступившие уже в режиме защиты
+        self.join(603)
+        self.join(604)
+        self.assertFalse(muted(self.CHAT, 603))
+        self.assertTrue(muted(self.CHAT, 604))
+
+
+if __name__ == "__main__":
+    unittest.main()
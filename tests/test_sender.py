@@ -0,0 +1,156 @@
+"""Sender против локального фейкового VK API (см. support.FakeVkEndpoint).
+
+    python -m pytest -q tests
+"""
+import unittest
+
+from support import FakeVkEndpoint, calls, load_main, session
+
+from sender import Sender, SendError
+
+
+class SenderTest(unittest.TestCase):
+    def make_sender(self, endpoint, **kwargs):
+        kwargs.setdefault("rate", 1000)
+        kwargs.setdefault("backoff", 0.01)
+        sender = Sender(session(endpoint), **kwargs)
+        self.addCleanup(sender.stop)
+        return sender
+
+    def test_batches_up_to_25_calls_into_execute(self):
+        endpoint = FakeVkEndpoint()
+        sender = self.make_sender(endpoint)
+        # Очередь копится до старта потока, поэтому пачки полные
+        futures = [sender.send(chat_id, f"сообщение {chat_id}") for chat_id in range(30)]
+        sender.start()
+        results = [future.result(5) for future in futures]
+
+        self.assertEqual(results, list(range(1, 31)))
+        self.assertEqual([method for method, _ in endpoint.requests], ["execute", "execute"])
+        batches = [calls(params) for _, params in endpoint.requests]
+        self.assertEqual([len(batch) for batch in batches], [25, 5])
+        self.assertEqual([params["chat_id"] for _, params in batches[0] + batches[1]], list(range(30)))
+        self.assertTrue(all(method == "messages.send" for _, params in endpoint.requests
+                            for method, _ in calls(params)))
+        self.assertEqual(sender.status()["sent"], 30)
+
+    def test_execute_errors_map_to_their_calls(self):
+        def handler(method, params):
+            return {
+                "response": [1, False, 3, False],
+                "execute_errors": [
+                    {"method": "messages.send", "error_code": 917, "error_msg": "no access to chat"},
+                    {"method": "messages.removeChatUser", "error_code": 935, "error_msg": "user not found"},
+                ],
+            }
+
+        sender = self.make_sender(FakeVkEndpoint(handler))
+        futures = [
+            sender.send(1, "a"),
+            sender.send(2, "b"),
+            sender.send(3, "c"),
+            sender.call("messages.removeChatUser", {"chat_id": 4, "user_id": 5}),
+        ]
+        sender.start()
+
+        self.assertEqual(futures[0].result(5), 1)
+        self.assertEqual(futures[2].result(5), 3)
+        with self.assertRaises(SendError) as error:
+            futures[1].result(5)
+        self.assertEqual(error.exception.code, 917)
+        with self.assertRaises(SendError) as error:
+            futures[3].result(5)
+        self.assertEqual((error.exception.code, error.exception.method), (935, "messages.removeChatUser"))
+        self.assertEqual(sender.status()["failed"], 2)
+        self.assertEqual(sender.status()["retried"], 0)
+
+    def test_rate_limit_errors_are_retried(self):
+        for code in (9, 29):
+            with self.subTest(code=code):
+                attempts = []
+
+                def handler(method, params):
+                    attempts.append(method)
+                    if len(attempts) == 1:
+                        return {"error": {"error_code": code, "error_msg": "rate limit", "request_params": []}}
+                    return {"response": 42}
+
+                endpoint = FakeVkEndpoint(handler)
+                sender = self.make_sender(endpoint)
+                sender.start()
+                self.assertEqual(sender.send(1, "повтор").result(5), 42)
+                self.assertEqual(len(attempts), 2)
+                self.assertEqual(sender.status()["retried"], 1)
+                # random_id выдан при постановке: повтор не создаст дубль
+                self.assertEqual(endpoint.requests[0][1]["random_id"], endpoint.requests[1][1]["random_id"])
+
+    def test_rate_limit_inside_execute_retries_only_that_call(self):
+        attempts = []
+
+        def handler(method, params):
+            attempts.append(len(calls(params)) if method == "execute" else 1)
+            if len(attempts) == 1:
+                return {
+                    "response": [1, False],
+                    "execute_errors": [{"method": "messages.send", "error_code": 6, "error_msg": "too many"}],
+                }
+            return {"response": 2}
+
+        sender = self.make_sender(FakeVkEndpoint(handler))
+        futures = [sender.send(1, "a"), sender.send(2, "b")]
+        sender.start()
+
+        self.assertEqual([future.result(5) for future in futures], [1, 2])
+        # Повторяется одиночный вызов, не вся пачка
+        self.assertEqual(attempts, [2, 1])
+        self.assertEqual(sender.status()["retried"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        endpoint = FakeVkEndpoint(lambda method, params: {
+            "error": {"error_code": 9, "error_msg": "flood control", "request_params": []}
+        })
+        sender = self.make_sender(endpoint, max_retries=2)
+        sender.start()
+        with self.assertRaises(Exception):
+            sender.send(1, "a").result(5)
+        self.assertEqual(len(endpoint.requests), 3)
+
+
+class BotSendTest(unittest.TestCase):
+    """OrbitBot.send(wait=True) через ту же очередь"""
+
+    @classmethod
+    def setUpClass(cls):
+        main = load_main()
+        cls.endpoint = FakeVkEndpoint()
+        cls.bot = main.OrbitBot(connect_longpoll=False)
+        cls.bot.use_api(session(cls.endpoint))
+        cls.bot.sender.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bot.sender.stop()
+
+    def test_wait_returns_message_id(self):
+        message_id = self.bot.send(7, "привет", wait=True)
+        self.assertIsInstance(message_id, int)
+        self.assertIn(("messages.send", "привет"), [
+            (method, params.get("message")) for method, params in self.endpoint.requests
+        ])
+
+    def test_wait_returns_none_on_error(self):
+        self.endpoint.handler = lambda method, params: {
+            "error": {"error_code": 917, "error_msg": "no access", "request_params": []}
+        }
+        try:
+            self.assertIsNone(self.bot.send(7, "мимо", wait=True))
+        finally:
+            self.endpoint.handler = self.endpoint.default
+
+    def test_without_wait_returns_future(self):
+        future = self.bot.send(7, "фоном")
+        self.assertIsInstance(future.result(5), int)
+
+
+if __name__ == "__main__":
+    unittest.main()
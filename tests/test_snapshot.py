@@ -0,0 +1,78 @@
+"""Снимок состояния, снятый посреди пачки long poll, и теплый старт из него.
+
+    python -m pytest -q tests
+"""
+import threading
+import time
+import unittest
+
+from support import load_main, message_event
+
+import snapshot
+
+
+class MidBatchSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.main = load_main()
+        self.bot = self.main.OrbitBot(connect_longpoll=False)
+        self.bot.dispatcher.start()
+        self.addCleanup(self.bot.dispatcher.stop)
+
+    def messages(self, chat_id):
+        return self.bot.activity.summary(chat_id, 5)["user_total"]
+
+    def wait_for(self, predicate, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            self.assertLess(time.monotonic(), deadline, "не дождались обработки")
+            time.sleep(0.01)
+
+    def test_snapshot_waits_for_batch_and_restores(self):
+        bot = self.bot
+        bot.submit_batch([message_event(101, 5, "привет", 1)], "11")
+        self.wait_for(lambda: self.messages(101) == 1)
+
+        # Чтение застревает посреди второй пачки: первое событие уже обработано
+        entered, gate = threading.Event(), threading.Event()
+        submit = bot.dispatcher.submit
+
+        def slow_submit(key, event, *args):
+            if event.object.message["text"] == "второе":
+                entered.set()
+                gate.wait(5)
+            return submit(key, event, *args)
+
+        bot.dispatcher.submit = slow_submit
+        reader = threading.Thread(target=bot.submit_batch, args=([
+            message_event(101, 5, "первое", 2),
+            message_event(102, 5, "второе", 3),
+        ], "12"))
+        reader.start()
+        self.assertTrue(entered.wait(5))
+        self.wait_for(lambda: self.messages(101) == 2)
+
+        captured = []
+        capture = threading.Thread(target=lambda: captured.append(bot.capture_state()))
+        capture.start()
+        capture.join(0.3)
+        # С ts=11 снимок содержал бы "первое" и после падения посчитал бы его дважды
+        self.assertTrue(capture.is_alive())
+
+        gate.set()
+        reader.join(5)
+        capture.join(5)
+        ts, sections = captured[0]
+        self.assertEqual(ts, "12")
+        counts = {(chat_id, user_id): count for chat_id, day, user_id, count in sections["activity"] if day < 0}
+        self.assertEqual(counts[(101, 5)], 2)
+        self.assertEqual(counts[(102, 5)], 1)
+
+        snapshot.save(bot.snapshots.path, ts, bot.snapshots.shard, **sections)
+        restored = self.main.OrbitBot(connect_longpoll=False)
+        self.assertEqual(restored.longpoll_ts, "12")
+        self.assertEqual(restored.activity.summary(101, 5)["user_total"], 2)
+        self.assertEqual(restored.activity.summary(102, 5)["user_total"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
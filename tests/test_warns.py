@@ -0,0 +1,64 @@
+"""Сброс варнов по лимиту не съедает варн, выданный параллельно.
+
+    python -m pytest -q tests
+"""
+import threading
+import unittest
+
+from support import load_main
+
+from sanctions import WARN
+
+
+class WarnResetTest(unittest.TestCase):
+    CHAT = 501
+    USER = 801
+
+    def setUp(self):
+        self.main = load_main()
+        self.store = self.main.store
+        self.bot = self.main.OrbitBot(connect_longpoll=False)
+        self.bot.settings.update(self.CHAT, max_warns=3)
+        # Загрузчик профилей не запущен: упоминания не ждут users.get
+        self.bot.profiles.timeout = 0
+
+    def warns(self):
+        return self.store.pool.fetch_value(
+            "SELECT warns FROM user_perms WHERE chat_id = ? AND user_id = ?", (self.CHAT, self.USER)
+        )
+
+    def live_timers(self):
+        return sum(1 for kind, chat_id, user_id, _ in self.bot.sanctions.dump()
+                   if kind == WARN and (chat_id, user_id) == (self.CHAT, self.USER))
+
+    def test_concurrent_warn_is_not_consumed_by_reset(self):
+        self.bot.warn_user(self.CHAT, self.USER)
+        self.bot.warn_user(self.CHAT, self.USER)
+
+        # Второй воркер выдает варн, пока первый сбрасывает достигнутый лимит
+        resetting = threading.Event()
+        reset_warns = self.store.reset_warns
+
+        def slow_reset(*args):
+            if not resetting.is_set():
+                resetting.set()
+                second.start()
+                second.join(0.3)
+            return reset_warns(*args)
+
+        self.store.reset_warns = slow_reset
+        self.addCleanup(vars(self.store).pop, "reset_warns")
+        second = threading.Thread(target=self.bot.warn_user, args=(self.CHAT, self.USER))
+        first = threading.Thread(target=self.bot.warn_user, args=(self.CHAT, self.USER))
+        first.start()
+        first.join(5)
+        second.join(5)
+
+        self.assertTrue(resetting.is_set())
+        # Третий варн израсходован сбросом, четвертый остался
+        self.assertEqual(self.warns(), 1)
+        self.assertEqual(self.live_timers(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import threading
+import time
+
+
+class WriteBuffer:
+    """Отложенная запись: копит изменения и сбрасывает их одной транзакцией.
+
+    increment() сливает счетчики с одинаковым ключом до сброса,
+    append() копит строки для пакетной вставки. Сброс происходит раз в
+    interval секунд или когда накопилось max_rows изменений.
+    """
+
+    def __init__(self, pool, interval: float = 0.5, max_rows: int = 500):
+        self.pool = pool
+        self.interval = interval
+        self.max_rows = max_rows
+
+        self._cond = threading.Condition()
+        self._counters = {}  # sql -> {key: [amount, value]}
+        self._rows = {}      # sql -> [params]
+        self._size = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="write-buffer", daemon=True)
+        self._thread.start()
+
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    def increment(self, sql: str, key: tuple, amount: int = 1, value=None):
+        """Счетчик: параметры запроса - (*key, сумма, последнее значение)"""
+        with self._cond:
+            counters = self._counters.setdefault(sql, {})
+            entry = counters.get(key)
+            if entry is None:
+                counters[key] = [amount, value]
+                self._size += 1
+            else:
+                entry[0] += amount
+                entry[1] = value
+            if self._size >= self.max_rows:
+                self._cond.notify()
+
+    def append(self, sql: str, params: tuple):
+        with self._cond:
+            self._rows.setdefault(sql, []).append(params)
+            self._size += 1
+            if self._size >= self.max_rows:
+                self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._size
+
+    def _swap(self):
+        with self._cond:
+            counters, rows = self._counters, self._rows
+            self._counters, self._rows = {}, {}
+            self._size = 0
+            return counters, rows
+
+    def _restore(self, counters, rows):
+        """Вернуть несохраненное в буфер, чтобы повторить при следующем сбросе"""
+        with self._cond:
+            for sql, entries in counters.items():
+                for key, (amount, value) in entries.items():
+                    current = self._counters.setdefault(sql, {}).get(key)
+                    if current is None:
+                        self._counters[sql][key] = [amount, value]
+                        self._size += 1
+                    else:
+                        current[0] += amount
+            for sql, params in rows.items():
+                self._rows[sql] = params + self._rows.get(sql, [])
+                self._size += len(params)
+
+    def flush(self):
+        counters, rows = self._swap()
+        if not counters and not rows:
+            return
+        try:
+            with self.pool.transaction() as conn:
+                count = 0
+                for sql, entries in counters.items():
+                    conn.executemany(sql, [
+                        (*key, amount, value) for key, (amount, value) in entries.items()
+                    ])
+                    count += len(entries)
+                for sql, params in rows.items():
+                    conn.executemany(sql, params)
+                    count += len(params)
+        except Exception as e:
+            print(f"⚠️  Ошибка сброса буфера записи: {e}")
+            self._restore(counters, rows)
+            return
+        self.flushes += 1
+        self.flushed_rows += count
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.interval
+                while self._running and self._size < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                running = self._running
+            self.flush()
+            if not running:
+                return
+
+    def close(self):
+        """Остановить поток и записать все, что осталось в буфере"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+        self.flush()